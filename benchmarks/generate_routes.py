@@ -0,0 +1,124 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+
+import yaml
+
+# The shape of the journey times that can be generated
+TIME_DISTRIBUTIONS = ("uniform", "exponential")
+
+
+def get_port_name(port):
+    """
+    :param port: The index of a port
+    :return: The name of the synthetic port
+    """
+    return "Port %05d" % port
+
+
+def generate_routes(port_count, out_degree=3, cycle_density=0.2, min_time=1, max_time=10,
+                    time_distribution="uniform", seed=0):
+    """
+    Generates a random route network. The same arguments always generate the same routes.
+    The ports are put in a random order and each port gets routes to other ports that come after it, which on its own
+    gives a network without any cycles. The cycle density is the fraction of routes that go back to a port that comes
+    earlier in the order instead, so 0 gives no round trips at all and the number of cycles grows quickly as it rises.
+    :param port_count: The number of ports
+    :param out_degree: The most routes that leave each port
+    :param cycle_density: The fraction, 0 to 1, of the routes that go back to an earlier port
+    :param min_time: The shortest journey time in days
+    :param max_time: The longest journey time in days
+    :param time_distribution: "uniform" for any time between min_time and max_time to be as likely, "exponential" for
+                              mostly short journeys with a few long ones
+    :param seed: The random seed
+    :return: list of route objects in the same form as a route file
+    :exception ValueError: raised if an argument is not valid.
+    """
+    if port_count < 2:
+        raise ValueError("At least 2 ports are needed to generate routes.", port_count)
+    if not 0 <= cycle_density <= 1:
+        raise ValueError("The cycle density must be between 0 and 1.", cycle_density)
+    if not 1 <= min_time <= max_time:
+        raise ValueError("The journey times must satisfy 1 <= min_time <= max_time.", (min_time, max_time))
+    if time_distribution not in TIME_DISTRIBUTIONS:
+        raise ValueError("Unknown time distribution %s." % time_distribution, time_distribution)
+
+    rng = random.Random(seed)
+    order = list(range(port_count))
+    rng.shuffle(order)
+
+    routes = []
+    for position, port in enumerate(order):
+        # Ports near the end of the order have fewer ports further along to go to, and the last port only has routes
+        # that go back, so the out degree is a maximum rather than exact
+        back_count = min(sum(1 for _ in range(out_degree) if rng.random() < cycle_density), position)
+        forward_count = min(out_degree - back_count, port_count - 1 - position)
+        end_positions = rng.sample(range(position), back_count) + \
+            [position + 1 + f for f in rng.sample(range(port_count - 1 - position), forward_count)]
+        for end in sorted(order[f] for f in end_positions):
+            routes.append({"start": get_port_name(port), "end": get_port_name(end),
+                           "journey_time": _get_journey_time(rng, min_time, max_time, time_distribution)})
+    return routes
+
+
+def write_routes(routes, filename):
+    """
+    Writes routes to a file in the format given by its extension: .csv, .jsonl/.ndjson or otherwise YAML.
+    :param routes: list of route objects
+    :param filename: The name of the file to write
+    """
+    _, ext = os.path.splitext(filename)
+    with open(filename, "w", newline="", encoding="UTF8") as han:
+        if ext.lower() == ".csv":
+            writer = csv.DictWriter(han, ["start", "end", "journey_time"])
+            writer.writeheader()
+            writer.writerows(routes)
+        elif ext.lower() in (".jsonl", ".ndjson"):
+            han.writelines(json.dumps(route) + "\n" for route in routes)
+        else:
+            yaml.safe_dump(routes, han, default_flow_style=False)
+
+
+def _get_journey_time(rng, min_time, max_time, time_distribution):
+    """
+    :return: A random whole number of days between min_time and max_time
+    """
+    if time_distribution == "uniform":
+        return rng.randint(min_time, max_time)
+    # The mean is a quarter of the way along the range so most journeys are short. Rare long ones are capped.
+    mean = max((max_time - min_time) / 4, 0.5)
+    return min(max_time, min_time + int(rng.expovariate(1 / mean)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a random route network file for benchmarking.")
+    parser.add_argument(dest="filename", help="The route file to write. The extension picks the format: .yml, .csv "
+                                              "or .jsonl")
+    parser.add_argument("-n", "--ports", dest="port_count", type=int, default=1000, help="The number of ports.")
+    parser.add_argument("-d", "--out-degree", dest="out_degree", type=int, default=3,
+                        help="The most routes that leave each port.")
+    parser.add_argument("-c", "--cycle-density", dest="cycle_density", type=float, default=0.2,
+                        help="The fraction, 0 to 1, of routes that go back to an earlier port and so make cycles.")
+    parser.add_argument("--min-time", dest="min_time", type=int, default=1, help="The shortest journey time.")
+    parser.add_argument("--max-time", dest="max_time", type=int, default=10, help="The longest journey time.")
+    parser.add_argument("-t", "--time-distribution", dest="time_distribution", choices=TIME_DISTRIBUTIONS,
+                        default="uniform", help="The distribution of the journey times.")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, help="The random seed.")
+    args = parser.parse_args()
+
+    try:
+        routes = generate_routes(args.port_count, args.out_degree, args.cycle_density, args.min_time, args.max_time,
+                                 args.time_distribution, args.seed)
+    except ValueError as ex:
+        print(ex.args[0], file=sys.stderr)
+        return 1
+    write_routes(routes, args.filename)
+    print("Wrote %s routes between %s ports to %s" % (len(routes), args.port_count, args.filename))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
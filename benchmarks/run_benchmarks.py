@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# This line ensures that we can refer to the codefiles folder as a source root
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
+
+from exceptions import InvalidRouteError
+from generate_routes import generate_routes, get_port_name, write_routes
+from route_criteria import RouteCriteria
+from route_manager import RouteManager
+
+# The number of ports in each network that is benchmarked by default
+DEFAULT_SIZES = (100, 1000, 10000)
+
+# Listing every route between two ports takes time that grows exponentially with the size of the network, so the
+# queries that do are only run against networks up to this size. Larger networks use MAX_STOPS to bound the search.
+ENUMERATION_MAX_PORTS = 30
+MAX_STOPS = 6
+
+# The all-pairs distance table is O(V^2) to hold so it is only computed for networks up to this size
+DISTANCE_TABLE_MAX_PORTS = 2000
+
+# The number of (start, end) port pairs that each query benchmark answers per run
+QUERY_COUNT = 20
+
+# Results are flagged as a regression when their median time is this many times the baseline
+DEFAULT_THRESHOLD = 1.2
+
+_RESULTS_VERSION = 1
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=5, out_degree=3, cycle_density=0.2, seed=0, fn_progress=None):
+    """
+    Generates a network for each size and times loading it and every RouteManager query against it.
+    Query results are not cached between runs so that every run does the full work.
+    :param sizes: Iterable of the number of ports in each network
+    :param repeat: The number of times each benchmark is run
+    :param out_degree: The most routes that leave each port
+    :param cycle_density: The fraction, 0 to 1, of routes that go back to an earlier port and so make cycles
+    :param seed: The random seed for the networks and queries
+    :param fn_progress: Optional function that is called with each result as it is measured
+    :return: The results dict, see _get_results
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for port_count in sizes:
+            routes = generate_routes(port_count, out_degree, cycle_density, seed=seed)
+            for name, fn_benchmark in _get_benchmarks(routes, port_count, tmp_path, seed):
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    fn_benchmark()
+                    times.append(time.perf_counter() - start)
+                result = {"benchmark": name, "ports": port_count, "routes": len(routes), "repeat": repeat,
+                          "min": min(times), "median": statistics.median(times), "mean": statistics.mean(times)}
+                results.append(result)
+                if fn_progress is not None:
+                    fn_progress(result)
+    return _get_results(results, {"sizes": list(sizes), "repeat": repeat, "out_degree": out_degree,
+                                  "cycle_density": cycle_density, "seed": seed})
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares the median times of two benchmark runs.
+    :param results: The results dict of the new run
+    :param baseline: The results dict of the run to compare against
+    :param threshold: The ratio of the new median time to the baseline median time that counts as a regression
+    :return: list of (benchmark, ports, baseline median, new median, ratio, is regression) tuples for the benchmarks
+             that are in both runs
+    """
+    baseline_medians = {(f["benchmark"], f["ports"]): f["median"] for f in baseline["results"]}
+    comparisons = []
+    for result in results["results"]:
+        key = result["benchmark"], result["ports"]
+        if key not in baseline_medians:
+            continue
+        ratio = result["median"] / baseline_medians[key] if baseline_medians[key] else 1.0
+        comparisons.append(key + (baseline_medians[key], result["median"], ratio, ratio > threshold))
+    return comparisons
+
+
+def _get_benchmarks(routes, port_count, tmp_path, seed):
+    """
+    :param routes: The generated routes
+    :param port_count: The number of ports in the network
+    :param tmp_path: A folder to write the route files to
+    :param seed: The random seed for the queries
+    :return: list of (name, function) tuples. Each function runs one benchmark.
+    """
+    filenames = {}
+    for ext in ("yml", "csv", "jsonl"):
+        filenames[ext] = os.path.join(tmp_path, "routes_%s.%s" % (port_count, ext))
+        write_routes(routes, filenames[ext])
+    # Write the snapshot up front so that only loading it is timed
+    RouteManager().load_routes(filenames["yml"], use_snapshot=True)
+
+    rm = RouteManager(cache_size=0)
+    rm.set_routes(routes)
+    rng = random.Random(seed)
+    pairs = [(get_port_name(rng.randrange(port_count)), get_port_name(rng.randrange(port_count)))
+             for _ in range(QUERY_COUNT)]
+    journeys = _get_random_journeys(routes, rng)
+    max_stops = None if port_count <= ENUMERATION_MAX_PORTS else MAX_STOPS
+    criteria = RouteCriteria.parse("stops>=3 and time<=30")
+
+    def load(ext, use_snapshot=False):
+        return lambda: RouteManager().load_routes(filenames[ext], use_snapshot)
+
+    def query(fn_query):
+        return lambda: [fn_query(start, end) for start, end in pairs]
+
+    def direct_route_times():
+        for journey in journeys:
+            try:
+                rm.get_direct_route_time(journey)
+            except InvalidRouteError:
+                pass
+
+    benchmarks = [
+        ("load_routes_yaml", load("yml")),
+        ("load_routes_csv", load("csv")),
+        ("load_routes_jsonl", load("jsonl")),
+        ("load_routes_snapshot", load("yml", True)),
+        ("get_direct_route_time", direct_route_times),
+        ("get_route_times", lambda: rm.get_route_times(journeys)),
+        ("get_shortest_journey", query(rm.get_shortest_journey)),
+        ("get_shortest_routes", query(rm.get_shortest_routes)),
+        ("get_shortest_route_bidirectional", query(lambda start, end: rm.get_shortest_route(start, end))),
+        ("compute_landmarks", rm.compute_landmarks),
+        ("get_shortest_route_alt", query(lambda start, end: rm.get_shortest_route(start, end, "alt"))),
+        ("get_shortest_routes_from", lambda: rm.get_shortest_routes_from(pairs[0][0], [f[1] for f in pairs])),
+        ("get_k_shortest_routes", query(lambda start, end: rm.get_k_shortest_routes(start, end, 5))),
+        ("get_pareto_routes", query(lambda start, end: rm.get_pareto_routes(start, end))),
+        ("count_routes_by_stops_revisits", query(lambda start, end: rm.count_routes_by_stops(start, end, 10, True))),
+        ("count_routes_by_time_revisits", query(lambda start, end: rm.count_routes_by_time(start, end, 30, True))),
+        ("iter_routes", query(lambda start, end: sum(1 for _ in rm.iter_routes(start, end, max_stops)))),
+        ("get_routes_with_criteria", query(lambda start, end: rm.get_routes_with_criteria(
+            start, end, criteria if max_stops is None else criteria & RouteCriteria([("stops", "<=", max_stops)])))),
+    ]
+    if port_count <= DISTANCE_TABLE_MAX_PORTS:
+        benchmarks.append(("compute_distance_table", lambda: rm.compute_distance_table("dijkstra")))
+    if max_stops is None:
+        benchmarks += [
+            ("get_all_routes", query(rm.get_all_routes)),
+            ("get_number_of_routes", query(lambda start, end: rm.get_number_of_routes(start, end, lambda x: x <= 4))),
+            ("count_routes_by_stops", query(lambda start, end: rm.count_routes_by_stops(start, end, 10))),
+        ]
+    return benchmarks
+
+
+def _get_random_journeys(routes, rng, count=QUERY_COUNT, length=5):
+    """
+    :return: list of journeys that follow the routes for up to length ports, mixed with journeys that do not
+    """
+    ends_by_start = {}
+    for route in routes:
+        ends_by_start.setdefault(route["start"], []).append(route["end"])
+    starts = sorted(ends_by_start)
+    journeys = []
+    for i in range(count):
+        journey = [rng.choice(starts)]
+        while len(journey) < length and journey[-1] in ends_by_start:
+            journey.append(rng.choice(ends_by_start[journey[-1]]))
+        if i % 4 == 0:
+            # Every fourth journey has a leg that does not exist to time the error path too
+            journey.append(journey[0])
+        journeys.append(journey)
+    return journeys
+
+
+def _get_results(results, config):
+    """
+    :return: The results dict with the settings and environment that they were measured with
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.split(os.path.abspath(__file__))[0]).decode("UTF8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"version": _RESULTS_VERSION, "commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "config": config, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks loading routes and the RouteManager queries against "
+                                                 "generated route networks.")
+    parser.add_argument("-n", "--sizes", dest="sizes", type=lambda f: [int(g) for g in f.split(",")],
+                        default=list(DEFAULT_SIZES), help="Comma separated numbers of ports to benchmark. i.e. "
+                                                          "100,1000,10000")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5,
+                        help="The number of times each benchmark is run.")
+    parser.add_argument("-d", "--out-degree", dest="out_degree", type=int, default=3,
+                        help="The most routes that leave each port.")
+    parser.add_argument("-c", "--cycle-density", dest="cycle_density", type=float, default=0.2,
+                        help="The fraction, 0 to 1, of routes that go back to an earlier port and so make cycles.")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, help="The random seed.")
+    parser.add_argument("-o", "--output", dest="output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", dest="baseline", help="A JSON results file from an earlier run to compare with. "
+                                                           "Exits with 1 if any benchmark has regressed.")
+    parser.add_argument("--threshold", dest="threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="The ratio of new to baseline median time that counts as a regression.")
+    args = parser.parse_args()
+
+    def fn_progress(result):
+        print("%-32s %6s ports  median %10.6fs  min %10.6fs" % (result["benchmark"], result["ports"],
+                                                               result["median"], result["min"]), file=sys.stderr)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.out_degree, args.cycle_density, args.seed, fn_progress)
+    if args.output:
+        with open(args.output, "w", encoding="UTF8") as han:
+            json.dump(results, han, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="UTF8") as han:
+        baseline = json.load(han)
+    comparisons = compare_results(results, baseline, args.threshold)
+    for name, port_count, old, new, ratio, is_regression in comparisons:
+        print("%-32s %6s ports  %10.6fs => %10.6fs  x%.2f%s" % (name, port_count, old, new, ratio,
+                                                                "  REGRESSION" if is_regression else ""),
+              file=sys.stderr)
+    return 1 if any(f[5] for f in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import json
+import sys
+from array import array
+
+from exceptions import InvalidRouteError, InvalidPortName
+from route_loader import get_file_signature, replace_file
+
+# Graphs with more ports than this use repeated Dijkstra, even when NumPy is available, since Floyd-Warshall is
+# O(V^3) and needs several V x V working arrays.
+FLOYD_WARSHALL_MAX_PORTS = 1500
+
+_FILE_FORMAT_VERSION = 1
+
+
+def import_numpy():
+    """
+    NumPy is optional and slow to import so it is only imported when it is needed.
+    :return: The numpy module or None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def get_distance_table_filename(routes_filename):
+    """
+    :param routes_filename: The name of a route file
+    :return: The name of the file that the distance table for the route file is saved to
+    """
+    return routes_filename + ".distances"
+
+
+class DistanceTable:
+    """
+    The shortest journey time and next port to travel to for every pair of ports.
+    The table is held as two flat V x V arrays indexed by start_id * V + end_id. Once it has been computed the shortest
+    journey time between any two ports is a single lookup and a shortest route is found by following the next hops.
+    The time from a port to itself is the shortest round trip.
+    """
+
+    def __init__(self, port_names, times, next_hops, integer_times, source=None):
+        """
+        :param port_names: list of port names indexed by port id
+        :param times: flat array of shortest journey times, infinity when there is no route
+        :param next_hops: flat array of the id of the next port on a shortest route, -1 when there is no route
+        :param integer_times: True if all journey times are whole numbers of days
+        :param source: Optional signature of the route file the table was computed from
+        """
+        self.port_names = port_names
+        self.port_ids = {name: i for i, name in enumerate(port_names)}
+        self.times = times
+        self.next_hops = next_hops
+        self.integer_times = integer_times
+        self.source = source
+
+    @classmethod
+    def from_graph(cls, graph, method="auto"):
+        """
+        Computes the distance table for a route graph.
+        :param graph: A RouteGraph object
+        :param method: "floyd-warshall" to use a NumPy vectorised Floyd-Warshall, "dijkstra" to run Dijkstra's
+                       algorithm from every port or "auto" to use Floyd-Warshall for moderate sized graphs when NumPy is
+                       available and Dijkstra otherwise.
+        :return: A DistanceTable object
+        :exception ValueError: raised if the method is not known or Floyd-Warshall is requested without NumPy.
+        """
+        numpy = import_numpy()
+        if method == "auto":
+            use_numpy = numpy is not None and graph.port_count <= FLOYD_WARSHALL_MAX_PORTS
+            method = "floyd-warshall" if use_numpy else "dijkstra"
+        if method == "floyd-warshall":
+            if numpy is None:
+                raise ValueError("The floyd-warshall method requires NumPy to be installed.")
+            times, next_hops = cls._floyd_warshall(graph, numpy)
+        elif method == "dijkstra":
+            times, next_hops = cls._repeated_dijkstra(graph)
+        else:
+            raise ValueError("Unknown distance table method %s." % method, method)
+        return cls(list(graph.port_names), times, next_hops, graph.times.typecode == "q")
+
+    @property
+    def port_count(self):
+        """The number of ports in the table"""
+        return len(self.port_names)
+
+    def get_shortest_journey(self, start_port, end_port):
+        """
+        Looks up the shortest journey time between two ports.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :return: The shortest number of days for the entire journey or None if the end port cannot be reached.
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        time = self.times[self._get_index(start_port, end_port)]
+        if time == float("inf"):
+            return None
+        return int(time) if self.integer_times else time
+
+    def get_shortest_route(self, start_port, end_port):
+        """
+        Rebuilds a shortest route between two ports from the next hops.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :return: list of port names or None if the end port cannot be reached.
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        index = self._get_index(start_port, end_port)
+        end = index % self.port_count
+        port_count = self.port_count
+        route = [index // port_count]
+        port = self.next_hops[index]
+        if port < 0:
+            return None
+        route.append(port)
+        while port != end:
+            port = self.next_hops[port * port_count + end]
+            route.append(port)
+            if len(route) > port_count + 1:
+                raise InvalidRouteError("The distance table has a loop between %s and %s." % (start_port, end_port),
+                                        {(start_port, end_port)})
+        return [self.port_names[f] for f in route]
+
+    def is_current(self, source_filename):
+        """
+        :param source_filename: The route file the table should have been computed from
+        :return: True if the table was computed from the file as it is now
+        """
+        return self.source is not None and self.source == get_file_signature(source_filename)
+
+    def save(self, filename):
+        """
+        Saves the table to a file. The file starts with a line of JSON describing the table which is followed by the
+        raw times and next hops arrays. The file is replaced atomically, see route_loader.replace_file.
+        :param filename: The name of the file to write
+        """
+        header = {
+            "version": _FILE_FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "ports": self.port_names,
+            "integer_times": self.integer_times,
+            "source": self.source,
+        }
+        with replace_file(filename) as han:
+            han.write(json.dumps(header).encode("UTF8") + b"\n")
+            self.times.tofile(han)
+            self.next_hops.tofile(han)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads a table saved with save
+        :param filename: The name of the file to read
+        :return: A DistanceTable object
+        :exception ValueError: raised if the file was written by an incompatible version or machine. A damaged file can
+                           raise any of route_loader.STALE_FILE_ERRORS.
+        """
+        with open(filename, "rb") as han:
+            header = json.loads(han.readline().decode("UTF8"))
+            if header["version"] != _FILE_FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+                raise ValueError("The distance table %s is not compatible with this version." % filename, filename)
+            size = len(header["ports"]) ** 2
+            times = array("d")
+            times.fromfile(han, size)
+            next_hops = array("i")
+            next_hops.fromfile(han, size)
+        return cls(header["ports"], times, next_hops, header["integer_times"], header["source"])
+
+    def _get_index(self, start_port, end_port):
+        """
+        :return: The position of a pair of ports in the flat arrays
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        for port_name in (start_port, end_port):
+            if port_name not in self.port_ids:
+                raise InvalidPortName(
+                    "The port name %s is not valid. NOTE: Port names are also case sensitive." % port_name, port_name)
+        return self.port_ids[start_port] * self.port_count + self.port_ids[end_port]
+
+    @staticmethod
+    def _repeated_dijkstra(graph):
+        """
+        Builds the table by running Dijkstra's algorithm from every port. This is O(V E log V) so suits large sparse
+        graphs.
+        :return: A tuple of the flat times and next hops arrays
+        """
+        port_count = graph.port_count
+        times = array("d")
+        next_hops = array("i")
+        inf = float("inf")
+        for start in range(port_count):
+            start_times, first_hops = graph.get_shortest_times_from(start)
+            times.extend(inf if f is None else f for f in start_times)
+            next_hops.extend(first_hops)
+        return times, next_hops
+
+    @staticmethod
+    def _floyd_warshall(graph, numpy):
+        """
+        Builds the table with the Floyd-Warshall algorithm where each step is vectorised with NumPy. The diagonal starts
+        at infinity rather than zero so that it ends up holding the shortest round trip.
+        :param graph: A RouteGraph object
+        :param numpy: The numpy module
+        :return: A tuple of the flat times and next hops arrays
+        """
+        port_count = graph.port_count
+        offsets = numpy.frombuffer(graph.offsets, dtype=numpy.int64)
+        starts = numpy.repeat(numpy.arange(port_count), numpy.diff(offsets))
+        targets = numpy.frombuffer(graph.targets, dtype=numpy.int32)
+        edge_times = numpy.array(graph.times, dtype=numpy.float64)
+
+        times = numpy.full((port_count, port_count), numpy.inf)
+        # Where there are several routes between the same two ports the quickest one is used
+        numpy.minimum.at(times, (starts, targets), edge_times)
+        next_hops = numpy.where(numpy.isfinite(times), numpy.arange(port_count, dtype=numpy.int32), -1).astype(
+            numpy.int32)
+        for k in range(port_count):
+            through_k = times[:, k, None] + times[None, k, :]
+            improved = through_k < times
+            times = numpy.where(improved, through_k, times)
+            next_hops = numpy.where(improved, next_hops[:, k, None], next_hops)
+        return array("d", times.ravel().tobytes()), array("i", next_hops.ravel().tobytes())
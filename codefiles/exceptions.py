@@ -6,3 +6,8 @@ class InvalidPortName(Exception):
 # Exception that signals an invalid route was specified
 class InvalidRouteError(Exception):
     pass
+
+
+# Exception that signals there is no route at all from one port to another
+class UnreachablePortError(InvalidRouteError):
+    pass
@@ -0,0 +1,102 @@
+# The number of landmarks chosen by default. More landmarks give tighter bounds but each one costs two searches to
+# compute and is checked for every port that a search reaches.
+DEFAULT_LANDMARK_COUNT = 8
+
+
+class Landmarks:
+    """
+    The shortest journey times to and from a few landmark ports, used to bound how far any port is from any other.
+    By the triangle inequality the time from a port to the end port is at least the time from a landmark to the end port
+    less the time from the landmark to the port, and at least the time from the port to a landmark less the time from
+    the end port to the landmark. The largest of these over every landmark is the bound that guides the A* search in
+    RouteGraph.get_shortest_route_astar. Computing the landmarks is two searches per landmark, far less than the all
+    pairs DistanceTable, and the bounds can never overestimate so the routes found are still the shortest.
+    """
+
+    def __init__(self, landmark_ids, from_times, to_times):
+        """
+        :param landmark_ids: list of the port ids of the landmarks
+        :param from_times: list for each landmark of the journey times from it to each port, None if a port cannot be
+                           reached
+        :param to_times: list for each landmark of the journey times to it from each port, None if it cannot be
+                         reached
+        """
+        self.landmark_ids = landmark_ids
+        self.from_times = from_times
+        self.to_times = to_times
+
+    @classmethod
+    def from_graph(cls, graph, count=DEFAULT_LANDMARK_COUNT):
+        """
+        Chooses landmarks for a route graph and computes the journey times to and from them.
+        The first landmark is the port furthest from port 0 and each one after is the port furthest from the landmarks
+        already chosen, which spreads them around the edges of the network where their bounds are tightest. Ports that
+        cannot reach or be reached from a landmark count as furthest so that every part of the network gets one.
+        :param graph: A RouteGraph object
+        :param count: The most landmarks to choose
+        :return: A Landmarks object
+        """
+        landmark_ids, from_times, to_times = [], [], []
+        if graph.port_count == 0:
+            return cls(landmark_ids, from_times, to_times)
+        distances = _get_round_trip_times(graph.get_distances_from(0), [0] * graph.port_count)
+        while len(landmark_ids) < min(count, graph.port_count):
+            landmark = max(range(graph.port_count), key=lambda f: (distances[f], -f))
+            if landmark in landmark_ids:
+                break
+            landmark_ids.append(landmark)
+            from_times.append(graph.get_distances_from(landmark))
+            to_times.append(graph.get_distances_from(landmark, reverse=True))
+            landmark_distances = _get_round_trip_times(from_times[-1], to_times[-1])
+            if len(landmark_ids) == 1:
+                distances = landmark_distances
+            else:
+                distances = [min(f, g) for f, g in zip(distances, landmark_distances)]
+        return cls(landmark_ids, from_times, to_times)
+
+    def get_bound(self, port, end):
+        """
+        :param port: The id of a port
+        :param end: The id of the end port
+        :return: A lower bound of the shortest journey time from the port to the end port, or None if the landmarks
+                 show that the end port cannot be reached from the port.
+        """
+        return self.get_bound_function(end)(port)
+
+    def get_bound_function(self, end):
+        """
+        Gets a function that bounds the journey time from any port to one end port, with the times of the end port
+        looked up once rather than for every port.
+        :param end: The id of the end port
+        :return: A function that takes a port id and returns the bound, see get_bound
+        """
+        landmark_times = [(from_times, from_times[end], to_times, to_times[end])
+                          for from_times, to_times in zip(self.from_times, self.to_times)]
+
+        def fn_bound(port):
+            bound = 0
+            for from_times, from_end, to_times, to_end in landmark_times:
+                from_port = from_times[port]
+                if from_port is not None:
+                    # If the landmark reaches the port but not the end port then neither does the port
+                    if from_end is None:
+                        return None
+                    if from_end - from_port > bound:
+                        bound = from_end - from_port
+                if to_end is not None:
+                    to_port = to_times[port]
+                    # If the end port reaches the landmark but the port does not then the port cannot reach the end
+                    if to_port is None:
+                        return None
+                    if to_port - to_end > bound:
+                        bound = to_port - to_end
+            return bound
+
+        return fn_bound
+
+
+def _get_round_trip_times(from_times, to_times):
+    """
+    :return: list of the time to go from a landmark to each port and back, infinity if either way is not possible
+    """
+    return [float("inf") if f is None or g is None else f + g for f, g in zip(from_times, to_times)]
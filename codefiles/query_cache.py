@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    A bounded least recently used cache for the results of route queries.
+    Results are stored against a key made up of the query type and its arguments. When the cache is full the least
+    recently used result is discarded. A maximum size of 0 disables the cache.
+    The cache can be shared between threads. A lock is held while the results are looked up and stored but not while a
+    result is computed, so two threads that miss on the same key at the same time both compute it.
+    """
+
+    def __init__(self, maxsize=256):
+        """
+        :param maxsize: The maximum number of results to keep
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get_or_compute(self, key, fn_compute):
+        """
+        Returns the cached result for a key, calling the compute function and caching its result if there isn't one.
+        Exceptions raised by the compute function are passed on and nothing is cached.
+        :param key: A hashable key made up of the query type and its arguments
+        :param fn_compute: A function with no arguments that computes the result
+        :return: The result of the query
+        """
+        with self._lock:
+            try:
+                result = self._results[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return result
+
+        result = fn_compute()
+        if self.maxsize > 0:
+            with self._lock:
+                self._results[key] = result
+                if len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        """
+        Discards every cached result. The hit and miss statistics are kept.
+        """
+        with self._lock:
+            self._results.clear()
+
+    def get_stats(self):
+        """
+        :return: dict of the cache statistics
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._results), "maxsize": self.maxsize}
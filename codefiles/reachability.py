@@ -0,0 +1,188 @@
+from array import array
+
+
+# The most strongly connected components that bitsets of the components each one can reach are built for. The bitsets
+# take up to C^2 / 16 bytes, about 6MB for 10000 components but 600MB for 100000.
+MAX_INDEXED_COMPONENTS = 10000
+
+
+class ReachabilityIndex:
+    """
+    Answers whether one port can reach another without searching the whole route graph.
+    The ports are grouped into strongly connected components, the sets of ports that can all reach each other, and the
+    routes between components form a condensed graph of components that has no cycles. Components are numbered so that
+    each one comes after every component that it can reach. Finding them takes O(V + E) time and O(V + E) memory.
+    When there are at most MAX_INDEXED_COMPONENTS components, every component then gets a bitset, held as a Python int,
+    of the components that it has a route to, built by a single pass over the condensed graph. The bitset of component
+    c never has more than c bits, so the bitsets take O(E * C / 64) time to build and at most C^2 / 16 bytes for C
+    components, and checking a pair of ports is a bit test. With more components the condensed graph is searched
+    instead, which takes O(C + E) time for each check or, with get_reach_test, for each search.
+    """
+
+    def __init__(self, graph, max_indexed_components=MAX_INDEXED_COMPONENTS):
+        """
+        Builds the index for a route graph.
+        :param graph: A RouteGraph object
+        :param max_indexed_components: The most components to build the bitsets for
+        """
+        offsets, targets = graph.offsets, graph.targets
+        self.component_ids, self.component_count = _get_strong_components(graph)
+        members = [[] for _ in range(self.component_count)]
+        for port, component in enumerate(self.component_ids):
+            members[component].append(port)
+
+        # A component can reach itself, and so a port can have a round trip, only if a route stays inside it
+        self.cyclic = bytearray(self.component_count)
+        # The condensed graph in CSR form: the components that each component has a route to, other than itself
+        self.component_offsets = array("q", [0])
+        self.component_targets = array("i")
+        for component in range(self.component_count):
+            next_components = set()
+            for port in members[component]:
+                for i in range(offsets[port], offsets[port + 1]):
+                    next_components.add(self.component_ids[targets[i]])
+            if component in next_components:
+                self.cyclic[component] = 1
+                next_components.discard(component)
+            self.component_targets.extend(next_components)
+            self.component_offsets.append(len(self.component_targets))
+
+        self.reachable = None
+        if self.component_count <= max_indexed_components:
+            self.reachable = [0] * self.component_count
+            for component in range(self.component_count):
+                reachable = 1 << component if self.cyclic[component] else 0
+                for next_component in self._get_next_components(component):
+                    reachable |= self.reachable[next_component] | (1 << next_component)
+                self.reachable[component] = reachable
+
+    def can_reach(self, start, end):
+        """
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: True if there is a route from the start port to the end port. If the start and end port are the same
+                 then this is whether there is a round trip.
+        """
+        start_component, end_component = self.component_ids[start], self.component_ids[end]
+        if start_component == end_component:
+            return start != end or self.cyclic[start_component] == 1
+        if self.reachable is not None:
+            return (self.reachable[start_component] >> end_component) & 1 == 1
+        # A component can only reach the components numbered before it
+        if end_component > start_component:
+            return False
+        seen = {start_component}
+        stack = [start_component]
+        while stack:
+            for next_component in self._get_next_components(stack.pop()):
+                if next_component == end_component:
+                    return True
+                if next_component > end_component and next_component not in seen:
+                    seen.add(next_component)
+                    stack.append(next_component)
+        return False
+
+    def get_reach_test(self, port, backward=False):
+        """
+        Gets a function for a search that checks many ports against one port. Without the bitsets the condensed graph is
+        searched once here rather than for every check.
+        :param port: The id of the end port, or of the start port for a backward search
+        :param backward: True to check whether the port can reach the other ports rather than whether they can reach it
+        :return: A function that takes a port id and returns True if it can reach the port, or if backward is True if
+                 the port can reach it
+        """
+        if self.reachable is not None:
+            if backward:
+                return lambda other_port: self.can_reach(port, other_port)
+            return lambda other_port: self.can_reach(other_port, port)
+
+        component_ids, port_component = self.component_ids, self.component_ids[port]
+        # 1 for the components that can reach the port, or for a backward search that the port can reach
+        reaching = bytearray(self.component_count)
+        reaching[port_component] = 1
+        if backward:
+            stack = [port_component]
+            while stack:
+                for next_component in self._get_next_components(stack.pop()):
+                    if not reaching[next_component]:
+                        reaching[next_component] = 1
+                        stack.append(next_component)
+        else:
+            # Every component that a component can reach is numbered before it, so is already done
+            for component in range(port_component + 1, self.component_count):
+                if any(reaching[f] for f in self._get_next_components(component)):
+                    reaching[component] = 1
+        cyclic = self.cyclic[port_component] == 1
+
+        def fn_reach_test(other_port):
+            if other_port == port:
+                return cyclic
+            return reaching[component_ids[other_port]] == 1
+
+        return fn_reach_test
+
+    def _get_next_components(self, component):
+        """
+        :param component: A component id
+        :return: The ids of the other components that the component has a route to
+        """
+        return self.component_targets[self.component_offsets[component]:self.component_offsets[component + 1]]
+
+
+def _get_strong_components(graph):
+    """
+    Finds the strongly connected components of a route graph with Tarjan's algorithm. A stack of (port, position of the
+    next route to follow) items is used rather than recursion so that long chains of ports do not hit the recursion
+    limit. Tarjan's algorithm only completes a component once every component it can reach is complete, so each
+    component is numbered after all of the components that it can reach.
+    :param graph: A RouteGraph object
+    :return: A tuple of (array of the component id of each port, number of components)
+    """
+    offsets, targets = graph.offsets, graph.targets
+    port_count = graph.port_count
+    component_ids = array("i", [-1]) * port_count
+    # The order that each port was first reached in and the earliest port still on the stack that it can reach
+    orders = [-1] * port_count
+    lows = [0] * port_count
+    on_stack = bytearray(port_count)
+    stack = []
+    next_order = 0
+    component_count = 0
+    for root in range(port_count):
+        if orders[root] >= 0:
+            continue
+        orders[root] = lows[root] = next_order
+        next_order += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, offsets[root])]
+        while work:
+            port, i = work[-1]
+            stop = offsets[port + 1]
+            while i < stop:
+                next_port = targets[i]
+                i += 1
+                if orders[next_port] < 0:
+                    work[-1] = port, i
+                    orders[next_port] = lows[next_port] = next_order
+                    next_order += 1
+                    stack.append(next_port)
+                    on_stack[next_port] = 1
+                    work.append((next_port, offsets[next_port]))
+                    break
+                if on_stack[next_port] and orders[next_port] < lows[port]:
+                    lows[port] = orders[next_port]
+            else:
+                # Every route from the port has been followed
+                work.pop()
+                if work and lows[port] < lows[work[-1][0]]:
+                    lows[work[-1][0]] = lows[port]
+                if lows[port] == orders[port]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component_ids[member] = component_count
+                        if member == port:
+                            break
+                    component_count += 1
+    return component_ids, component_count
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+
+# The graph used by the worker processes. It is set before the process pool is created so that on platforms that fork
+# the workers inherit it for free, otherwise it is sent to each worker once when it starts rather than with every task.
+_worker_graph = None
+
+
+def analyse_shortest_times(route_manager, origin_ports=None, processes=None):
+    """
+    Finds the shortest journey time from every origin port to every port it can reach, sharing the origins across a
+    pool of processes.
+    :param route_manager: The RouteManager object to analyse
+    :param origin_ports: Optional iterable of the origin port names. Defaults to every port.
+    :param processes: The number of processes to use. Defaults to the number of CPUs. 1 runs in this process.
+    :return: dict of origin port name to a dict of port name to shortest time. Ports that cannot be reached are left
+             out and the time from a port to itself is the shortest round trip.
+    :exception InvalidPortName: raised if an origin port name is not valid.
+    """
+    return _analyse(route_manager, origin_ports, processes, _get_shortest_times, ())
+
+
+def analyse_route_counts(route_manager, max_stops, origin_ports=None, processes=None):
+    """
+    Counts the routes, which may revisit ports, with up to a maximum number of stops from every origin port to every
+    port, sharing the origins across a pool of processes.
+    :param route_manager: The RouteManager object to analyse
+    :param max_stops: The maximum number of stops (including the start and end port) to count routes for
+    :param origin_ports: Optional iterable of the origin port names. Defaults to every port.
+    :param processes: The number of processes to use. Defaults to the number of CPUs. 1 runs in this process.
+    :return: dict of origin port name to a dict of port name to number of routes. Ports with no routes are left out.
+    :exception InvalidPortName: raised if an origin port name is not valid.
+    """
+    return _analyse(route_manager, origin_ports, processes, _get_route_counts, (max_stops,))
+
+
+def _analyse(route_manager, origin_ports, processes, fn_analyse, fn_args):
+    """
+    Runs an analysis function for every origin port, sharding the origins across a pool of processes.
+    :param route_manager: The RouteManager object to analyse
+    :param origin_ports: Optional iterable of the origin port names. Defaults to every port.
+    :param processes: The number of processes to use. Defaults to the number of CPUs.
+    :param fn_analyse: A module level function given the graph, a list of origin ids and fn_args that returns a list of
+                       (origin id, list of values indexed by port id) tuples. Values of None are left out.
+    :param fn_args: Extra arguments for the analysis function
+    :return: dict of origin port name to a dict of port name to value
+    """
+    global _worker_graph
+    graph = route_manager.graph
+    if origin_ports is None:
+        origins = list(range(graph.port_count))
+    else:
+        origins = [graph.get_port_id(f) for f in origin_ports]
+    processes = processes or os.cpu_count() or 1
+    processes = min(processes, len(origins)) or 1
+
+    if processes == 1:
+        results = fn_analyse(graph, origins, *fn_args)
+    else:
+        # Several shards per process even out the work when some origins reach much more of the graph than others
+        shard_count = processes * 4
+        shards = [origins[i::shard_count] for i in range(shard_count) if origins[i::shard_count]]
+        context = multiprocessing.get_context()
+        if context.get_start_method() == "fork":
+            initializer, initargs = None, ()
+        else:
+            initializer, initargs = _init_worker, (graph,)
+        _worker_graph = graph
+        try:
+            # multiprocessing.Pool is used rather than ProcessPoolExecutor, whose initializer needs Python 3.7
+            with context.Pool(processes, initializer, initargs) as pool:
+                shard_results = pool.starmap(_run_worker, [(fn_analyse, shard, fn_args) for shard in shards])
+            results = [result for results in shard_results for result in results]
+        finally:
+            _worker_graph = None
+
+    port_names = graph.port_names
+    return {port_names[origin]: {port_names[port]: value for port, value in enumerate(values) if value is not None}
+            for origin, values in sorted(results, key=lambda f: f[0])}
+
+
+def _init_worker(graph):
+    """
+    Sets the graph for a worker process that was not forked from the process that created the pool.
+    :param graph: The RouteGraph object
+    """
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _run_worker(fn_analyse, origins, fn_args):
+    """
+    Runs an analysis function in a worker process against the shared graph.
+    """
+    return fn_analyse(_worker_graph, origins, *fn_args)
+
+
+def _get_shortest_times(graph, origins):
+    """
+    :return: list of (origin id, list of shortest times indexed by port id) tuples
+    """
+    return [(origin, graph.get_shortest_times_from(origin)[0]) for origin in origins]
+
+
+def _get_route_counts(graph, origins, max_stops):
+    """
+    :return: list of (origin id, list of route counts indexed by port id, None where there are no routes) tuples
+    """
+    return [(origin, [count or None for count in graph.count_walks_from(origin, max_stops)]) for origin in origins]
@@ -0,0 +1,110 @@
+import json
+from itertools import islice
+
+from route_queries import run_query_safely
+
+# The number of query lines read at a time. Shortest route queries in the same chunk that share a start port are
+# answered with a single search.
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def iter_batch_results(route_manager, lines, chunk_size=DEFAULT_CHUNK_SIZE, timeout=None, max_results=None):
+    """
+    Answers a stream of JSON lines queries (see route_queries.run_query) against a route manager.
+    The lines are read a chunk at a time and a result is yielded for every line, in the same order as the lines, so
+    that any number of queries can be answered without holding them all in memory. Errors, including lines that are not
+    valid JSON, are reported in the result for that line rather than stopping the batch. Each result also holds the line
+    number of its query and the "id" field of the query if it has one.
+    :param route_manager: The RouteManager object to query
+    :param lines: An iterable of JSON query strings, for example an open file. Blank lines are skipped.
+    :param chunk_size: The number of lines to read at a time
+    :param timeout: Optional maximum number of seconds that a query for a list of routes may run for
+    :param max_results: Optional maximum number of routes that a query may return
+    :return: generator of result dicts
+    """
+    numbered_lines = ((line_number, line) for line_number, line in enumerate(lines, 1) if line.strip())
+    while True:
+        chunk = list(islice(numbered_lines, chunk_size))
+        if not chunk:
+            break
+        queries = []
+        for line_number, line in chunk:
+            try:
+                queries.append((line_number, json.loads(line), None))
+            except ValueError as ex:
+                error = {"error": "ValueError", "message": "The query is not valid JSON. %s" % ex, "details": None}
+                queries.append((line_number, None, error))
+
+        shortest_routes = _get_shared_shortest_routes(route_manager, [f[1] for f in queries if f[1] is not None])
+        for line_number, query, result in queries:
+            if result is None:
+                result = _get_shared_result(query, shortest_routes)
+            if result is None:
+                result = run_query_safely(route_manager, query, timeout, max_results)
+            yield _get_batch_result(line_number, query, result)
+
+
+def _get_shared_shortest_routes(route_manager, queries):
+    """
+    Answers the shortest route queries in a chunk with one search for each start port that has more than one query.
+    :param route_manager: The RouteManager object to query
+    :param queries: list of query dicts
+    :return: dict of (start port, target port) to the (shortest time, list of routes) for that query. Queries that are
+             not answered here, including those with invalid port names, are answered individually.
+    """
+    targets_by_start = {}
+    for query in queries:
+        if _is_shareable(query):
+            start_port, target_port = query.get("start_port"), query.get("target_port")
+            if isinstance(start_port, str) and isinstance(target_port, str) and \
+                    start_port in route_manager.all_port_names and target_port in route_manager.all_port_names:
+                targets_by_start.setdefault(start_port, set()).add(target_port)
+
+    shortest_routes = {}
+    for start_port, target_ports in targets_by_start.items():
+        # A single query is quicker on its own since the search can stop as soon as the target port is reached
+        if len(target_ports) < 2:
+            continue
+        results = route_manager.get_shortest_routes_from(start_port, target_ports)
+        shortest_routes.update(((start_port, target_port), result) for target_port, result in results.items())
+    return shortest_routes
+
+
+def _get_shared_result(query, shortest_routes):
+    """
+    :param query: A query dict
+    :param shortest_routes: The shared shortest routes from _get_shared_shortest_routes
+    :return: The result dict for the query if it was answered by a shared search, otherwise None
+    """
+    if not _is_shareable(query):
+        return None
+    key = query.get("start_port"), query.get("target_port")
+    result = shortest_routes.get(key) if all(isinstance(f, str) for f in key) else None
+    if result is None:
+        return None
+    return {"shortest_time": result[0], "routes": result[1]}
+
+
+def _is_shareable(query):
+    """
+    :param query: A query dict
+    :return: True if the query is a shortest route query that the shared search answers the same way as run_query. It
+             finds every tied route with Dijkstra's algorithm, so queries for another method, which return one route,
+             are answered individually.
+    """
+    return isinstance(query, dict) and query.get("type") == "shortest-route" and \
+        query.get("method", "dijkstra") == "dijkstra"
+
+
+def _get_batch_result(line_number, query, result):
+    """
+    :param line_number: The line number of the query
+    :param query: The query dict, or None if the line was not valid JSON
+    :param result: The result dict of the query
+    :return: The result dict with the line number and query id added
+    """
+    batch_result = {"line": line_number}
+    if isinstance(query, dict) and "id" in query:
+        batch_result["id"] = query["id"]
+    batch_result.update(result)
+    return batch_result
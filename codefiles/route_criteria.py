@@ -0,0 +1,139 @@
+import operator
+import re
+
+from distance_table import import_numpy
+
+# The comparisons that a criteria can use. The operator functions also work element-wise on NumPy arrays.
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<=": operator.le, ">=": operator.ge, "<": operator.lt,
+             ">": operator.gt}
+
+# The route values that a criteria can compare
+METRICS = ("stops", "time")
+
+# Materialised result sets with fewer routes than this are filtered in Python since it is quicker than building arrays
+NUMPY_MIN_ROUTES = 256
+
+_COMPARISON_PATTERN = r"\s*(==|!=|<=|>=|<|>)\s*(\d+)\s*"
+_TERM_PATTERN = r"\s*(stops|time)" + _COMPARISON_PATTERN
+
+
+class RouteCriteria:
+    """
+    A set of comparisons of the number of stops (ports in a route including the start and end port) and the journey
+    time of a route that a route must pass all of. The criteria are parsed into (metric, operator, value) comparisons
+    rather than evaluated as code so they are safe to take from a client of the query server, and the upper bounds they
+    set can be used to prune the route search.
+    """
+
+    def __init__(self, comparisons=()):
+        """
+        :param comparisons: Iterable of (metric, operator, value) tuples where metric is "stops" or "time", operator is
+                            a key of OPERATORS and value is a whole number.
+        :exception ValueError: raised if a comparison is not valid.
+        """
+        self.comparisons = []
+        for metric, op, value in comparisons:
+            if metric not in METRICS or op not in OPERATORS or not isinstance(value, int):
+                raise ValueError("The criteria comparison %s %s %s is not valid." % (metric, op, value),
+                                 (metric, op, value))
+            self.comparisons.append((metric, op, value))
+
+    @classmethod
+    def from_string(cls, metric, criteria):
+        """
+        Creates a criteria for a single metric from an operator-value string.
+        Example "<=5",  "!=3", ">4" or "==7" etc
+        :param metric: The metric to compare, "stops" or "time"
+        :param criteria: A criteria string in the form of (==|!=|<=|>=|<|>)[\\d]+
+        :return: A RouteCriteria object
+        :exception ValueError: raised if the criteria string is not valid.
+        """
+        m = re.fullmatch(_COMPARISON_PATTERN, criteria) if isinstance(criteria, str) else None
+        if not m:
+            raise ValueError("The search criteria is limited to the form (==|!=|<=|>=|<|>)[\\d]+", criteria)
+        return cls([(metric, m.group(1), int(m.group(2)))])
+
+    @classmethod
+    def parse(cls, criteria):
+        """
+        Creates a criteria from a string of comparisons joined by "and" or ",".
+        Example "stops<=4 and time<20" or "stops>=3,stops<=5"
+        :param criteria: A criteria string, the same form that str() gives
+        :return: A RouteCriteria object
+        :exception ValueError: raised if the criteria string is not valid.
+        """
+        terms = re.split(r",|\band\b", criteria) if isinstance(criteria, str) else [None]
+        comparisons = []
+        for term in terms:
+            m = re.fullmatch(_TERM_PATTERN, term) if term is not None else None
+            if not m:
+                raise ValueError("The search criteria is limited to comparisons in the form "
+                                 "(stops|time)(==|!=|<=|>=|<|>)[\\d]+ joined by 'and'", criteria)
+            comparisons.append((m.group(1), m.group(2), int(m.group(3))))
+        return cls(comparisons)
+
+    def __and__(self, other):
+        """
+        :param other: Another RouteCriteria object
+        :return: A RouteCriteria object that a route must pass both criteria to pass
+        """
+        return RouteCriteria(self.comparisons + other.comparisons)
+
+    def __str__(self):
+        return " and ".join("%s%s%s" % comparison for comparison in self.comparisons)
+
+    def __repr__(self):
+        return "RouteCriteria(%r)" % self.comparisons
+
+    def __eq__(self, other):
+        return isinstance(other, RouteCriteria) and self.comparisons == other.comparisons
+
+    def __hash__(self):
+        return hash(tuple(self.comparisons))
+
+    def matches(self, stops, journey_time):
+        """
+        :param stops: The number of ports in a route
+        :param journey_time: The total journey time of a route
+        :return: True if the route passes every comparison
+        """
+        for metric, op, value in self.comparisons:
+            if not OPERATORS[op](stops if metric == "stops" else journey_time, value):
+                return False
+        return True
+
+    def get_bounds(self):
+        """
+        Works out the largest number of stops and journey time that a route can have and still pass, so that the route
+        search can stop following a route as soon as it goes over them.
+        :return: (max stops, max time) tuple. Either is None if the criteria does not limit it.
+        """
+        bounds = {}
+        for metric, op, value in self.comparisons:
+            if op in ("==", "<="):
+                bound = value
+            elif op == "<":
+                bound = value - 1 if metric == "stops" else value
+            else:
+                continue
+            bounds[metric] = min(bounds.get(metric, bound), bound)
+        return bounds.get("stops"), bounds.get("time")
+
+    def filter_routes(self, routes):
+        """
+        Filters a materialised list of routes. The number of stops and journey time of every route is gathered in one
+        pass and, when NumPy is installed and there are enough routes, every comparison is evaluated over whole arrays
+        at once rather than once per route.
+        :param routes: list of (route, journey time) tuples
+        :return: list of the (route, journey time) tuples that pass the criteria, in the same order
+        """
+        numpy = import_numpy() if len(routes) >= NUMPY_MIN_ROUTES else None
+        if numpy is None:
+            return [(route, journey_time) for route, journey_time in routes if self.matches(len(route), journey_time)]
+
+        values = {"stops": numpy.fromiter((len(route) for route, _ in routes), dtype=numpy.int64, count=len(routes)),
+                  "time": numpy.array([journey_time for _, journey_time in routes])}
+        mask = numpy.ones(len(routes), dtype=bool)
+        for metric, op, value in self.comparisons:
+            mask &= OPERATORS[op](values[metric], value)
+        return [routes[i] for i in numpy.flatnonzero(mask)]
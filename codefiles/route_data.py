@@ -0,0 +1,160 @@
+import copy
+
+
+class RouteData:
+    """
+    One version of the route data: the routes, the indexes built from them and the route graph, along with the distance
+    table and landmarks once they have been computed for the graph.
+    A RouteData object is never changed once it has been given to a RouteManager. Changing the routes builds a new
+    object which the RouteManager swaps in with a single assignment, so a query that takes the current object at its
+    start sees one consistent version of the routes from start to finish, however many other threads are querying or
+    reloading the routes at the same time, without taking any locks.
+    """
+
+    def __init__(self, routes_list, graph, generation=0, distance_table=None, landmarks=None):
+        """
+        Builds the indexes for a list of routes.
+        :param routes_list: list of route objects, which must not be changed afterwards
+        :param graph: The RouteGraph object for the routes, which must not be changed afterwards
+        :param generation: The number of times the routes have been changed. Query results are cached against it so a
+                           result for an earlier version of the routes is never returned for a later one.
+        :param distance_table: Optional DistanceTable object for the graph
+        :param landmarks: Optional Landmarks object for the graph
+        """
+        self.routes = routes_list
+        self.graph = graph
+        self.generation = generation
+        self.distance_table = distance_table
+        self.landmarks = landmarks
+        self.mapped_routes = self._get_mapped_routes()
+        self.all_port_names = self._get_all_port_names()
+        self.route_times = self._get_route_times()
+
+    def with_distance_table(self, distance_table):
+        """
+        :param distance_table: A DistanceTable object for the graph, or None
+        :return: A new RouteData object for the same routes with the distance table set
+        """
+        route_data = copy.copy(self)
+        route_data.distance_table = distance_table
+        return route_data
+
+    def with_landmarks(self, landmarks):
+        """
+        :param landmarks: A Landmarks object for the graph
+        :return: A new RouteData object for the same routes with the landmarks set
+        """
+        route_data = copy.copy(self)
+        route_data.landmarks = landmarks
+        return route_data
+
+    def with_route(self, route, graph):
+        """
+        Adds a route without rebuilding the indexes. Only the index entries for the ports of the route are changed and
+        the rest are shared with this object.
+        :param route: The route object to add
+        :param graph: The RouteGraph object for the routes with the route added
+        :return: A new RouteData object for the next version of the routes
+        """
+        route_data = self._copy_for_change(graph)
+        start_port, end_port, journey_time = route["start"], route["end"], route["journey_time"]
+        route_data.routes = self.routes + [route]
+        route_data.mapped_routes = dict(self.mapped_routes)
+        route_data.mapped_routes[start_port] = self.mapped_routes.get(start_port, []) + [route]
+        if start_port not in self.all_port_names or end_port not in self.all_port_names:
+            route_data.all_port_names = self.all_port_names | {start_port, end_port}
+        key = (start_port, end_port)
+        if key not in self.route_times or journey_time < self.route_times[key]:
+            route_data.route_times = dict(self.route_times)
+            route_data.route_times[key] = journey_time
+        return route_data
+
+    def without_route(self, start_port, end_port, graph):
+        """
+        Removes every route between two ports without rebuilding the indexes. As in the graph, the port names remain
+        valid even if no routes to or from them are left.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param graph: The RouteGraph object for the routes with the routes removed
+        :return: A new RouteData object for the next version of the routes
+        """
+        route_data = self._copy_for_change(graph)
+        removed = {id(route) for route in self.mapped_routes.get(start_port, []) if route["end"] == end_port}
+        route_data.routes = [route for route in self.routes if id(route) not in removed]
+        route_data.mapped_routes = dict(self.mapped_routes)
+        routes_from_start = [route for route in self.mapped_routes.get(start_port, []) if id(route) not in removed]
+        if routes_from_start:
+            route_data.mapped_routes[start_port] = routes_from_start
+        else:
+            route_data.mapped_routes.pop(start_port, None)
+        route_data.route_times = dict(self.route_times)
+        route_data.route_times.pop((start_port, end_port), None)
+        return route_data
+
+    def with_journey_time(self, start_port, end_port, journey_time, graph):
+        """
+        Changes the journey time of every route between two ports without rebuilding the indexes.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param journey_time: The new journey time in days
+        :param graph: The RouteGraph object for the routes with the journey time changed
+        :return: A new RouteData object for the next version of the routes
+        """
+        route_data = self._copy_for_change(graph)
+        changed = {id(route): dict(route, journey_time=journey_time)
+                   for route in self.mapped_routes.get(start_port, []) if route["end"] == end_port}
+        route_data.routes = [changed.get(id(route), route) for route in self.routes]
+        route_data.mapped_routes = dict(self.mapped_routes)
+        if start_port in self.mapped_routes:
+            route_data.mapped_routes[start_port] = [changed.get(id(route), route)
+                                                    for route in self.mapped_routes[start_port]]
+        route_data.route_times = dict(self.route_times)
+        if (start_port, end_port) in self.route_times:
+            route_data.route_times[(start_port, end_port)] = journey_time
+        return route_data
+
+    def _copy_for_change(self, graph):
+        """
+        :param graph: The RouteGraph object for the changed routes
+        :return: A shallow copy of this object for the next version of the routes, without the distance table and
+                 landmarks of the old graph
+        """
+        route_data = copy.copy(self)
+        route_data.graph = graph
+        route_data.generation = self.generation + 1
+        route_data.distance_table = None
+        route_data.landmarks = None
+        return route_data
+
+    def _get_mapped_routes(self):
+        """
+        Creates a dictionary where the keys are all of the ports you can start from and the values are a list of
+        destinations and times to the next port.
+        :return: dict
+        """
+        mapped_routes = {}
+        for route in self.routes:
+            mapped_routes.setdefault(route["start"], []).append(route)
+        return mapped_routes
+
+    def _get_all_port_names(self):
+        """
+        Gets a complete set of all start and end port names
+        :return: frozenset
+        """
+        all_port_names = {route["start"] for route in self.routes}
+        all_port_names.update(route["end"] for route in self.routes)
+        return frozenset(all_port_names)
+
+    def _get_route_times(self):
+        """
+        Creates a dictionary where the keys are (start, end) port name tuples and the values are the journey time
+        between them. If a route is specified more than once the quickest journey time is used.
+        :return: dict
+        """
+        route_times = {}
+        for route in self.routes:
+            key = (route["start"], route["end"])
+            if key not in route_times or route["journey_time"] < route_times[key]:
+                route_times[key] = route["journey_time"]
+        return route_times
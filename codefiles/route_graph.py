@@ -0,0 +1,1110 @@
+import heapq
+from array import array
+from bisect import bisect_left
+
+from exceptions import InvalidPortName
+from reachability import ReachabilityIndex
+from route_stats import get_timer
+
+
+def parse_departures(departures):
+    """
+    Converts the departures of a route into a sorted timetable.
+    :param departures: None if the route can be sailed at any time, a list of departure days or a dict in the form of
+                       {"first": <day>, "every": <days>, "last": <day>} for a regular sailing.
+    :return: A sorted array of departure days, or None if the route can be sailed at any time
+    :exception ValueError: raised if the departures are not valid.
+    """
+    if departures is None:
+        return None
+    if isinstance(departures, dict):
+        try:
+            first, every, last = departures["first"], departures["every"], departures["last"]
+        except KeyError as ex:
+            raise ValueError("A regular sailing needs a first, every and last day. %s is missing." % ex.args[0],
+                             departures)
+        if not all(_is_number(f) for f in (first, every, last)) or every <= 0:
+            raise ValueError("A regular sailing needs a number of days between sailings that is more than 0.",
+                             departures)
+        departures = [first + every * i for i in range(int((last - first) // every) + 1)]
+    if not isinstance(departures, (list, tuple)) or not all(_is_number(f) for f in departures):
+        raise ValueError("The departures must be a list of days or a regular sailing.", departures)
+    return array("q" if all(isinstance(f, int) for f in departures) else "d", sorted(departures))
+
+
+def _is_number(value):
+    """
+    :return: True if the value is an int or float but not a bool
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class RouteGraph:
+    """
+    A compact representation of the route map.
+    Every port name is given an integer id and the routes leaving each port are held in compressed sparse row (CSR)
+    form. The routes leaving the port with id i are at positions offsets[i] to offsets[i + 1] - 1 of the targets and
+    times arrays, in the same order as they were given. All of the route searches work on the integer ids so port
+    names are only compared when a query is started and when its results are returned.
+    Routes that only sail on certain days have a sorted array of departure days at the same position of the departures
+    list, which is None for routes that can be sailed at any time. The departures list itself is None if no route has a
+    timetable, so that routes without timetables cost nothing extra.
+    """
+
+    def __init__(self, routes):
+        """
+        Builds the graph from a list of routes.
+        :param routes: list of route objects in the form of:
+        {"start": "<name>", "end":"<name>", "journey_time": <time in days>}
+        Each route may also have "departures", see parse_departures.
+        :exception ValueError: raised if the departures of a route are not valid.
+        """
+        self.port_names = []
+        self.port_ids = {}
+        # Optional RouteStats object that the searches add their counters to
+        self.stats = None
+        # The routes arriving at each port in CSR form, built the first time a search needs them
+        self._reverse_arrays = None
+        # The index of which ports can reach each other, built the first time a search needs it
+        self._reachability = None
+        starts = array("i")
+        ends = array("i")
+        journey_times = []
+        departures = []
+        for route in routes:
+            starts.append(self._add_port_name(route["start"]))
+            ends.append(self._add_port_name(route["end"]))
+            journey_times.append(route["journey_time"])
+            departures.append(parse_departures(route.get("departures")))
+
+        port_count = len(self.port_names)
+        # A counting sort by start port keeps the routes from each port in their original order
+        self.offsets = array("q", [0]) * (port_count + 1)
+        for start in starts:
+            self.offsets[start + 1] += 1
+        for i in range(port_count):
+            self.offsets[i + 1] += self.offsets[i]
+
+        # Whole numbers of days are stored as integers so that totals are not turned into floats
+        typecode = "q" if all(isinstance(f, int) for f in journey_times) else "d"
+        self.targets = array("i", [0]) * len(starts)
+        self.times = array(typecode, [0]) * len(starts)
+        self.departures = [None] * len(starts) if any(f is not None for f in departures) else None
+        positions = self.offsets[:-1]
+        for start, end, journey_time, timetable in zip(starts, ends, journey_times, departures):
+            position = positions[start]
+            self.targets[position] = end
+            self.times[position] = journey_time
+            if self.departures is not None:
+                self.departures[position] = timetable
+            positions[start] = position + 1
+
+    @classmethod
+    def from_arrays(cls, port_names, offsets, targets, times, departures=None):
+        """
+        Creates a graph directly from its arrays, for example ones loaded from a snapshot.
+        :param port_names: list of port names indexed by port id
+        :param offsets: array of the position of the first route from each port, plus the total number of routes
+        :param targets: array of the port id at the end of each route
+        :param times: array of the journey time of each route
+        :param departures: Optional list of the sorted departure days array of each route, or None for a route that can
+                           be sailed at any time
+        :return: A RouteGraph object
+        """
+        graph = cls([])
+        graph.port_names = list(port_names)
+        graph.port_ids = {name: i for i, name in enumerate(graph.port_names)}
+        graph.offsets, graph.targets, graph.times = offsets, targets, times
+        graph.departures = departures
+        return graph
+
+    def copy(self):
+        """
+        :return: A copy of the graph that can be changed without changing this one. The reachability index is never
+                 changed once built so it is shared until routes are added to or removed from the copy.
+        """
+        graph = RouteGraph.from_arrays(self.port_names, array(self.offsets.typecode, self.offsets),
+                                       array(self.targets.typecode, self.targets),
+                                       array(self.times.typecode, self.times),
+                                       None if self.departures is None else list(self.departures))
+        graph.stats = self.stats
+        graph._reachability = self._reachability
+        return graph
+
+    @property
+    def port_count(self):
+        """The number of ports in the graph"""
+        return len(self.port_names)
+
+    def get_port_id(self, port_name):
+        """
+        Converts a port name into its integer id.
+        :param port_name: The port name to convert
+        :return: The integer id of the port
+        :exception InvalidPortName: raised if the port name is not valid.
+        """
+        try:
+            return self.port_ids[port_name]
+        except KeyError:
+            raise InvalidPortName(
+                "The port name %s is not valid. NOTE: Port names are also case sensitive." % port_name, port_name)
+
+    def get_port_route(self, route):
+        """
+        Converts a route of integer ids back into port names.
+        :param route: list of port ids
+        :return: list of port names
+        """
+        port_names = self.port_names
+        return [port_names[f] for f in route]
+
+    def get_routes(self):
+        """
+        Converts the graph back into route objects, grouped by start port.
+        :return: generator of route objects in the form of:
+        {"start": "<name>", "end":"<name>", "journey_time": <time in days>}
+        Routes with a timetable also have a list of "departures".
+        """
+        port_names, offsets, targets, times = self.port_names, self.offsets, self.targets, self.times
+        departures = self.departures
+        for start in range(self.port_count):
+            for i in range(offsets[start], offsets[start + 1]):
+                route = {"start": port_names[start], "end": port_names[targets[i]], "journey_time": times[i]}
+                if departures is not None and departures[i] is not None:
+                    route["departures"] = departures[i].tolist()
+                yield route
+
+    def add_route(self, start_port, end_port, journey_time, departures=None):
+        """
+        Adds a route to the graph in place. The route is placed after any other routes from the same start port and any
+        new port names are given the next free ids.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param journey_time: The journey time in days
+        :param departures: Optional departures of the route, see parse_departures
+        :exception ValueError: raised if the departures are not valid.
+        """
+        timetable = parse_departures(departures)
+        port_count = self.port_count
+        start = self._add_port_name(start_port)
+        end = self._add_port_name(end_port)
+        while len(self.offsets) <= self.port_count:
+            self.offsets.append(self.offsets[-1])
+        if self.times.typecode == "q" and not isinstance(journey_time, int):
+            self.times = array("d", self.times)
+        position = self.offsets[start + 1]
+        self.targets.insert(position, end)
+        self.times.insert(position, journey_time)
+        if timetable is not None and self.departures is None:
+            self.departures = [None] * (len(self.targets) - 1)
+        if self.departures is not None:
+            self.departures.insert(position, timetable)
+        for i in range(start + 1, len(self.offsets)):
+            self.offsets[i] += 1
+        self._reverse_arrays = None
+        # A route between two ports that could already reach each other leaves the reachability index unchanged
+        if self._reachability is not None and (max(start, end) >= port_count or
+                                               not self._reachability.can_reach(start, end)):
+            self._reachability = None
+
+    def remove_route(self, start, end):
+        """
+        Removes every route between two ports from the graph in place. The ports keep their ids.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: The number of routes removed
+        """
+        removed = 0
+        for i in reversed(self._get_route_positions(start, end)):
+            self.targets.pop(i)
+            self.times.pop(i)
+            if self.departures is not None:
+                self.departures.pop(i)
+            removed += 1
+        for i in range(start + 1, len(self.offsets)):
+            self.offsets[i] -= removed
+        self._reverse_arrays = None
+        self._reachability = None
+        return removed
+
+    def set_journey_time(self, start, end, journey_time):
+        """
+        Changes the journey time of every route between two ports in place.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param journey_time: The new journey time in days
+        :return: The number of routes changed
+        """
+        positions = self._get_route_positions(start, end)
+        if positions and self.times.typecode == "q" and not isinstance(journey_time, int):
+            self.times = array("d", self.times)
+        for i in positions:
+            self.times[i] = journey_time
+        self._reverse_arrays = None
+        return len(positions)
+
+    def get_shortest_routes(self, start, end):
+        """
+        Finds the shortest journey time between two ports along with every route that achieves it using Dijkstra's
+        algorithm. If the start and end port are the same then the shortest round trip is found.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: A tuple of (shortest time in days, list of routes of port ids). The time is None and the list is empty
+                 if the end port cannot be reached.
+        """
+        if not self._can_reach(start, end):
+            return None, []
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        fn_can_reach = self._get_reach_function(end)
+        best_time = None
+        # The end port is never expanded so that a round trip (start == end) is handled the same as any other
+        # journey. Its predecessors are tracked separately from the other ports.
+        end_preds = []
+        times = [None] * self.port_count
+        preds = [None] * self.port_count
+        settled = bytearray(self.port_count)
+        times[start] = 0
+        preds[start] = []
+        heap = [(0, start)]
+        while heap:
+            time, port = heapq.heappop(heap)
+            if settled[port]:
+                continue
+            if best_time is not None and time > best_time:
+                break
+            settled[port] = 1
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if next_port == end:
+                    if best_time is None or next_time < best_time:
+                        best_time = next_time
+                        end_preds = [port]
+                    elif next_time == best_time:
+                        end_preds.append(port)
+                    continue
+                if settled[next_port]:
+                    # A route with a journey time of 0 days can reach a settled port just as quickly, which is another
+                    # shortest route to it. No route returns to the start port so it never has predecessors.
+                    if next_time == times[next_port] and next_port != start:
+                        preds[next_port].append(port)
+                    continue
+                if not fn_can_reach(next_port):
+                    continue
+                if times[next_port] is None or next_time < times[next_port]:
+                    times[next_port] = next_time
+                    preds[next_port] = [port]
+                    heapq.heappush(heap, (next_time, next_port))
+                elif next_time == times[next_port]:
+                    preds[next_port].append(port)
+
+        self._add_nodes_expanded(settled.count(1))
+        routes = []
+        for pred in end_preds:
+            routes.extend(route + [end] for route in self._get_routes_from_preds(pred, preds))
+        return best_time, routes
+
+    def get_reverse_arrays(self):
+        """
+        Gets the routes arriving at each port in the same CSR form as the routes leaving each port, so that a search can
+        work backwards from the end port. The routes arriving at the port with id i are at positions
+        offsets[i] to offsets[i + 1] - 1 of the sources and times arrays. The arrays are built on first use and kept
+        until the routes change.
+        :return: A tuple of (offsets, sources, times) arrays
+        """
+        if self._reverse_arrays is not None:
+            return self._reverse_arrays
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        reverse_offsets = array("q", [0]) * (self.port_count + 1)
+        for end in targets:
+            reverse_offsets[end + 1] += 1
+        for i in range(self.port_count):
+            reverse_offsets[i + 1] += reverse_offsets[i]
+        sources = array("i", [0]) * len(targets)
+        times = array(journey_times.typecode, [0]) * len(targets)
+        positions = reverse_offsets[:-1]
+        for start in range(self.port_count):
+            for i in range(offsets[start], offsets[start + 1]):
+                position = positions[targets[i]]
+                sources[position] = start
+                times[position] = journey_times[i]
+                positions[targets[i]] = position + 1
+        self._reverse_arrays = reverse_offsets, sources, times
+        return self._reverse_arrays
+
+    def get_reachability(self):
+        """
+        Gets the index of which ports can reach each other, which every point to point search checks first so that a
+        port that cannot be reached is answered straight away rather than after exploring every port that can be. The
+        index is built on first use and kept until routes are added or removed.
+        :return: A ReachabilityIndex object
+        """
+        if self._reachability is None:
+            with get_timer(self.stats, "build_reachability"):
+                self._reachability = ReachabilityIndex(self)
+        return self._reachability
+
+    def get_distances_from(self, start, reverse=False):
+        """
+        Finds the shortest journey time from one port to every other port, or from every other port to it, using
+        Dijkstra's algorithm. Unlike get_shortest_times_from the time of the port itself is 0 rather than a round trip.
+        :param start: The id of the port
+        :param reverse: True to find the times to the port by following the routes backwards
+        :return: list of journey times indexed by port id, None if a port cannot be reached
+        """
+        offsets, targets, journey_times = self.get_reverse_arrays() if reverse else (self.offsets, self.targets,
+                                                                                      self.times)
+        times = [None] * self.port_count
+        settled = bytearray(self.port_count)
+        times[start] = 0
+        heap = [(0, start)]
+        while heap:
+            time, port = heapq.heappop(heap)
+            if settled[port]:
+                continue
+            settled[port] = 1
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if not settled[next_port] and (times[next_port] is None or next_time < times[next_port]):
+                    times[next_port] = next_time
+                    heapq.heappush(heap, (next_time, next_port))
+        self._add_nodes_expanded(settled.count(1))
+        return times
+
+    def get_shortest_route_bidirectional(self, start, end):
+        """
+        Finds one shortest route between two ports by running Dijkstra's algorithm forwards from the start port and
+        backwards from the end port at the same time, always expanding the side with the nearer frontier. The search
+        stops once the two frontiers together are at least as long as the best route found where they meet, so each
+        side only has to explore to about half of the shortest journey time rather than one side exploring all of it.
+        A round trip has no far end to search back from so it is found with a forward search.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: A tuple of (journey time, route of port ids) or (None, None) if there is no route.
+        """
+        if not self._can_reach(start, end):
+            return None, None
+        if start == end:
+            return self._get_shortest_route(start, end, set(), set())
+        forward = self.offsets, self.targets, self.times
+        backward = self.get_reverse_arrays()
+        # Each side skips the ports that are not on any route between the two ports
+        reach_functions = self._get_reach_function(end), self._get_reach_function(start, True)
+        # The search state of each side, indexed by 0 for forwards and 1 for backwards
+        times = ({start: 0}, {end: 0})
+        preds = ({start: None}, {end: None})
+        settled = (set(), set())
+        heaps = ([(0, start)], [(0, end)])
+        best_time, best_leg = None, None
+        while heaps[0] and heaps[1]:
+            if best_time is not None and heaps[0][0][0] + heaps[1][0][0] >= best_time:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            time, port = heapq.heappop(heaps[side])
+            if port in settled[side]:
+                continue
+            settled[side].add(port)
+            offsets, targets, journey_times = backward if side else forward
+            side_times, other_times = times[side], times[1 - side]
+            fn_can_reach = reach_functions[side]
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if next_port in other_times:
+                    # The two searches meet along this leg
+                    total_time = next_time + other_times[next_port]
+                    if best_time is None or total_time < best_time:
+                        best_time = total_time
+                        best_leg = (next_port, port) if side else (port, next_port)
+                if next_port in settled[side] or not fn_can_reach(next_port):
+                    continue
+                if next_port not in side_times or next_time < side_times[next_port]:
+                    side_times[next_port] = next_time
+                    preds[side][next_port] = port
+                    heapq.heappush(heaps[side], (next_time, next_port))
+
+        self._add_nodes_expanded(len(settled[0]) + len(settled[1]))
+        if best_time is None:
+            return None, None
+        route = []
+        port = best_leg[0]
+        while port is not None:
+            route.append(port)
+            port = preds[0][port]
+        route.reverse()
+        port = best_leg[1]
+        while port is not None:
+            route.append(port)
+            port = preds[1][port]
+        return best_time, route
+
+    def get_shortest_route_astar(self, start, end, landmarks):
+        """
+        Finds one shortest route between two ports with the A* algorithm, using the journey times to and from a few
+        landmark ports to give a lower bound of the time left to the end port from every port (the ALT heuristic).
+        Ports that the bound shows are further from the end port than the route being followed, or that cannot reach it
+        at all, are never expanded. As with get_shortest_routes the end port is never expanded so round trips are
+        handled.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param landmarks: A Landmarks object computed for this graph
+        :return: A tuple of (journey time, route of port ids) or (None, None) if there is no route.
+        """
+        if not self._can_reach(start, end):
+            return None, None
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        fn_bound = landmarks.get_bound_function(end)
+        fn_can_reach = self._get_reach_function(end)
+        times = {start: 0}
+        preds = {start: None}
+        settled = set()
+        heap = [(0, 0, start)]
+        best_time, best_pred = None, None
+        while heap:
+            estimate, time, port = heapq.heappop(heap)
+            if port in settled:
+                continue
+            if best_time is not None and estimate >= best_time:
+                break
+            settled.add(port)
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if next_port == end:
+                    if best_time is None or next_time < best_time:
+                        best_time, best_pred = next_time, port
+                    continue
+                if next_port in settled or next_port == start or not fn_can_reach(next_port):
+                    continue
+                if next_port not in times or next_time < times[next_port]:
+                    bound = fn_bound(next_port)
+                    if bound is None:
+                        # The end port cannot be reached from this port
+                        continue
+                    times[next_port] = next_time
+                    preds[next_port] = port
+                    heapq.heappush(heap, (next_time + bound, next_time, next_port))
+
+        self._add_nodes_expanded(len(settled))
+        if best_time is None:
+            return None, None
+        route = [end]
+        port = best_pred
+        while port is not None:
+            route.append(port)
+            port = preds[port]
+        route.reverse()
+        return best_time, route
+
+    def get_earliest_arrival(self, start, end, departure_day):
+        """
+        Finds the earliest day that the end port can be reached when leaving the start port on a given day, waiting in
+        port for the next sailing of each route that has a timetable. Routes without a timetable can be sailed as soon
+        as a port is reached, so with no timetables at all this is the shortest journey time plus the departure day.
+        Waiting for a later sailing can never give an earlier arrival, so Dijkstra's algorithm works on arrival days
+        with the next sailing of each route found by a binary search of its timetable, which is O(E (log V + log S))
+        for S sailings of a route. If the start and end port are the same then the earliest return is found.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param departure_day: The earliest day that the journey can start
+        :return: A tuple of (arrival day, list of legs) where each leg is a (start id, end id, departure day, arrival
+                 day) tuple. The arrival day is None and the list is empty if the end port cannot be reached.
+        """
+        if not self._can_reach(start, end):
+            return None, []
+        offsets, targets, journey_times, departures = self.offsets, self.targets, self.times, self.departures
+        fn_can_reach = self._get_reach_function(end)
+        arrivals = [None] * self.port_count
+        # The leg that reaches each port, as a (previous port, departure day) tuple
+        legs = [None] * self.port_count
+        settled = bytearray(self.port_count)
+        arrivals[start] = departure_day
+        heap = [(departure_day, start)]
+        best_arrival, best_leg = None, None
+        while heap:
+            day, port = heapq.heappop(heap)
+            if settled[port]:
+                continue
+            if best_arrival is not None and day >= best_arrival:
+                break
+            settled[port] = 1
+            for i in range(offsets[port], offsets[port + 1]):
+                sail_day = day
+                if departures is not None and departures[i] is not None:
+                    timetable = departures[i]
+                    j = bisect_left(timetable, day)
+                    if j == len(timetable):
+                        # There are no more sailings of this route
+                        continue
+                    sail_day = timetable[j]
+                next_port = targets[i]
+                next_day = sail_day + journey_times[i]
+                # As with get_shortest_routes the end port is never expanded so that a round trip is handled
+                if next_port == end:
+                    if best_arrival is None or next_day < best_arrival:
+                        best_arrival, best_leg = next_day, (port, sail_day)
+                    continue
+                if settled[next_port] or not fn_can_reach(next_port):
+                    continue
+                if arrivals[next_port] is None or next_day < arrivals[next_port]:
+                    arrivals[next_port] = next_day
+                    legs[next_port] = port, sail_day
+                    heapq.heappush(heap, (next_day, next_port))
+
+        self._add_nodes_expanded(settled.count(1))
+        if best_arrival is None:
+            return None, []
+        route_legs = [(best_leg[0], end, best_leg[1], best_arrival)]
+        port = best_leg[0]
+        while port != start:
+            prev_port, sail_day = legs[port]
+            route_legs.insert(0, (prev_port, port, sail_day, arrivals[port]))
+            port = prev_port
+        return best_arrival, route_legs
+
+    def get_k_shortest_routes(self, start, end, k, limits=None):
+        """
+        Finds the k quickest routes between two ports that never revisit a port, using Yen's algorithm. Each route after
+        the first is found by a shortest route search that branches off one of the routes already found, so the cost is
+        O(k V (E log V)) rather than enumerating every route. If the start and end port are the same then the quickest
+        round trips are found.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param k: The maximum number of routes to find
+        :param limits: Optional SearchLimits object. The search stops and returns the routes found so far if it times
+                       out, expands too many ports, finds too many routes or is cancelled. The ports expanded by every
+                       shortest route search are counted.
+        :return: list of up to k (route of port ids, journey time) tuples, quickest first
+        """
+        if k < 1 or not self._can_reach(start, end):
+            return []
+        shortest_time, shortest_route = self._get_shortest_route(start, end, set(), set(), limits)
+        if shortest_route is None or (limits is not None and not limits.add_result()):
+            return []
+
+        found = [(shortest_route, shortest_time)]
+        seen = {tuple(shortest_route)}
+        candidates = []
+        while len(found) < k:
+            prev_route, _ = found[-1]
+            root_time = 0
+            for i in range(len(prev_route) - 1):
+                if limits is not None and not limits.check():
+                    return found
+                spur_port = prev_route[i]
+                root = prev_route[:i + 1]
+                # Block the next leg of every route found so far that shares this root so that a new route is found
+                blocked_legs = {(spur_port, route[i + 1]) for route, _ in found if route[:i + 1] == root}
+                # Block the ports already on the root so that the new route does not revisit them. The end port is
+                # never blocked since a round trip must be able to return to the start port.
+                blocked_ports = set(root[:-1])
+                blocked_ports.discard(end)
+                spur_time, spur_route = self._get_shortest_route(spur_port, end, blocked_ports, blocked_legs, limits)
+                if limits is not None and limits.truncated:
+                    return found
+                if spur_route is not None:
+                    route = root[:-1] + spur_route
+                    if tuple(route) not in seen:
+                        seen.add(tuple(route))
+                        heapq.heappush(candidates, (root_time + spur_time, route))
+                root_time += self._get_leg_time(spur_port, prev_route[i + 1])
+            if not candidates:
+                break
+            journey_time, route = heapq.heappop(candidates)
+            if limits is not None and not limits.add_result():
+                break
+            found.append((route, journey_time))
+        return found
+
+    def get_pareto_routes(self, start, end, max_stops=None, limits=None):
+        """
+        Finds the Pareto optimal routes between two ports over journey time and number of stops, that is the quickest
+        route for each number of stops that is quicker than every route with fewer stops. Routes are found in rounds
+        with round k finding the quickest arrival at each port in exactly k legs, starting only from the ports that were
+        reached quicker in round k - 1 than in any earlier round. An arrival that is no quicker than the best arrival
+        at the same port in an earlier round, or at the end port, is dominated and pruned, as is any port that cannot
+        reach the end port, so each round is at most O(E) and there are at most V rounds. If the start and end port are
+        the same then the round trips are found.
+        With non negative journey times every route found never revisits a port, since leaving out a loop would give a
+        route with fewer stops that is no slower.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param max_stops: Optional maximum number of ports (including the start and end port) in a route.
+        :param limits: Optional SearchLimits object. The search stops and returns the routes found so far if it times
+                       out, expands too many ports, finds too many routes or is cancelled.
+        :return: list of (route of port ids, journey time) tuples, fewest stops first. Each route is quicker than the
+                 one before it.
+        """
+        if not self._can_reach(start, end):
+            return []
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        fn_reach_test = self.get_reachability().get_reach_test(end)
+        # The quickest time that each port has been reached in so far, in any round
+        best_times = [None] * self.port_count
+        if start != end:
+            best_times[start] = 0
+        best_end_time = None
+        # The ports reached in the last round mapped to their time, and the previous port of every arrival by round
+        reached = {start: 0}
+        preds = []
+        found = []
+        expanded = 0
+        try:
+            while reached and (max_stops is None or len(preds) + 2 <= max_stops):
+                next_reached, round_preds = {}, {}
+                for port, time in reached.items():
+                    if limits is not None and not limits.add_expansion():
+                        return found
+                    expanded += 1
+                    for i in range(offsets[port], offsets[port + 1]):
+                        next_port = targets[i]
+                        next_time = time + journey_times[i]
+                        if best_end_time is not None and next_time >= best_end_time:
+                            continue
+                        if next_port != end:
+                            if best_times[next_port] is not None and next_time >= best_times[next_port]:
+                                continue
+                            if not fn_reach_test(next_port):
+                                continue
+                        if next_port not in next_reached or next_time < next_reached[next_port]:
+                            next_reached[next_port] = next_time
+                            round_preds[next_port] = port
+                preds.append(round_preds)
+                # The end port is never expanded since a route that passes through it is not a route to it
+                end_time = next_reached.pop(end, None)
+                if end_time is not None and (best_end_time is None or end_time < best_end_time):
+                    if limits is not None and not limits.add_result():
+                        return found
+                    best_end_time = end_time
+                    found.append((self._get_route_from_rounds(end, preds), end_time))
+                for port, time in next_reached.items():
+                    best_times[port] = time
+                reached = next_reached
+            return found
+        finally:
+            self._add_nodes_expanded(expanded)
+
+    def get_shortest_times_from(self, start):
+        """
+        Finds the shortest journey time from one port to every other port using Dijkstra's algorithm. The time to the
+        start port itself is the shortest round trip.
+        :param start: The id of the starting port
+        :return: A tuple of (times, first hops) lists indexed by port id. The time is None if a port cannot be reached
+                 and the first hop is the id of the first port after the start on a shortest route.
+        """
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        times = [None] * self.port_count
+        first_hops = [-1] * self.port_count
+        settled = bytearray(self.port_count)
+        # The search is seeded with the routes leaving the start port rather than the start port itself so that the
+        # start port can be reached again by a round trip.
+        heap = []
+        for i in range(offsets[start], offsets[start + 1]):
+            port = targets[i]
+            if times[port] is None or journey_times[i] < times[port]:
+                times[port] = journey_times[i]
+                first_hops[port] = port
+                heapq.heappush(heap, (journey_times[i], port))
+        while heap:
+            time, port = heapq.heappop(heap)
+            if settled[port]:
+                continue
+            settled[port] = 1
+            first_hop = first_hops[port]
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if not settled[next_port] and (times[next_port] is None or next_time < times[next_port]):
+                    times[next_port] = next_time
+                    first_hops[next_port] = first_hop
+                    heapq.heappush(heap, (next_time, next_port))
+        self._add_nodes_expanded(settled.count(1))
+        return times, first_hops
+
+    def get_shortest_route_tree(self, start):
+        """
+        Finds the shortest journey time from one port to every other port using Dijkstra's algorithm, keeping every
+        predecessor that is on a shortest route so that all of the tied routes to any port can be rebuilt with
+        get_routes_from_tree. The time to the start port itself is the shortest round trip.
+        :param start: The id of the starting port
+        :return: A tuple of (times, preds) lists indexed by port id. The time is None if a port cannot be reached and
+                 the preds are the ids of the ports before it on a shortest route.
+        """
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        times = [None] * self.port_count
+        preds = [None] * self.port_count
+        settled = bytearray(self.port_count)
+        # The start port is not settled at time 0 so that it can be reached again by a round trip
+        heap = [(0, start)]
+        first = True
+        while heap:
+            time, port = heapq.heappop(heap)
+            if not first:
+                if settled[port]:
+                    continue
+                settled[port] = 1
+                # A round trip ends at the start port so the routes leaving it are not followed again
+                if port == start:
+                    continue
+            first = False
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                next_time = time + journey_times[i]
+                if settled[next_port]:
+                    # A route with a journey time of 0 days can reach a settled port just as quickly
+                    if next_time == times[next_port]:
+                        preds[next_port].append(port)
+                    continue
+                if times[next_port] is None or next_time < times[next_port]:
+                    times[next_port] = next_time
+                    preds[next_port] = [port]
+                    heapq.heappush(heap, (next_time, next_port))
+                elif next_time == times[next_port]:
+                    preds[next_port].append(port)
+        # The start port is always expanded first but is only settled, and not expanded again, by a round trip
+        self._add_nodes_expanded(settled.count(1) - settled[start] + 1)
+        return times, preds
+
+    @staticmethod
+    def get_routes_from_tree(start, end, preds):
+        """
+        Rebuilds every shortest route from the start port to the end port from the predecessors found by
+        get_shortest_route_tree. Journey times of 0 days can make the predecessors loop, so a route never revisits a
+        port.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param preds: The predecessors list from get_shortest_route_tree
+        :return: list of routes of port ids, empty if the end port cannot be reached.
+        """
+        routes = []
+        stack = [[pred, end] for pred in reversed(preds[end] or [])]
+        while stack:
+            route = stack.pop()
+            if route[0] == start:
+                routes.append(route)
+                continue
+            stack.extend([pred] + route for pred in reversed(preds[route[0]]) if pred == start or pred not in route)
+        return routes
+
+    def iter_routes(self, start, end, max_stops=None, max_time=None, limits=None):
+        """
+        Generator that yields every route between two ports that never revisits a port.
+        An explicit stack of route positions is used rather than recursion so that deep routes do not hit the recursion
+        limit and so that only the current route is held in memory. The journey time so far is carried along so any
+        branch that exceeds one of the bounds is pruned as soon as it is found, as is any branch to a port that cannot
+        reach the end port.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param max_stops: Optional maximum number of ports (including the start and end port) in a route.
+        :param max_time: Optional maximum total journey time in days.
+        :param limits: Optional SearchLimits object. The search stops early if it times out, expands too many ports or
+                       is cancelled. The number of results is not limited here so that the caller can filter them first.
+        :return: generator of (route of port ids, journey time) tuples
+        """
+        if not self._can_reach(start, end):
+            return
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        fn_reach_test = self.get_reachability().get_reach_test(end)
+        # Whether each port can reach the end port, looked up the first time the port is reached: 1 if it can, 2 if not
+        reaching = bytearray(self.port_count)
+        route = [start]
+        visited = bytearray(self.port_count)
+        visited[start] = 1
+        times = [0]
+        # Each stack item is the position of the next route to try from the port at the same place in the route
+        stack = [offsets[start]]
+        expanded, yielded, pruned = 1, 0, 0
+        try:
+            while stack:
+                port = route[-1]
+                i = stack[-1]
+                stop = offsets[port + 1]
+                while i < stop:
+                    next_port = targets[i]
+                    next_time = times[-1] + journey_times[i]
+                    i += 1
+                    if max_time is not None and next_time > max_time:
+                        pruned += 1
+                        continue
+                    # This check detect when we have reached our destination
+                    if next_port == end:
+                        if max_stops is None or len(route) < max_stops:
+                            yielded += 1
+                            yield route + [end], next_time
+                        else:
+                            pruned += 1
+                        continue
+                    # This check stops us looping around forever. If we reach a destination that we have already
+                    # visited then we skip the route
+                    if visited[next_port]:
+                        continue
+                    if not reaching[next_port]:
+                        reaching[next_port] = 1 if fn_reach_test(next_port) else 2
+                    if reaching[next_port] == 2:
+                        pruned += 1
+                        continue
+                    # The next port still needs at least one more stop to reach the destination
+                    if max_stops is not None and len(route) + 2 > max_stops:
+                        pruned += 1
+                        continue
+                    if limits is not None and not limits.add_expansion():
+                        return
+                    stack[-1] = i
+                    route.append(next_port)
+                    visited[next_port] = 1
+                    times.append(next_time)
+                    stack.append(offsets[next_port])
+                    expanded += 1
+                    break
+                else:
+                    # Every route from the current port has been explored so step back to the previous port
+                    stack.pop()
+                    visited[route.pop()] = 0
+                    times.pop()
+        finally:
+            # The counters are added even if the caller stops asking for routes part way through
+            if self.stats is not None:
+                self.stats.add("nodes_expanded", expanded)
+                self.stats.add("routes_yielded", yielded)
+                self.stats.add("branches_pruned", pruned)
+
+    def count_walks_by_stops(self, start, end, max_stops):
+        """
+        Counts the routes, which may revisit ports, between two ports for every number of stops up to a maximum using
+        dynamic programming in O(max_stops * E) time.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param max_stops: The maximum number of stops (including the start and end port) to count routes for
+        :return: dict of number of stops to the number of routes. Stop counts with no routes are not included.
+        """
+        offsets, targets = self.offsets, self.targets
+        results = {}
+        # counts holds the number of routes with the current number of stops that finish at each port
+        counts = {start: 1}
+        for stops in range(2, max_stops + 1):
+            next_counts = {}
+            for port, count in counts.items():
+                for i in range(offsets[port], offsets[port + 1]):
+                    next_counts[targets[i]] = next_counts.get(targets[i], 0) + count
+            if next_counts.get(end):
+                results[stops] = next_counts[end]
+            counts = next_counts
+        return results
+
+    def count_walks_from(self, start, max_stops):
+        """
+        Counts the routes, which may revisit ports, from one port to every port with up to a maximum number of stops
+        using the same dynamic programming as count_walks_by_stops.
+        :param start: The id of the starting port
+        :param max_stops: The maximum number of stops (including the start and end port) to count routes for
+        :return: list indexed by port id of the number of routes from the start port to that port
+        """
+        offsets, targets = self.offsets, self.targets
+        totals = [0] * self.port_count
+        counts = {start: 1}
+        for _ in range(2, max_stops + 1):
+            next_counts = {}
+            for port, count in counts.items():
+                for i in range(offsets[port], offsets[port + 1]):
+                    next_counts[targets[i]] = next_counts.get(targets[i], 0) + count
+            for port, count in next_counts.items():
+                totals[port] += count
+            counts = next_counts
+        return totals
+
+    def count_walks_by_time(self, start, end, max_time):
+        """
+        Counts the routes, which may revisit ports, between two ports for every total journey time up to a maximum using
+        dynamic programming in O(max_time * E) time.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param max_time: The maximum total journey time in days to count routes for
+        :return: dict of total journey time to the number of routes. Journey times with no routes are not included.
+        :exception ValueError: raised if a journey time is not a positive whole number.
+        """
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        if journey_times.typecode != "q" or (journey_times and min(journey_times) <= 0):
+            raise ValueError("Counting routes by time with revisits requires positive whole number journey times.")
+
+        results = {}
+        # pending maps a journey time to the number of routes with that time that finish at each port, and the heap
+        # holds the pending times so the earliest is found in O(log T). Journey times are always positive so once a
+        # time has been processed it can never be added to again and is discarded.
+        pending = {0: {start: 1}}
+        heap = [0]
+        while heap:
+            time = heapq.heappop(heap)
+            counts = pending.pop(time)
+            if time and counts.get(end):
+                results[time] = counts[end]
+            for port, count in counts.items():
+                for i in range(offsets[port], offsets[port + 1]):
+                    next_time = time + journey_times[i]
+                    if next_time <= max_time:
+                        next_counts = pending.get(next_time)
+                        if next_counts is None:
+                            next_counts = pending[next_time] = {}
+                            heapq.heappush(heap, next_time)
+                        next_counts[targets[i]] = next_counts.get(targets[i], 0) + count
+        return results
+
+    def _add_port_name(self, port_name):
+        """
+        Gets the id of a port name, giving it the next free id if it has not been seen before.
+        :param port_name: The port name
+        :return: The integer id of the port
+        """
+        port_id = self.port_ids.get(port_name)
+        if port_id is None:
+            port_id = self.port_ids[port_name] = len(self.port_names)
+            self.port_names.append(port_name)
+        return port_id
+
+    def _get_shortest_route(self, start, end, blocked_ports, blocked_legs, limits=None):
+        """
+        Finds one shortest route between two ports with Dijkstra's algorithm while avoiding some ports and legs.
+        As with get_shortest_routes the end port is never expanded so round trips are handled.
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :param blocked_ports: set of port ids that the route must not pass through
+        :param blocked_legs: set of (start id, end id) tuples of legs that the route must not use
+        :param limits: Optional SearchLimits object that each expanded port is counted against
+        :return: A tuple of (journey time, route of port ids) or (None, None) if there is no route or the search was
+                 stopped by the limits.
+        """
+        offsets, targets, journey_times = self.offsets, self.targets, self.times
+        fn_can_reach = self._get_reach_function(end)
+        times = {start: 0}
+        preds = {start: None}
+        settled = set()
+        heap = [(0, start)]
+        best_time, best_pred = None, None
+        while heap:
+            time, port = heapq.heappop(heap)
+            if port in settled:
+                continue
+            if best_time is not None and time >= best_time:
+                break
+            if limits is not None and not limits.add_expansion():
+                return None, None
+            settled.add(port)
+            for i in range(offsets[port], offsets[port + 1]):
+                next_port = targets[i]
+                if next_port in blocked_ports or (port, next_port) in blocked_legs:
+                    continue
+                next_time = time + journey_times[i]
+                if next_port == end:
+                    if best_time is None or next_time < best_time:
+                        best_time, best_pred = next_time, port
+                    continue
+                if next_port in settled or next_port == start or not fn_can_reach(next_port):
+                    continue
+                if next_port not in times or next_time < times[next_port]:
+                    times[next_port] = next_time
+                    preds[next_port] = port
+                    heapq.heappush(heap, (next_time, next_port))
+
+        self._add_nodes_expanded(len(settled))
+        if best_time is None:
+            return None, None
+        route = [end]
+        port = best_pred
+        while port is not None:
+            route.append(port)
+            port = preds[port]
+        route.reverse()
+        return best_time, route
+
+    def _can_reach(self, start, end):
+        """
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: True if the end port can be reached from the start port, see ReachabilityIndex.can_reach. Searches
+                 that are rejected are counted in the stats.
+        """
+        if self.get_reachability().can_reach(start, end):
+            return True
+        if self.stats is not None:
+            self.stats.add("searches_rejected")
+        return False
+
+    def _get_reach_function(self, port, backward=False):
+        """
+        Gets a function that checks whether another port can reach a port, or for a backward search whether the port
+        can reach the other port, so that a search can skip every port that is not on a route between its two ends.
+        Each port is looked up in the reachability index the first time it is checked and remembered for the search.
+        :param port: The id of the end port, or of the start port for a backward search
+        :param backward: True for a search that works backwards from the end port
+        :return: A function that takes a port id and returns True if it can be on a route
+        """
+        fn_reach_test = self.get_reachability().get_reach_test(port, backward)
+        # 1 if a port can be on a route, 2 if not and 0 if it has not been checked yet
+        reaching = bytearray(self.port_count)
+
+        def fn_can_reach(other_port):
+            if not reaching[other_port]:
+                reaching[other_port] = 1 if fn_reach_test(other_port) else 2
+            return reaching[other_port] == 1
+
+        return fn_can_reach
+
+    def _add_nodes_expanded(self, count):
+        """
+        Adds the number of ports expanded by a search to the stats, if they are being collected.
+        :param count: The number of ports expanded
+        """
+        if self.stats is not None:
+            self.stats.add("nodes_expanded", count)
+
+    def _get_leg_time(self, start, end):
+        """
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: The quickest journey time of the routes directly between two ports
+        """
+        return min(self.times[i] for i in self._get_route_positions(start, end))
+
+    def _get_route_positions(self, start, end):
+        """
+        :param start: The id of the starting port
+        :param end: The id of the end port
+        :return: list of the positions in the targets and times arrays of the routes between the two ports
+        """
+        return [i for i in range(self.offsets[start], self.offsets[start + 1]) if self.targets[i] == end]
+
+    @staticmethod
+    def _get_routes_from_preds(port, preds):
+        """
+        Expands a predecessor list produced by a shortest path search into the list of routes that lead to a port.
+        Journey times of 0 days can make the predecessors loop, so a route never revisits a port.
+        :param port: The port id to build the routes to
+        :param preds: list indexed by port id of the ports that precede it on a shortest route
+        :return: list of list of port ids
+        """
+        routes = []
+        # Walk backwards from the port to the start, a stack is used rather than recursion so that long routes do not
+        # hit the recursion limit.
+        stack = [[port]]
+        while stack:
+            route = stack.pop()
+            if not preds[route[0]]:
+                routes.append(route)
+                continue
+            stack.extend([pred] + route for pred in reversed(preds[route[0]]) if pred not in route)
+        return routes
+
+    @staticmethod
+    def _get_route_from_rounds(port, preds):
+        """
+        Follows the previous ports recorded by get_pareto_routes back from a port reached in the last round.
+        :param port: The port id to build the route to
+        :param preds: list for each round of a dict of the ports reached in that round to the port they were reached
+                      from
+        :return: list of port ids
+        """
+        route = [port]
+        for round_preds in reversed(preds):
+            route.append(round_preds[route[-1]])
+        route.reverse()
+        return route
@@ -0,0 +1,201 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+from array import array
+from contextlib import contextmanager
+
+import yaml
+
+from route_graph import RouteGraph
+
+_SNAPSHOT_FORMAT_VERSION = 2
+
+# The errors that reading a snapshot or distance table that is damaged, partly written or from another version can
+# raise. A file that raises one of them is treated as out of date and rebuilt.
+STALE_FILE_ERRORS = (ValueError, EOFError, OSError, KeyError, TypeError, IndexError)
+
+
+def get_file_signature(filename):
+    """
+    Gets a signature for a file that changes whenever the file is modified.
+    :param filename: The name of the file
+    :return: dict of the file size and modification time
+    """
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+@contextmanager
+def replace_file(filename):
+    """
+    Context manager that writes a file atomically. A temporary file in the same folder is opened for writing in binary
+    mode and is moved over the file once it has been written, so a reader never sees a partly written file and a write
+    that is interrupted leaves the old file, if there was one, as it was.
+    :param filename: The name of the file to write
+    :return: The open temporary file
+    """
+    folder, name = os.path.split(os.path.abspath(filename))
+    han = tempfile.NamedTemporaryFile("wb", dir=folder, prefix=name + ".", suffix=".tmp", delete=False)
+    try:
+        with han:
+            yield han
+        os.replace(han.name, filename)
+    except BaseException:
+        os.remove(han.name)
+        raise
+
+
+def get_snapshot_filename(routes_filename):
+    """
+    :param routes_filename: The name of a route file
+    :return: The name of the file that the compiled snapshot of the route file is saved to
+    """
+    return routes_filename + ".snapshot"
+
+
+def get_yaml_loader():
+    """
+    :return: The libyaml based safe loader if PyYAML was built with it, otherwise the pure python safe loader.
+    """
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def read_routes(filename):
+    """
+    Reads the routes from a file. The format is chosen from the file extension:
+    .csv for a CSV file with a start,end,journey_time header, .jsonl for a file with one JSON route object per line and
+    YAML for anything else.
+    :param filename: The name of the route file
+    :return: list of route objects in the form of:
+    {"start": "<name>", "end":"<name>", "journey_time": <time in days>}
+    Routes that only sail on certain days also have "departures", see route_graph.parse_departures.
+    """
+    _, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    if ext == ".csv":
+        return list(iter_csv_routes(filename))
+    if ext in (".jsonl", ".ndjson"):
+        return list(iter_jsonl_routes(filename))
+    with open(filename) as han:
+        return yaml.load(han, Loader=get_yaml_loader())
+
+
+def iter_csv_routes(filename):
+    """
+    Reads the routes from a CSV file one row at a time.
+    :param filename: The name of a CSV file with a start,end,journey_time header. An optional departures column holds
+                     the departure days of a route separated by spaces, and is left empty for a route that can be
+                     sailed at any time.
+    :return: generator of route objects
+    """
+    with open(filename, newline="", encoding="UTF8") as han:
+        for row in csv.DictReader(han):
+            route = {"start": row["start"], "end": row["end"], "journey_time": _parse_journey_time(row["journey_time"])}
+            if row.get("departures"):
+                route["departures"] = [_parse_journey_time(f) for f in row["departures"].split()]
+            yield route
+
+
+def iter_jsonl_routes(filename):
+    """
+    Reads the routes from a JSON lines file one line at a time. Blank lines are ignored.
+    :param filename: The name of a file with one JSON route object per line
+    :return: generator of route objects
+    """
+    with open(filename, encoding="UTF8") as han:
+        for line in han:
+            if line.strip():
+                route = json.loads(line)
+                result = {"start": route["start"], "end": route["end"], "journey_time": route["journey_time"]}
+                if route.get("departures") is not None:
+                    result["departures"] = route["departures"]
+                yield result
+
+
+def save_snapshot(graph, filename, source=None):
+    """
+    Saves a compiled snapshot of a route graph so that it can be loaded later without parsing the route file.
+    The file starts with a line of JSON describing the graph which is followed by the raw offsets, targets and times
+    arrays. If any route has a timetable then they are followed by a flag for each route that has one, the position of
+    the first departure of each route, plus the total number of departures, and the departure days of every route.
+    :param graph: A RouteGraph object
+    :param filename: The name of the file to write
+    :param source: Optional signature of the route file the graph was loaded from
+    """
+    header = {
+        "version": _SNAPSHOT_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "ports": graph.port_names,
+        "route_count": len(graph.targets),
+        "times_typecode": graph.times.typecode,
+        "departures_typecode": None,
+        "source": source,
+    }
+    if graph.departures is not None:
+        has_timetables = array("b", (f is not None for f in graph.departures))
+        departure_offsets = array("q", [0])
+        for timetable in graph.departures:
+            departure_offsets.append(departure_offsets[-1] + (len(timetable) if timetable is not None else 0))
+        typecode = "q" if all(f is None or f.typecode == "q" for f in graph.departures) else "d"
+        departure_days = array(typecode)
+        for timetable in graph.departures:
+            if timetable is not None:
+                departure_days.extend(timetable if timetable.typecode == typecode else array(typecode, timetable))
+        header["departures_typecode"] = typecode
+    with replace_file(filename) as han:
+        han.write(json.dumps(header).encode("UTF8") + b"\n")
+        graph.offsets.tofile(han)
+        graph.targets.tofile(han)
+        graph.times.tofile(han)
+        if graph.departures is not None:
+            has_timetables.tofile(han)
+            departure_offsets.tofile(han)
+            departure_days.tofile(han)
+
+
+def load_snapshot(filename, source=None):
+    """
+    Loads a snapshot saved with save_snapshot.
+    :param filename: The name of the file to read
+    :param source: Optional signature of the route file. If given then None is returned when the snapshot was not saved
+                   from the file as it is now.
+    :return: A RouteGraph object or None
+    :exception ValueError: raised if the file was written by an incompatible version or machine. A damaged file can
+                           raise any of STALE_FILE_ERRORS.
+    """
+    with open(filename, "rb") as han:
+        header = json.loads(han.readline().decode("UTF8"))
+        if header["version"] != _SNAPSHOT_FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError("The snapshot %s is not compatible with this version." % filename, filename)
+        if source is not None and header["source"] != source:
+            return None
+        offsets = array("q")
+        offsets.fromfile(han, len(header["ports"]) + 1)
+        targets = array("i")
+        targets.fromfile(han, header["route_count"])
+        times = array(header["times_typecode"])
+        times.fromfile(han, header["route_count"])
+        departures = None
+        if header["departures_typecode"] is not None:
+            has_timetables = array("b")
+            has_timetables.fromfile(han, header["route_count"])
+            departure_offsets = array("q")
+            departure_offsets.fromfile(han, header["route_count"] + 1)
+            departure_days = array(header["departures_typecode"])
+            departure_days.fromfile(han, departure_offsets[-1])
+            departures = [departure_days[departure_offsets[i]:departure_offsets[i + 1]] if has_timetable else None
+                          for i, has_timetable in enumerate(has_timetables)]
+    return RouteGraph.from_arrays(header["ports"], offsets, targets, times, departures)
+
+
+def _parse_journey_time(value):
+    """
+    :param value: A journey time string
+    :return: The journey time as an int if it is a whole number, otherwise as a float
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
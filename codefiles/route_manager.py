@@ -1,18 +1,81 @@
-import yaml
+import os
+import threading
+from collections import Counter
 
-from exceptions import InvalidRouteError, InvalidPortName
+from distance_table import DistanceTable
+from exceptions import InvalidRouteError, UnreachablePortError
+from landmarks import DEFAULT_LANDMARK_COUNT, Landmarks
+from query_cache import QueryCache
+from route_criteria import RouteCriteria
+from route_data import RouteData
+from route_graph import RouteGraph, parse_departures
+from route_loader import (STALE_FILE_ERRORS, get_file_signature, get_snapshot_filename, load_snapshot, read_routes,
+                          save_snapshot)
+from route_stats import RouteStats, get_timer
+
+# The searches that get_shortest_route can use
+SHORTEST_ROUTE_METHODS = ("dijkstra", "bidirectional", "alt")
 
 
 class RouteManager:
     """
     The Route Manager class
     This class manages the route data and provides functions to extract useful information.
+    The route data is held in an immutable RouteData object. Each query reads the current one once and uses it
+    throughout, and loading or changing the routes builds a new one and swaps it in, so any number of threads can query
+    a RouteManager while another thread reloads it. Only the changes take a lock.
     """
 
-    def __init__(self):
-        self.routes = None
-        self.mapped_routes = None
-        self.all_port_names = None
+    def __init__(self, cache_size=256, stats=None):
+        """
+        :param cache_size: The maximum number of query results to cache. Use 0 to disable the cache.
+        :param stats: Optional RouteStats object to collect timings and search counters in, see enable_stats.
+        """
+        self.stats = stats
+        self.query_cache = QueryCache(cache_size)
+        self.route_data = RouteData([], RouteGraph([]))
+        # Changes to the routes are made one at a time. Queries never take this lock.
+        self._change_lock = threading.Lock()
+
+    @property
+    def routes(self):
+        """The list of route objects"""
+        return self.route_data.routes
+
+    @property
+    def mapped_routes(self):
+        """dict of start port name to the list of route objects from it"""
+        return self.route_data.mapped_routes
+
+    @property
+    def all_port_names(self):
+        """frozenset of every port name"""
+        return self.route_data.all_port_names
+
+    @property
+    def route_times(self):
+        """dict of (start port, end port) to the quickest journey time between them"""
+        return self.route_data.route_times
+
+    @property
+    def graph(self):
+        """The RouteGraph object for the routes"""
+        return self.route_data.graph
+
+    @property
+    def distance_table(self):
+        """The DistanceTable object for the routes, or None if one has not been computed or set"""
+        return self.route_data.distance_table
+
+    @distance_table.setter
+    def distance_table(self, distance_table):
+        with self._change_lock:
+            self._set_route_data(self.route_data.with_distance_table(distance_table), False)
+
+    @property
+    def landmarks(self):
+        """The Landmarks object for the routes, or None if they have not been computed"""
+        return self.route_data.landmarks
 
     def get_direct_route_time(self, destinations):
         """
@@ -24,93 +87,591 @@ class RouteManager:
         if len(destinations) < 2:
             raise InvalidRouteError("There must be two or more port names specified.")
 
-        # Break the complete route up into smaller routes
-        route_items = list(zip(destinations[0:], destinations[1:]))
-        r = [route["journey_time"] for route_item in route_items for route in self.routes if
-             route_item == (route["start"], route["end"])]
-        if len(route_items) != len(r):
-            # Find the routes that are invalid and create a string message for the user.
-            invalid_routes = set(route_items).difference([(route["start"], route["end"]) for route in self.routes])
+        journey_time, invalid_routes = self.get_route_times([destinations])[0]
+        if invalid_routes:
+            # Create a string message for the user from the routes that are invalid.
             msg = "\n\t".join([" => ".join(f) for f in invalid_routes])
-            raise InvalidRouteError("One or more parts of this route are invalid.\n\t" + msg, invalid_routes)
-        return sum(r)
+            raise InvalidRouteError("One or more parts of this route are invalid.\n\t" + msg, set(invalid_routes))
+        return journey_time
+
+    def get_route_times(self, routes):
+        """
+        Calculates the total journey time for many routes in one call.
+        Unlike get_direct_route_time no exception is raised for an invalid route, instead the invalid parts of each
+        route are returned so that a large batch can be priced without stopping at the first bad route.
+        :param routes: An iterable of routes where each route is a list of port names.
+        :return: list of (journey time, invalid routes) tuples in the same order as the routes given. The journey time
+                 is None if any part of the route is invalid and the invalid routes are a list of (start, end) tuples
+                 which is empty for a valid route. A route with less than two ports has the route itself as its only
+                 invalid part.
+        """
+        with get_timer(self.stats, "price_routes"):
+            results = self._get_route_times_for(routes)
+        if self.stats is not None:
+            self.stats.add("routes_priced", len(results))
+        return results
+
+    def _get_route_times_for(self, routes):
+        """
+        :param routes: An iterable of routes where each route is a list of port names.
+        :return: list of (journey time, invalid routes) tuples, see get_route_times
+        """
+        route_times = self.route_data.route_times
+        results = []
+        for destinations in routes:
+            if len(destinations) < 2:
+                results.append((None, [tuple(destinations)]))
+                continue
+            total = 0
+            invalid_routes = []
+            for route_item in zip(destinations, destinations[1:]):
+                journey_time = route_times.get(route_item)
+                if journey_time is None:
+                    invalid_routes.append(route_item)
+                else:
+                    total += journey_time
+            results.append((None if invalid_routes else total, invalid_routes))
+        return results
+
+    def is_reachable(self, start_port, end_port):
+        """
+        Checks whether there is any route between two ports with the reachability index, which is built the first time
+        it is needed. The route searches make the same check first so a query between ports that cannot reach each other
+        returns its empty result straight away.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :return: True if the end port can be reached from the start port. If the start and end port are the same then
+                 this is whether there is a round trip.
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        graph = self.route_data.graph
+        return graph.get_reachability().can_reach(graph.get_port_id(start_port), graph.get_port_id(end_port))
+
+    def check_reachable(self, start_port, end_port):
+        """
+        Checks that there is a route between two ports, see is_reachable.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :exception InvalidPortName: raised if either port name is not valid.
+        :exception UnreachablePortError: raised if the end port cannot be reached from the start port.
+        """
+        if not self.is_reachable(start_port, end_port):
+            raise UnreachablePortError("There is no route from %s to %s." % (start_port, end_port),
+                                       {(start_port, end_port)})
 
     def get_shortest_journey(self, start_port, end_port):
         """
         Given a start and end port this function returns the shortest route
         :param start_port: Name fo the starting port
         :param end_port: name of the End port
-        :return: The shortest number of days for the entire journey
+        :return: The shortest number of days for the entire journey or None if the end port cannot be reached.
+        """
+        distance_table = self.route_data.distance_table
+        if distance_table is not None:
+            return distance_table.get_shortest_journey(start_port, end_port)
+        shortest_time, _ = self.get_shortest_route(start_port, end_port)
+        return shortest_time
+
+    def get_shortest_route(self, start_port, end_port, method="bidirectional"):
+        """
+        Finds the shortest journey time between two ports along with one route that achieves it. Only needing one
+        route lets the search stop much sooner than get_shortest_routes, which has to find every tied route.
+        If the start and end port are the same then the shortest round trip is found.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param method: The search to use:
+                       "bidirectional" searches forwards from the start port and backwards from the end port at once.
+                       "alt" is an A* search guided by the journey times to and from landmark ports, which are
+                       computed by compute_landmarks the first time they are needed.
+                       "dijkstra" is the same search as get_shortest_routes.
+        :return: A tuple of (shortest time in days, route). The time and route are None if the end port cannot be
+                 reached.
+        :exception InvalidPortName: raised if either port name is not valid.
+        :exception ValueError: raised if the method is not known.
+        """
+        if method not in SHORTEST_ROUTE_METHODS:
+            raise ValueError("Unknown shortest route method %s." % method, method)
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            start, end = graph.get_port_id(start_port), graph.get_port_id(end_port)
+            if method == "dijkstra":
+                shortest_time, routes = graph.get_shortest_routes(start, end)
+                route = routes[0] if routes else None
+            elif method == "alt":
+                landmarks = route_data.landmarks
+                if landmarks is None:
+                    landmarks = self._compute_landmarks(route_data, DEFAULT_LANDMARK_COUNT)
+                shortest_time, route = graph.get_shortest_route_astar(start, end, landmarks)
+            else:
+                shortest_time, route = graph.get_shortest_route_bidirectional(start, end)
+            return shortest_time, None if route is None else tuple(graph.get_port_route(route))
+
+        shortest_time, route = self._get_cached(route_data, ("shortest_route", start_port, end_port, method), compute)
+        return shortest_time, None if route is None else list(route)
+
+    def get_shortest_routes(self, start_port, end_port):
+        """
+        Finds the shortest journey time between two ports along with every route that achieves it.
+        Dijkstra's algorithm is used so the cost is O(E log V) rather than enumerating every possible route.
+        If the start and end port are the same then the shortest round trip is found.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :return: A tuple of (shortest time in days, list of routes). The time is None and the list is empty if the end
+                 port cannot be reached.
+        """
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            shortest_time, routes = graph.get_shortest_routes(graph.get_port_id(start_port),
+                                                              graph.get_port_id(end_port))
+            return shortest_time, tuple(tuple(graph.get_port_route(route)) for route in routes)
+
+        shortest_time, routes = self._get_cached(route_data, ("shortest_routes", start_port, end_port), compute)
+        return shortest_time, [list(route) for route in routes]
+
+    def get_shortest_routes_from(self, start_port, end_ports):
+        """
+        Finds the shortest journey time and routes from one port to many ports with a single search. This is much
+        quicker than calling get_shortest_routes for each end port. The results are also added to the query cache.
+        :param start_port: Name of the starting port
+        :param end_ports: An iterable of end port names
+        :return: dict of end port name to the same (shortest time, list of routes) tuple that get_shortest_routes
+                 returns.
+        :exception InvalidPortName: raised if any of the port names are not valid.
+        """
+        route_data = self.route_data
+        graph = route_data.graph
+        start = graph.get_port_id(start_port)
+        ends = {end_port: graph.get_port_id(end_port) for end_port in end_ports}
+        with get_timer(self.stats, "query.shortest_routes_from"):
+            times, preds = graph.get_shortest_route_tree(start)
+        results = {}
+        for end_port, end in ends.items():
+            routes = tuple(tuple(graph.get_port_route(route))
+                           for route in graph.get_routes_from_tree(start, end, preds))
+            result = self.query_cache.get_or_compute((route_data.generation, "shortest_routes", start_port, end_port),
+                                                     lambda: (times[end], routes))
+            results[end_port] = result[0], [list(route) for route in result[1]]
+        return results
+
+    def get_earliest_arrival(self, start_port, end_port, departure_day):
         """
-        routes = self.get_all_routes(start_port, end_port)
-        return min([self.get_direct_route_time(f) for f in routes])
+        Finds the earliest day that the end port can be reached when leaving the start port on a given day. Routes with
+        departures can only be sailed on their departure days, so the journey may have to wait in port for the next
+        sailing, while routes without departures can be sailed as soon as a port is reached.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param departure_day: The earliest day that the journey can start
+        :return: A tuple of (arrival day, list of legs) where each leg is a (start port, end port, departure day,
+                 arrival day) tuple. The arrival day is None and the list is empty if the end port cannot be reached.
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            arrival_day, legs = graph.get_earliest_arrival(graph.get_port_id(start_port), graph.get_port_id(end_port),
+                                                           departure_day)
+            port_names = graph.port_names
+            return arrival_day, tuple((port_names[start], port_names[end], sail_day, arrival)
+                                      for start, end, sail_day, arrival in legs)
+
+        arrival_day, legs = self._get_cached(route_data, ("earliest_arrival", start_port, end_port, departure_day),
+                                             compute)
+        return arrival_day, list(legs)
+
+    def get_k_shortest_routes(self, start_port, end_port, k, limits=None):
+        """
+        Finds the k quickest routes between two ports that never revisit a port, without enumerating every route.
+        If the start and end port are the same then the quickest round trips are found.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param k: The maximum number of routes to find
+        :param limits: Optional SearchLimits object to stop the search early with. Results that are cut short are not
+                       cached and limits.truncated is set.
+        :return: list of up to k (route, journey time) tuples, quickest first
+        """
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            routes = graph.get_k_shortest_routes(graph.get_port_id(start_port), graph.get_port_id(end_port), k, limits)
+            return tuple((tuple(graph.get_port_route(route)), journey_time) for route, journey_time in routes)
+
+        routes = self._get_cached(route_data, ("k_shortest_routes", start_port, end_port, k), compute, limits)
+        return [(list(route), journey_time) for route, journey_time in routes]
+
+    def get_pareto_routes(self, start_port, end_port, max_stops=None, limits=None):
+        """
+        Finds the routes between two ports that trade journey time against the number of stops: the quickest route
+        with the fewest stops, then the quickest route with more stops that is quicker still, and so on. No other route
+        is both as quick and has as few stops as one of these, and they are found in one pass without enumerating
+        every route. If the start and end port are the same then the round trips are found.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param max_stops: Optional maximum number of ports (including the start and end port) in a route.
+        :param limits: Optional SearchLimits object to stop the search early with. Results that are cut short are not
+                       cached and limits.truncated is set.
+        :return: list of (route, journey time) tuples, fewest stops first
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            routes = graph.get_pareto_routes(graph.get_port_id(start_port), graph.get_port_id(end_port), max_stops,
+                                             limits)
+            return tuple((tuple(graph.get_port_route(route)), journey_time) for route, journey_time in routes)
 
-    def get_all_routes(self, start_port, end_port, prev_state=None):
+        routes = self._get_cached(route_data, ("pareto_routes", start_port, end_port, max_stops), compute, limits)
+        return [(list(route), journey_time) for route, journey_time in routes]
+
+    def get_all_routes(self, start_port, end_port, limits=None):
         """
         Returns a list of a list of routes.
         :param start_port: The start port
         :param end_port: The final port destination
-        :param prev_state: because this is a recursive function we need a way of remembering the previous state
-                           This variable is a list of strings that holds the ports that we have visited thus far.
+        :param limits: Optional SearchLimits object to stop the search early with. Results that are cut short are not
+                       cached and limits.truncated is set.
         :return: list of list of strings
         """
-        # If this is the first time the function has been called then just add the starting port to a list.
-        if prev_state is None:
-            prev_state = [start_port]
+        route_data = self.route_data
 
-        valid_routes = []
-        if start_port not in self.all_port_names:
-            raise InvalidPortName(
-                "The port name %s is not valid. NOTE: Port names are also case sensitive." % start_port, start_port)
+        def compute():
+            routes = self._iter_routes(route_data, start_port, end_port, None, None, limits)
+            return tuple(tuple(route) for route, _ in (routes if limits is None else limits.limit_results(routes)))
 
-        if end_port not in self.all_port_names:
-            raise InvalidPortName(
-                "The port name %s is not valid. NOTE: Port names are also case sensitive." % start_port, start_port)
+        routes = self._get_cached(route_data, ("all_routes", start_port, end_port), compute, limits)
+        return [list(route) for route in routes]
 
-        for dst_port_info in self.mapped_routes[start_port]:
-            # This check detect when we have reached our destination and adds it to our list of valid routes
-            if dst_port_info["end"] == end_port:
-                valid_routes.append(prev_state + [end_port])
-                continue
-            # This check stops us looping around forever. If we reach a destination that we have already visited then
-            # we skip the route
-            if dst_port_info["end"] in prev_state:
-                continue
-            # Get all possible routes that may or may not reach the intended destination
-            valid_routes.extend(
-                self.get_all_routes(dst_port_info["end"], end_port, prev_state + [dst_port_info["end"]]))
+    def iter_routes(self, start_port, end_port, max_stops=None, max_time=None, with_times=False, limits=None):
+        """
+        Lazily yields every route between two ports in the same order as get_all_routes.
+        Routes are found with a depth first search that keeps track of the journey time so far, so any branch that
+        exceeds one of the bounds is pruned as soon as it is found rather than after the whole route has been built.
+        :param start_port: The start port
+        :param end_port: The final port destination
+        :param max_stops: Optional maximum number of ports (including the start and end port) in a route.
+        :param max_time: Optional maximum total journey time in days.
+        :param with_times: If True then (route, journey time) tuples are yielded instead of just the route.
+        :param limits: Optional SearchLimits object. The generator stops early and sets limits.truncated if a limit is
+                       hit.
+        :return: generator of list of strings
+        :exception InvalidPortName: raised straight away if either port name is not valid.
+        """
+        routes = self._iter_routes(self.route_data, start_port, end_port, max_stops, max_time, limits)
+        if limits is not None:
+            routes = limits.limit_results(routes)
+        if with_times:
+            return routes
+        return (route for route, _ in routes)
 
-        return valid_routes
+    def iter_routes_with_criteria(self, start_port, end_port, criteria, with_times=False, limits=None):
+        """
+        Lazily yields the routes between two ports that pass a criteria. The upper bounds that the criteria sets on the
+        number of stops and journey time are used to prune the route search, so routes that are too long are never
+        built, and the rest of the criteria is checked as each route is found.
+        :param start_port: The start port
+        :param end_port: The final port destination
+        :param criteria: A RouteCriteria object
+        :param with_times: If True then (route, journey time) tuples are yielded instead of just the route.
+        :param limits: Optional SearchLimits object. The generator stops early and sets limits.truncated if a limit is
+                       hit. Only the routes that pass the criteria count towards the maximum number of results.
+        :return: generator of list of strings
+        :exception InvalidPortName: raised straight away if either port name is not valid.
+        """
+        return self._iter_routes_with_criteria(self.route_data, start_port, end_port, criteria, with_times, limits)
 
-    def get_number_of_routes(self, start_port, end_port, fn_count_filter):
+    def get_routes_with_criteria(self, start_port, end_port, criteria, limits=None):
         """
-        Given a start and end port this function returns the shortest route
+        Returns the routes between two ports that pass a criteria. The route search is pruned by the bounds of the
+        criteria as in iter_routes_with_criteria and the criteria is then checked over all of the routes found at once.
+        :param start_port: The start port
+        :param end_port: The final port destination
+        :param criteria: A RouteCriteria object
+        :param limits: Optional SearchLimits object to stop the search early with. Results that are cut short are not
+                       cached and limits.truncated is set.
+        :return: list of (route, journey time) tuples
+        :exception InvalidPortName: raised if either port name is not valid.
+        """
+        route_data = self.route_data
+
+        def compute():
+            if limits is not None:
+                # The criteria must be checked as the routes are found for the maximum number of results to count
+                # only the routes that pass it
+                return tuple((tuple(route), journey_time) for route, journey_time in
+                             self._iter_routes_with_criteria(route_data, start_port, end_port, criteria, True, limits))
+            max_stops, max_time = criteria.get_bounds()
+            routes = [(tuple(route), journey_time) for route, journey_time in
+                      self._iter_routes(route_data, start_port, end_port, max_stops, max_time, None)]
+            return tuple(criteria.filter_routes(routes))
+
+        routes = self._get_cached(route_data, ("routes_with_criteria", start_port, end_port, criteria), compute,
+                                  limits)
+        return [(list(route), journey_time) for route, journey_time in routes]
+
+    def get_number_of_routes(self, start_port, end_port, fn_count_filter, limits=None):
+        """
+        Given a start and end port this function returns the number of routes that pass the filter
         :param start_port: Name fo the starting port
         :param end_port: name of the End port
-        :param fn_count_filter: a lambda function that allows for data filtering
-        :return: The shortest number of days for the entire journey
+        :param fn_count_filter: a lambda function that is given the number of ports in a route and allows for data
+                                filtering, or a RouteCriteria object. Only the counts for a RouteCriteria are cached.
+        :param limits: Optional SearchLimits object to stop the search early with. Results that are cut short are not
+                       cached and limits.truncated is set.
+        :return: The number of routes or None if there are no routes
         """
-        routes = self.get_all_routes(start_port, end_port)
-        a = [route for route in routes if fn_count_filter(len(route))]
-        if len(a) == 0:
+        route_data = self.route_data
+
+        def compute():
+            if isinstance(fn_count_filter, RouteCriteria):
+                routes = self._iter_routes_with_criteria(route_data, start_port, end_port, fn_count_filter, False,
+                                                         limits)
+                return sum(1 for _ in routes)
+            routes = (route for route, _ in self._iter_routes(route_data, start_port, end_port, None, None, limits)
+                      if fn_count_filter(len(route)))
+            return sum(1 for _ in (routes if limits is None else limits.limit_results(routes)))
+
+        if isinstance(fn_count_filter, RouteCriteria):
+            count = self._get_cached(route_data, ("number_of_routes", start_port, end_port, fn_count_filter), compute,
+                                     limits)
+        else:
+            # A function may read state that changes between calls and is usually a new object on every call, so its
+            # count is never cached
+            with get_timer(self.stats, "query.number_of_routes"):
+                count = compute()
+        if count == 0:
             return None
-        return len(a)
+        return count
+
+    def count_routes_by_stops(self, start_port, end_port, max_stops, allow_revisits=False, limits=None):
+        """
+        Counts the routes between two ports for every number of stops up to a maximum without building the routes.
+        The number of stops is the number of ports in a route including the start and end port, which is the same as
+        the value given to the get_number_of_routes filter.
+        When revisits are allowed the routes may pass through the same port more than once and the counts are found
+        with dynamic programming over the route map in O(max_stops * E) time. Otherwise only routes that never revisit a
+        port are counted, which has no polynomial time solution, so a pruned route search is used instead.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param max_stops: The maximum number of stops to count routes for
+        :param allow_revisits: If True then routes may visit the same port more than once.
+        :param limits: Optional SearchLimits object to stop the route search early with when revisits are not allowed.
+                       Counts that are cut short are not cached and limits.truncated is set.
+        :return: dict of number of stops to the number of routes. Stop counts with no routes are not included.
+        """
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            start, end = graph.get_port_id(start_port), graph.get_port_id(end_port)
+            if allow_revisits:
+                return graph.count_walks_by_stops(start, end, max_stops)
+            routes = graph.iter_routes(start, end, max_stops, None, limits)
+            counts = Counter(len(route) for route, _ in (routes if limits is None else limits.limit_results(routes)))
+            return dict(sorted(counts.items()))
+
+        return dict(self._get_cached(route_data, ("routes_by_stops", start_port, end_port, max_stops, allow_revisits),
+                                     compute, limits))
 
-    def load_routes(self, filename):
+    def count_routes_by_time(self, start_port, end_port, max_time, allow_revisits=False, limits=None):
         """
-        Load route data from a YAML file
-        :param filename: yaml filename
-        :return: A data object that represents the yaml file content
+        Counts the routes between two ports for every total journey time up to a maximum without building the routes.
+        When revisits are allowed the routes may pass through the same port more than once and the counts are found
+        with dynamic programming over the journey time in O(max_time * E) time, which requires every journey time to be
+        a positive whole number of days. Otherwise only routes that never revisit a port are counted, which has no
+        polynomial time solution, so a pruned route search is used instead.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param max_time: The maximum total journey time in days to count routes for
+        :param allow_revisits: If True then routes may visit the same port more than once.
+        :param limits: Optional SearchLimits object to stop the route search early with when revisits are not allowed.
+                       Counts that are cut short are not cached and limits.truncated is set.
+        :return: dict of total journey time to the number of routes. Journey times with no routes are not included.
+        :exception ValueError: raised if revisits are allowed and a journey time is not a positive whole number.
         """
-        with open(filename) as han:
-            self.routes = yaml.load(han)
-        self._get_mapped_routes()
-        self._get_all_port_names()
+        route_data = self.route_data
+
+        def compute():
+            graph = route_data.graph
+            start, end = graph.get_port_id(start_port), graph.get_port_id(end_port)
+            if allow_revisits:
+                return graph.count_walks_by_time(start, end, max_time)
+            routes = graph.iter_routes(start, end, None, max_time, limits)
+            counts = Counter(time for _, time in (routes if limits is None else limits.limit_results(routes)))
+            return dict(sorted(counts.items()))
+
+        return dict(self._get_cached(route_data, ("routes_by_time", start_port, end_port, max_time, allow_revisits),
+                                     compute, limits))
+
+    def load_routes(self, filename, use_snapshot=False):
+        """
+        Load route data from a file, see route_loader.read_routes for the supported formats.
+        :param filename: The route filename
+        :param use_snapshot: If True then a compiled snapshot of the routes is saved next to the file the first time it
+                             is loaded and later loads read the snapshot instead of parsing the file, for as long as the
+                             file is unchanged.
+        """
+        if not use_snapshot:
+            with get_timer(self.stats, "read_routes"):
+                routes_list = read_routes(filename)
+            self.set_routes(routes_list)
+            return
+
+        snapshot_filename = get_snapshot_filename(filename)
+        source = get_file_signature(filename)
+        graph = None
+        if os.path.exists(snapshot_filename):
+            try:
+                with get_timer(self.stats, "load_snapshot"):
+                    graph = load_snapshot(snapshot_filename, source)
+            except STALE_FILE_ERRORS:
+                # The snapshot is damaged or from another version so it is rebuilt
+                graph = None
+        if graph is not None:
+            self._set_routes(list(graph.get_routes()), graph)
+            return
+        with get_timer(self.stats, "read_routes"):
+            routes_list = read_routes(filename)
+        with get_timer(self.stats, "build_graph"):
+            graph = RouteGraph(routes_list)
+        with get_timer(self.stats, "save_snapshot"):
+            save_snapshot(graph, snapshot_filename, source)
+        self._set_routes(routes_list, graph)
 
     def set_routes(self, routes_list):
-        self.routes = routes_list
-        self._get_mapped_routes()
-        self._get_all_port_names()
+        """
+        Sets the route data. Queries that are already running carry on with the old routes.
+        :param routes_list: list of route objects in the form of:
+        {"start": "<name>", "end":"<name>", "journey_time": <time in days>}
+        The list and the route objects must not be changed afterwards.
+        """
+        with get_timer(self.stats, "build_graph"):
+            graph = RouteGraph(routes_list)
+        self._set_routes(routes_list, graph)
+
+    def add_route(self, start_port, end_port, journey_time, departures=None):
+        """
+        Adds a single route without rebuilding the route data. New port names are allowed.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param journey_time: The journey time in days
+        :param departures: Optional departure days of the route, see route_graph.parse_departures
+        :exception InvalidRouteError: raised if there is already a route between the two ports.
+        :exception ValueError: raised if the departures are not valid.
+        """
+        parse_departures(departures)
+        route = {"start": start_port, "end": end_port, "journey_time": journey_time}
+        if departures is not None:
+            route["departures"] = departures
+
+        def change(route_data):
+            if (start_port, end_port) in route_data.route_times:
+                raise InvalidRouteError("The route %s => %s already exists." % (start_port, end_port),
+                                        {(start_port, end_port)})
+            graph = route_data.graph.copy()
+            graph.add_route(start_port, end_port, journey_time, departures)
+            return route_data.with_route(route, graph)
+
+        self._change_routes(change)
+
+    def remove_route(self, start_port, end_port):
+        """
+        Removes the route between two ports without rebuilding the route data. The port names remain valid even if no
+        routes to or from them are left.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :exception InvalidRouteError: raised if there is no route between the two ports.
+        """
+
+        def change(route_data):
+            self._check_route_exists(route_data, start_port, end_port)
+            graph = route_data.graph.copy()
+            graph.remove_route(graph.get_port_id(start_port), graph.get_port_id(end_port))
+            return route_data.without_route(start_port, end_port, graph)
+
+        self._change_routes(change)
+
+    def update_journey_time(self, start_port, end_port, journey_time):
+        """
+        Changes the journey time of the route between two ports without rebuilding the route data.
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :param journey_time: The new journey time in days
+        :exception InvalidRouteError: raised if there is no route between the two ports.
+        """
+
+        def change(route_data):
+            self._check_route_exists(route_data, start_port, end_port)
+            # Only the journey time changes so the reachability index of the old graph is kept
+            graph = route_data.graph.copy()
+            graph.set_journey_time(graph.get_port_id(start_port), graph.get_port_id(end_port), journey_time)
+            return route_data.with_journey_time(start_port, end_port, journey_time, graph)
+
+        self._change_routes(change)
+
+    def compute_distance_table(self, method="auto"):
+        """
+        Precomputes the shortest journey time between every pair of ports. Once computed get_shortest_journey is a
+        single lookup until the routes are changed.
+        :param method: The method to use, see DistanceTable.from_graph
+        :return: The DistanceTable object
+        """
+        route_data = self.route_data
+        with get_timer(self.stats, "compute_distance_table"):
+            distance_table = DistanceTable.from_graph(route_data.graph, method)
+        with self._change_lock:
+            # The routes may have been changed while the table was computed, in which case it is not kept
+            if self.route_data.graph is route_data.graph:
+                self._set_route_data(self.route_data.with_distance_table(distance_table), False)
+        return distance_table
+
+    def compute_landmarks(self, count=DEFAULT_LANDMARK_COUNT):
+        """
+        Chooses landmark ports and computes the journey times to and from them, which the "alt" method of
+        get_shortest_route uses to guide its search. They are kept until the routes are changed.
+        :param count: The most landmarks to choose
+        :return: The Landmarks object
+        """
+        return self._compute_landmarks(self.route_data, count)
+
+    def set_distance_table(self, distance_table):
+        """
+        Uses a distance table that was computed earlier, typically one loaded from a file.
+        :param distance_table: A DistanceTable object
+        :exception ValueError: raised if the distance table is for a different set of ports.
+        """
+        with self._change_lock:
+            if distance_table.port_names != self.route_data.graph.port_names:
+                raise ValueError("The distance table does not match the route data.")
+            self._set_route_data(self.route_data.with_distance_table(distance_table), False)
+
+    def enable_stats(self, stats=None):
+        """
+        Starts collecting the time spent loading and answering queries, and counters of the work done by the route
+        searches, in a stats object. Lazily yielded routes are counted but not timed since the time is shared with the
+        code that uses them.
+        :param stats: Optional RouteStats object to collect the stats in. A new one is created if not given.
+        :return: The RouteStats object
+        """
+        self.stats = stats if stats is not None else RouteStats()
+        self.route_data.graph.stats = self.stats
+        return self.stats
+
+    def get_stats(self):
+        """
+        :return: The stats dict from RouteStats.get_stats with the query cache statistics added under "cache", or
+                 None if stats are not being collected.
+        """
+        if self.stats is None:
+            return None
+        stats = self.stats.get_stats()
+        stats["cache"] = self.query_cache.get_stats()
+        return stats
 
     def get_route_data_with_criteria(self, start_port, target_port, fn_criteria):
         """
@@ -122,19 +683,112 @@ class RouteManager:
         {"start": "<name>", "end":"<name>", "journey_time": <time in days>}
         :return: list of routes.
         """
-        return [route for route in self.get_all_routes(start_port, target_port) if fn_criteria(route)]
+        return [route for route in self.iter_routes(start_port, target_port) if fn_criteria(route)]
+
+    def _set_routes(self, routes_list, graph):
+        """
+        Builds the indexes for a list of routes and swaps them in. The indexes are built before the change lock is taken
+        so that other changes and queries are not held up while they are.
+        :param routes_list: list of route objects
+        :param graph: The RouteGraph object for the routes
+        """
+        with get_timer(self.stats, "build_indexes"):
+            route_data = RouteData(routes_list, graph)
+        graph.stats = self.stats
+        with self._change_lock:
+            route_data.generation = self.route_data.generation + 1
+            self._set_route_data(route_data)
+
+    def _change_routes(self, fn_change):
+        """
+        Makes a single change to the routes. The new version of the route data is built before the change lock is taken
+        so that other changes are not held up, and is built again from the newer routes if another change was swapped
+        in first.
+        :param fn_change: A function given the current RouteData object that returns the changed one
+        """
+        while True:
+            route_data = self.route_data
+            changed_route_data = fn_change(route_data)
+            changed_route_data.graph.stats = self.stats
+            with self._change_lock:
+                if self.route_data.graph is route_data.graph:
+                    self._set_route_data(changed_route_data)
+                    return
+
+    def _set_route_data(self, route_data, routes_changed=True):
+        """
+        Swaps in a new version of the route data. The change lock must be held.
+        :param route_data: The RouteData object
+        :param routes_changed: True if the routes are different from the current ones, in which case the cached query
+                               results for the old routes are discarded, False if only the distance table or landmarks
+                               were added.
+        """
+        self.route_data = route_data
+        if routes_changed:
+            self.query_cache.clear()
+
+    def _compute_landmarks(self, route_data, count):
+        """
+        Computes the landmarks for a version of the route data and keeps them if it is still the current version.
+        :param route_data: The RouteData object
+        :param count: The most landmarks to choose
+        :return: The Landmarks object
+        """
+        with get_timer(self.stats, "compute_landmarks"):
+            landmarks = Landmarks.from_graph(route_data.graph, count)
+        with self._change_lock:
+            if self.route_data.graph is route_data.graph:
+                self._set_route_data(self.route_data.with_landmarks(landmarks), False)
+        return landmarks
+
+    def _iter_routes(self, route_data, start_port, end_port, max_stops, max_time, limits):
+        """
+        Yields (route, journey time) tuples as iter_routes does but for a given version of the route data and without
+        limiting the number of results, so that they can be filtered before they are counted.
+        """
+        graph = route_data.graph
+        routes = graph.iter_routes(graph.get_port_id(start_port), graph.get_port_id(end_port), max_stops, max_time,
+                                   limits)
+        return ((graph.get_port_route(route), journey_time) for route, journey_time in routes)
+
+    def _iter_routes_with_criteria(self, route_data, start_port, end_port, criteria, with_times, limits):
+        """
+        Yields the routes as iter_routes_with_criteria does but for a given version of the route data.
+        """
+        max_stops, max_time = criteria.get_bounds()
+        routes = self._iter_routes(route_data, start_port, end_port, max_stops, max_time, limits)
+        routes = ((route, journey_time) for route, journey_time in routes if criteria.matches(len(route), journey_time))
+        if limits is not None:
+            routes = limits.limit_results(routes)
+        if with_times:
+            return routes
+        return (route for route, _ in routes)
 
-    def _get_all_port_names(self):
+    def _get_cached(self, route_data, key, fn_compute, limits=None):
         """
-        Gets a complete list of all start and end port names
+        Gets a query result from the query cache, timing the query under its name when stats are being collected.
+        :param route_data: The RouteData object that the query is run on. Results are cached against its generation so
+                           that a query that started before the routes were changed never caches an old result for
+                           the new routes.
+        :param key: The cache key. The first item is the name of the query.
+        :param fn_compute: A function that computes the result if it is not cached
+        :param limits: Optional SearchLimits object that the query is run with. A query with limits may return partial
+                       results so it is always computed and never cached.
+        :return: The query result
         """
-        self.all_port_names = set([route["start"] for route in self.routes] + [route["end"] for route in self.routes])
+        with get_timer(self.stats, "query." + key[0]):
+            if limits is not None:
+                return fn_compute()
+            return self.query_cache.get_or_compute((route_data.generation,) + key, fn_compute)
 
-    def _get_mapped_routes(self):
+    def _check_route_exists(self, route_data, start_port, end_port):
         """
-        Creates a dictionary where the keys are all of the ports you can start from and the values are a list of
-        destinations and times to the next port.
-        :return: dict
+        Checks that there is a direct route between two ports.
+        :param route_data: The RouteData object to check
+        :param start_port: Name of the starting port
+        :param end_port: Name of the end port
+        :exception InvalidRouteError: raised if there is no route between the two ports.
         """
-        self.mapped_routes = {route["start"]: [route2 for route2 in self.routes if route2["start"] == route["start"]]
-                              for route in self.routes}
+        if (start_port, end_port) not in route_data.route_times:
+            raise InvalidRouteError("The route %s => %s does not exist." % (start_port, end_port),
+                                    {(start_port, end_port)})
@@ -0,0 +1,186 @@
+from exceptions import InvalidRouteError, InvalidPortName, UnreachablePortError
+from route_criteria import RouteCriteria
+from search_limits import SearchLimits
+
+
+def run_query(route_manager, query, timeout=None, max_results=None):
+    """
+    Answers a single query against a route manager. Queries and their results are plain dicts so that they can be sent
+    as JSON. The query types are the same as the command line commands:
+        {"type": "direct-route-time", "route": [<port name>, ...]}
+            => {"journey_time": <days>}
+        {"type": "reachable", "start_port": <name>, "target_port": <name>}
+            => {"reachable": <true or false>}
+        {"type": "shortest-route", "start_port": <name>, "target_port": <name>, "method": <optional>}
+            => {"shortest_time": <days or None>, "routes": [[<port name>, ...], ...]}
+            Every tied route is returned unless a "method" of get_shortest_route other than "dijkstra" is given, in
+            which case there is only one.
+        {"type": "earliest-arrival", "start_port": <name>, "target_port": <name>, "departure_day": <day>}
+            => {"arrival_day": <day or None>, "legs": [{"start": <port name>, "end": <port name>,
+                "departure_day": <day>, "arrival_day": <day>}, ...]}
+        {"type": "routes-top-k", "start_port": <name>, "target_port": <name>, "k": <number of routes>}
+            => {"routes": [{"route": [<port name>, ...], "journey_time": <days>}, ...]}
+        {"type": "pareto-routes", "start_port": <name>, "target_port": <name>, "max_stops": <optional>}
+            => {"routes": [{"route": [<port name>, ...], "journey_time": <days>}, ...]}
+        {"type": "show-routes", "start_port": <name>, "target_port": <name>, "max_stops": <optional>,
+         "max_time": <optional>}
+            => {"routes": [{"route": [<port name>, ...], "journey_time": <days>}, ...]}
+        {"type": "routes-with-stops" or "routes-with-time", "start_port": <name>, "target_port": <name>,
+         "criteria": "<=10"}
+            => {"routes": [{"route": [<port name>, ...], "journey_time": <days>}, ...]}
+        {"type": "routes-with-criteria", "start_port": <name>, "target_port": <name>,
+         "criteria": "stops<=4 and time<20"}
+            => {"routes": [{"route": [<port name>, ...], "journey_time": <days>}, ...]}
+    The queries that return a list of routes can also have a "timeout" in seconds and a "limit" on the number of
+    routes. If either is given, or the caller sets one, then the result also has "truncated" set to true or false and
+    "truncated_reason" set to the name of the limit that cut the routes short, see SearchLimits.
+    :param route_manager: The RouteManager object to query
+    :param query: The query dict
+    :param timeout: Optional maximum timeout in seconds for the queries that return a list of routes, whatever the
+                    query asks for
+    :param max_results: Optional maximum number of routes for the queries that return a list of routes, whatever the
+                        query asks for
+    :return: The result dict
+    :exception InvalidPortName: raised if a port name is not valid.
+    :exception InvalidRouteError: raised if a route is not valid.
+    :exception ValueError: raised if the query is not valid.
+    """
+    query_type = query.get("type")
+    if query_type == "direct-route-time":
+        return {"journey_time": route_manager.get_direct_route_time(query["route"])}
+
+    if query_type == "reachable":
+        return {"reachable": route_manager.is_reachable(query["start_port"], query["target_port"])}
+
+    if query_type == "shortest-route":
+        method = query.get("method", "dijkstra")
+        if method == "dijkstra":
+            shortest_time, routes = route_manager.get_shortest_routes(query["start_port"], query["target_port"])
+        else:
+            shortest_time, route = route_manager.get_shortest_route(query["start_port"], query["target_port"], method)
+            routes = [] if route is None else [route]
+        return {"shortest_time": shortest_time, "routes": routes}
+
+    if query_type == "earliest-arrival":
+        departure_day = query["departure_day"]
+        if isinstance(departure_day, bool) or not isinstance(departure_day, (int, float)):
+            raise ValueError("The departure day must be a number.", departure_day)
+        arrival_day, legs = route_manager.get_earliest_arrival(query["start_port"], query["target_port"],
+                                                               departure_day)
+        return {"arrival_day": arrival_day,
+                "legs": [{"start": start, "end": end, "departure_day": sail_day, "arrival_day": arrival}
+                         for start, end, sail_day, arrival in legs]}
+
+    limits = get_query_limits(query, timeout, max_results)
+    if query_type == "routes-top-k":
+        k = query["k"]
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            raise ValueError("The number of routes k must be a positive whole number.", k)
+        routes = route_manager.get_k_shortest_routes(query["start_port"], query["target_port"], k, limits=limits)
+    elif query_type == "pareto-routes":
+        routes = route_manager.get_pareto_routes(query["start_port"], query["target_port"], query.get("max_stops"),
+                                                 limits=limits)
+    elif query_type == "show-routes":
+        routes = route_manager.iter_routes(query["start_port"], query["target_port"], query.get("max_stops"),
+                                           query.get("max_time"), with_times=True, limits=limits)
+    elif query_type in ("routes-with-stops", "routes-with-time", "routes-with-criteria"):
+        if query_type == "routes-with-criteria":
+            criteria = RouteCriteria.parse(query["criteria"])
+        else:
+            criteria = RouteCriteria.from_string("stops" if query_type == "routes-with-stops" else "time",
+                                                 query["criteria"])
+        routes = route_manager.iter_routes_with_criteria(query["start_port"], query["target_port"], criteria,
+                                                         with_times=True, limits=limits)
+    else:
+        raise ValueError("Unknown query type %s." % query_type, query_type)
+    result = {"routes": [{"route": route, "journey_time": journey_time} for route, journey_time in routes]}
+    if limits is not None:
+        result["truncated"] = limits.truncated
+        result["truncated_reason"] = limits.reason
+    return result
+
+
+def get_query_limits(query, timeout=None, max_results=None):
+    """
+    Creates the search limits for a query from its "timeout" and "limit" fields.
+    :param query: The query dict
+    :param timeout: Optional maximum timeout in seconds, which is used if the query asks for a longer one or none
+    :param max_results: Optional maximum number of routes, which is used if the query asks for more or no limit
+    :return: A SearchLimits object or None if there are no limits
+    :exception ValueError: raised if the timeout or limit in the query is not a positive number.
+    """
+    query_timeout, query_limit = query.get("timeout"), query.get("limit")
+    if query_timeout is not None and (isinstance(query_timeout, bool) or not isinstance(query_timeout, (int, float)) or
+                                      query_timeout <= 0):
+        raise ValueError("The timeout must be a positive number of seconds.", query_timeout)
+    if query_limit is not None and (isinstance(query_limit, bool) or not isinstance(query_limit, int) or
+                                    query_limit < 1):
+        raise ValueError("The limit must be a positive whole number.", query_limit)
+    timeout = _get_smallest(query_timeout, timeout)
+    max_results = _get_smallest(query_limit, max_results)
+    if timeout is None and max_results is None:
+        return None
+    return SearchLimits(timeout, max_results)
+
+
+def run_query_safely(route_manager, query, timeout=None, max_results=None):
+    """
+    Answers a query like run_query except that errors are returned in the result rather than raised.
+    :param route_manager: The RouteManager object to query
+    :param query: The query dict
+    :param timeout: Optional maximum timeout in seconds, see run_query
+    :param max_results: Optional maximum number of routes, see run_query
+    :return: The result dict or an error dict in the form of:
+    {"error": <exception class name>, "message": <description>, "details": <port name, invalid routes or value>}
+    """
+    try:
+        return run_query(route_manager, query, timeout, max_results)
+    except InvalidPortName as ex:
+        return get_error_result(ex, ex.args[1])
+    except InvalidRouteError as ex:
+        # The invalid parts of the route are a set of tuples which are sent as a list of lists
+        details = [list(f) for f in ex.args[1]] if len(ex.args) > 1 else []
+        return get_error_result(ex, details)
+    except KeyError as ex:
+        return {"error": "ValueError", "message": "The query is missing the %s field." % ex.args[0],
+                "details": ex.args[0]}
+    except (ValueError, TypeError, AttributeError) as ex:
+        return get_error_result(ex, ex.args[1] if len(ex.args) > 1 else None)
+
+
+def get_error_result(ex, details):
+    """
+    :param ex: The exception that stopped a query
+    :param details: The details of the error that can be sent as JSON
+    :return: The error result dict for an exception
+    """
+    return {"error": type(ex).__name__, "message": str(ex.args[0]) if ex.args else "", "details": details}
+
+
+def raise_error_result(result):
+    """
+    Raises the exception described by an error result so that a client sees the same errors as a local query.
+    :param result: A result dict
+    :return: The result if it is not an error
+    :exception InvalidPortName: raised if the result is an InvalidPortName error.
+    :exception InvalidRouteError: raised if the result is an InvalidRouteError error.
+    :exception UnreachablePortError: raised if the result is an UnreachablePortError error.
+    :exception ValueError: raised for any other error.
+    """
+    if "error" not in result:
+        return result
+    if result["error"] == "InvalidPortName":
+        raise InvalidPortName(result["message"], result["details"])
+    if result["error"] == "InvalidRouteError":
+        raise InvalidRouteError(result["message"], {tuple(f) for f in result["details"]})
+    if result["error"] == "UnreachablePortError":
+        raise UnreachablePortError(result["message"], {tuple(f) for f in result["details"]})
+    raise ValueError(result["message"], result["details"])
+
+
+def _get_smallest(*values):
+    """
+    :return: The smallest of the values that are not None, or None if they all are
+    """
+    values = [f for f in values if f is not None]
+    return min(values) if values else None
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from exceptions import UnreachablePortError
+from route_queries import raise_error_result, run_query_safely
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# The number of queries that a server answers at the same time
+DEFAULT_WORKERS = 4
+
+
+class RouteServer:
+    """
+    Answers route queries for a route manager over a local socket so that the routes only need to be loaded once.
+    The protocol is JSON lines: each line sent by a client is a query dict (see route_queries.run_query) and the server
+    replies with one line holding the result dict. Any number of clients can be connected at the same time and each
+    one can send any number of queries. The queries are answered on a pool of worker threads rather than on the event
+    loop, so a slow query from one client does not hold up the queries from the others.
+    """
+
+    def __init__(self, route_manager, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None, max_results=None,
+                 workers=DEFAULT_WORKERS):
+        """
+        :param route_manager: The RouteManager object to answer queries with
+        :param host: The host name or address to listen on
+        :param port: The port to listen on. Use 0 to pick a free port.
+        :param timeout: Optional maximum number of seconds that a query for a list of routes may run for. This stops
+                        a few slow queries from taking up every worker thread.
+        :param max_results: Optional maximum number of routes that a query may return
+        :param workers: The number of worker threads that answer queries
+        """
+        self.route_manager = route_manager
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_results = max_results
+        self.workers = workers
+        self.server = None
+        self._executor = None
+
+    async def start(self):
+        """
+        Starts listening for clients.
+        :return: The (host, port) address that the server is listening on
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers)
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        """
+        Stops listening for clients.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        self._shutdown_executor()
+
+    def serve_forever(self, fn_started=None):
+        """
+        Starts the server and answers queries until the process is stopped.
+        :param fn_started: Optional function that is called with the (host, port) address once the server is listening
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            address = loop.run_until_complete(self.start())
+            if fn_started is not None:
+                fn_started(address)
+            loop.run_forever()
+        finally:
+            self._shutdown_executor()
+            loop.close()
+
+    async def _handle_client(self, reader, writer):
+        """
+        Answers the queries from a single client until it disconnects.
+        :param reader: The asyncio stream reader for the client
+        :param writer: The asyncio stream writer for the client
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = await loop.run_in_executor(self._executor, self._answer, line)
+                writer.write(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _answer(self, line):
+        """
+        Answers one query line. This runs on a worker thread.
+        :param line: The bytes of the query line
+        :return: The bytes of the reply line
+        """
+        try:
+            query = json.loads(line.decode("UTF8"))
+        except ValueError as ex:
+            result = {"error": "ValueError", "message": "The query is not valid JSON. %s" % ex, "details": None}
+        else:
+            result = run_query_safely(self.route_manager, query, self.timeout, self.max_results)
+        return json.dumps(result).encode("UTF8") + b"\n"
+
+    def _shutdown_executor(self):
+        """
+        Stops the worker threads once the queries they are answering are done.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class RouteClient:
+    """
+    A thin client for a RouteServer. It offers the same query functions as RouteManager, and raises the same exceptions,
+    so it can be used in place of a RouteManager to answer queries.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        """
+        :param host: The host name or address of the server
+        :param port: The port of the server
+        :param timeout: Optional socket timeout in seconds
+        """
+        self._socket = socket.create_connection((host, port), timeout)
+        self._file = self._socket.makefile("rwb")
+
+    @classmethod
+    def from_address(cls, address):
+        """
+        :param address: The server address in the form of HOST:PORT
+        :return: A RouteClient object connected to the server
+        """
+        host, _, port = address.rpartition(":")
+        return cls(host or DEFAULT_HOST, int(port))
+
+    def close(self):
+        """Disconnects from the server"""
+        self._file.close()
+        self._socket.close()
+
+    def query(self, query):
+        """
+        Sends a query to the server and waits for its result.
+        :param query: The query dict, see route_queries.run_query
+        :return: The result dict, which may be an error result
+        """
+        self._file.write(json.dumps(query).encode("UTF8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The route server closed the connection.")
+        return json.loads(line.decode("UTF8"))
+
+    def get_direct_route_time(self, destinations):
+        """See RouteManager.get_direct_route_time"""
+        return self._query({"type": "direct-route-time", "route": list(destinations)})["journey_time"]
+
+    def is_reachable(self, start_port, end_port):
+        """See RouteManager.is_reachable"""
+        return self._query({"type": "reachable", "start_port": start_port, "target_port": end_port})["reachable"]
+
+    def check_reachable(self, start_port, end_port):
+        """See RouteManager.check_reachable"""
+        if not self.is_reachable(start_port, end_port):
+            raise UnreachablePortError("There is no route from %s to %s." % (start_port, end_port),
+                                       {(start_port, end_port)})
+
+    def get_shortest_journey(self, start_port, end_port):
+        """See RouteManager.get_shortest_journey"""
+        shortest_time, _ = self.get_shortest_route(start_port, end_port)
+        return shortest_time
+
+    def get_shortest_route(self, start_port, end_port, method="bidirectional"):
+        """See RouteManager.get_shortest_route"""
+        result = self._query({"type": "shortest-route", "start_port": start_port, "target_port": end_port,
+                              "method": method})
+        return result["shortest_time"], result["routes"][0] if result["routes"] else None
+
+    def get_shortest_routes(self, start_port, end_port):
+        """See RouteManager.get_shortest_routes"""
+        result = self._query({"type": "shortest-route", "start_port": start_port, "target_port": end_port})
+        return result["shortest_time"], result["routes"]
+
+    def get_earliest_arrival(self, start_port, end_port, departure_day):
+        """See RouteManager.get_earliest_arrival"""
+        result = self._query({"type": "earliest-arrival", "start_port": start_port, "target_port": end_port,
+                              "departure_day": departure_day})
+        return result["arrival_day"], [(f["start"], f["end"], f["departure_day"], f["arrival_day"])
+                                       for f in result["legs"]]
+
+    def get_k_shortest_routes(self, start_port, end_port, k, limits=None):
+        """See RouteManager.get_k_shortest_routes"""
+        result = self._query_routes({"type": "routes-top-k", "start_port": start_port, "target_port": end_port, "k": k},
+                                    limits)
+        return [(f["route"], f["journey_time"]) for f in result["routes"]]
+
+    def get_pareto_routes(self, start_port, end_port, max_stops=None, limits=None):
+        """See RouteManager.get_pareto_routes"""
+        result = self._query_routes({"type": "pareto-routes", "start_port": start_port, "target_port": end_port,
+                                     "max_stops": max_stops}, limits)
+        return [(f["route"], f["journey_time"]) for f in result["routes"]]
+
+    def get_all_routes(self, start_port, end_port, limits=None):
+        """See RouteManager.get_all_routes"""
+        return list(self.iter_routes(start_port, end_port, limits=limits))
+
+    def iter_routes(self, start_port, end_port, max_stops=None, max_time=None, with_times=False, limits=None):
+        """See RouteManager.iter_routes. The routes are all sent by the server before the first one is returned."""
+        result = self._query_routes({"type": "show-routes", "start_port": start_port, "target_port": end_port,
+                                     "max_stops": max_stops, "max_time": max_time}, limits)
+        if with_times:
+            return ((f["route"], f["journey_time"]) for f in result["routes"])
+        return (f["route"] for f in result["routes"])
+
+    def iter_routes_with_criteria(self, start_port, end_port, criteria, with_times=False, limits=None):
+        """See RouteManager.iter_routes_with_criteria. The criteria is checked by the server."""
+        result = self._query_routes({"type": "routes-with-criteria", "start_port": start_port,
+                                     "target_port": end_port, "criteria": str(criteria)}, limits)
+        if with_times:
+            return ((f["route"], f["journey_time"]) for f in result["routes"])
+        return (f["route"] for f in result["routes"])
+
+    def _query(self, query):
+        """
+        Sends a query to the server and raises any error it returns.
+        :param query: The query dict
+        :return: The result dict
+        """
+        return raise_error_result(self.query(query))
+
+    def _query_routes(self, query, limits):
+        """
+        Sends a query for a list of routes to the server with the timeout and result limit of a SearchLimits object,
+        and marks the limits as truncated if the server cut the routes short. Cancelling the limits has no effect once
+        the query has been sent.
+        :param query: The query dict
+        :param limits: A SearchLimits object or None
+        :return: The result dict
+        """
+        if limits is not None:
+            if not limits.check():
+                return {"routes": []}
+            query = dict(query, timeout=limits.get_remaining_time(), limit=limits.max_results)
+        result = self._query(query)
+        if limits is not None and result.get("truncated"):
+            limits.stop(result["truncated_reason"])
+        return result
@@ -0,0 +1,95 @@
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows so the peak memory is not reported there
+    resource = None
+
+
+class _NullTimer:
+    """A timer that does nothing, used when no stats are being collected so that timing costs almost nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class RouteStats:
+    """
+    Collects the time spent in each phase of loading and querying routes along with counters of the work done by the
+    route searches, such as the number of ports expanded, routes yielded and branches pruned.
+    Nothing is collected unless a RouteStats object is given to the RouteManager, so there is next to no cost when the
+    stats are not wanted.
+    """
+
+    def __init__(self):
+        # dict of phase name to [number of calls, total seconds]
+        self.timers = {}
+        # dict of counter name to count
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Times the code run in a with block and adds it to the named phase.
+        :param name: The name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += time.perf_counter() - start
+
+    def add(self, name, count=1):
+        """
+        Adds to a counter.
+        :param name: The name of the counter
+        :param count: The amount to add
+        """
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def reset(self):
+        """Clears every timer and counter"""
+        self.timers.clear()
+        self.counters.clear()
+
+    def get_stats(self):
+        """
+        :return: dict in the form of:
+        {"timers": {<phase>: {"calls": <number of calls>, "seconds": <total seconds>}, ...},
+         "counters": {<counter>: <count>, ...}, "peak_memory_bytes": <peak memory of the process or None>}
+        """
+        return {"timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in
+                           sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "peak_memory_bytes": get_peak_memory()}
+
+
+def get_timer(stats, name):
+    """
+    :param stats: A RouteStats object or None if no stats are being collected
+    :param name: The name of the phase to time
+    :return: A context manager that times a with block, which does nothing if stats is None
+    """
+    return _NULL_TIMER if stats is None else stats.timer(name)
+
+
+def get_peak_memory():
+    """
+    :return: The peak resident memory of this process in bytes, or None if it cannot be found on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports the size in kilobytes and macOS in bytes
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,106 @@
+import time
+
+# The deadline is only checked every this many ports expanded since reading the clock costs more than an expansion
+_DEADLINE_CHECK_INTERVAL = 64
+
+
+class SearchLimits:
+    """
+    Limits how long a route search may run and how many routes it may return, and lets it be cancelled from another
+    thread. A search that hits a limit stops and returns the routes it found so far, setting truncated to True and the
+    reason to the name of the limit ("timeout", "max_results", "max_expansions" or "cancelled").
+    A SearchLimits object is used for a single query. The timeout is counted from when the object is created.
+    """
+
+    def __init__(self, timeout=None, max_results=None, max_expansions=None):
+        """
+        :param timeout: Optional number of seconds that the search may run for
+        :param max_results: Optional maximum number of routes to return
+        :param max_expansions: Optional maximum number of ports that the search may expand
+        """
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.max_results = max_results
+        self.max_expansions = max_expansions
+        self.expansions = 0
+        self.results = 0
+        self.truncated = False
+        self.reason = None
+        self._cancelled = False
+
+    def cancel(self):
+        """
+        Asks the search to stop at its next check. This can be called from any thread.
+        """
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """True if cancel has been called"""
+        return self._cancelled
+
+    def get_remaining_time(self):
+        """
+        :return: The number of seconds left before the deadline, which is never less than 0, or None if there is no
+                 timeout.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def add_expansion(self):
+        """
+        Called by a search each time it expands a port.
+        :return: True if the search may carry on, False if it must stop.
+        """
+        self.expansions += 1
+        if self.max_expansions is not None and self.expansions > self.max_expansions:
+            return self.stop("max_expansions")
+        if self.expansions % _DEADLINE_CHECK_INTERVAL == 0:
+            return self.check()
+        return True
+
+    def add_result(self):
+        """
+        Called by a search before it returns a route.
+        :return: True if the route may be returned, False if the search must stop without returning it.
+        """
+        if self.max_results is not None and self.results >= self.max_results:
+            return self.stop("max_results")
+        if not self.check():
+            return False
+        self.results += 1
+        return True
+
+    def limit_results(self, results):
+        """
+        Yields results from an iterable, stopping early if a limit is hit.
+        :param results: An iterable of results, typically a route search generator
+        :return: generator of the results
+        """
+        for result in results:
+            if not self.add_result():
+                return
+            yield result
+
+    def check(self):
+        """
+        Checks whether the search has been cancelled or has run out of time.
+        :return: True if the search may carry on, False if it must stop.
+        """
+        if self._cancelled:
+            return self.stop("cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            return self.stop("timeout")
+        return True
+
+    def stop(self, reason):
+        """
+        Marks the results as truncated.
+        :param reason: The name of the limit that stopped the search
+        :return: False so that it can be returned by the checks
+        """
+        self.truncated = True
+        if self.reason is None:
+            self.reason = reason
+        return False
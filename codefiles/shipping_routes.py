@@ -1,15 +1,24 @@
 import argparse
+import cProfile
+import json
 import logging
 import os
-import re
 import sys
 
 # This line ensures that we can refer to the parent folders as a source root and allows modules to refer to the
 # codefiles folder
 sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "..")))
 
-from exceptions import InvalidRouteError, InvalidPortName
-from route_manager import RouteManager
+from distance_table import DistanceTable, get_distance_table_filename
+from exceptions import InvalidRouteError, InvalidPortName, UnreachablePortError
+from route_analysis import analyse_route_counts, analyse_shortest_times
+from route_batch import iter_batch_results
+from route_loader import STALE_FILE_ERRORS, get_file_signature
+from route_criteria import RouteCriteria
+from route_manager import SHORTEST_ROUTE_METHODS, RouteManager
+from route_server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WORKERS, RouteClient, RouteServer
+from route_stats import RouteStats, get_timer
+from search_limits import SearchLimits
 
 # The version number of this script
 __this_version = "1.0.0"
@@ -70,6 +79,24 @@ def process_command_line():
         "%s v%s - This script provides information on shipping routes." % (get_script_name(), get_version()))
     parser.add_argument("-l", "--log-filename", dest="log_filename", help="Specify the output log filename.",
                         default=None)
+    parser.add_argument("-s", "--snapshot", dest="use_snapshot", action="store_true", default=False,
+                        help="Save a compiled snapshot of the routes file the first time it is read and use it on "
+                             "later runs until the routes file changes.")
+    parser.add_argument("-c", "--client", dest="client", action="store_true", default=False,
+                        help="Send the query to a server started with the serve command instead of loading the routes. "
+                             "The routes filename must then be the HOST:PORT address of the server.")
+    parser.add_argument("--stats", dest="show_stats", action="store_true", default=False,
+                        help="Log the time spent in each phase of the command, counters of the work done by the route "
+                             "searches and the peak memory used once the command has finished.")
+    parser.add_argument("--profile", dest="profile_filename", default=None,
+                        help="Profile the command with cProfile and save the profile to this file. It can be read "
+                             "with the pstats module.")
+    parser.add_argument("--timeout", dest="timeout", type=float, default=None,
+                        help="Stop listing routes after this many seconds and show the routes found so far. For the "
+                             "serve and batch commands this is the longest that any one query may run for.")
+    parser.add_argument("--limit", dest="limit", type=_get_positive_int, default=None,
+                        help="The most routes to list. For the serve and batch commands this is the most routes that "
+                             "any one query may return.")
     subparsers = parser.add_subparsers(help='sub-command help')
 
     drt_parser = subparsers.add_parser("direct-route-time", help="Find out the total time for a specific route.")
@@ -77,19 +104,57 @@ def process_command_line():
                             help='A space-separated list of ports to find the total journey time for. if port names '
                                  'are made up of multiple words, please use quotes. i.e. '
                                  '"Buenos Aires" Cassablanca ...')
-    drt_parser.set_defaults(func=direct_route_time)
+    drt_parser.set_defaults(func=direct_route_time, supports_client=True)
 
     sj_parser = subparsers.add_parser("shortest-route",
                                       help="Find the shortest route given a starting and a target port.")
     sj_parser.add_argument(dest="start_port", help="The port to start from.")
     sj_parser.add_argument(dest="target_port", help="The target port to arrive at.")
-    sj_parser.set_defaults(func=shortest_route)
+    sj_parser.add_argument("-m", "--method", dest="method", choices=SHORTEST_ROUTE_METHODS, default="dijkstra",
+                           help="dijkstra shows every route with the shortest journey time. bidirectional and alt "
+                                "(A* with landmarks) only show one but explore far fewer ports on large route maps.")
+    sj_parser.add_argument("--no-distance-table", dest="use_distance_table", action="store_false",
+                           help="Search the routes even if a precomputed distance table is up to date.")
+    sj_parser.set_defaults(func=shortest_route, use_distance_table=True, supports_client=True)
+
+    pc_parser = subparsers.add_parser("precompute",
+                                      help="Precompute the shortest journey time between every pair of ports and save "
+                                           "it next to the routes file so that shortest-route becomes a lookup.")
+    pc_parser.add_argument("-m", "--method", dest="method", choices=["auto", "floyd-warshall", "dijkstra"],
+                           default="auto", help="The method used to compute the journey times.")
+    pc_parser.set_defaults(func=precompute)
+
+    ea_parser = subparsers.add_parser("earliest-arrival",
+                                      help="Find the earliest day that the target port can be reached when leaving "
+                                           "the start port on a given day, waiting for the sailings of routes that "
+                                           "have departure days.")
+    ea_parser.add_argument(dest="start_port", help="The port to start from.")
+    ea_parser.add_argument(dest="target_port", help="The target port to arrive at.")
+    ea_parser.add_argument(dest="departure_day", type=_get_day, help="The earliest day to leave the start port.")
+    ea_parser.set_defaults(func=earliest_arrival, supports_client=True)
+
+    tk_parser = subparsers.add_parser("routes-top-k",
+                                      help="Shows the k quickest routes from start to target port.")
+    tk_parser.add_argument(dest="start_port", help="The port to start from.")
+    tk_parser.add_argument(dest="target_port", help="The target port to arrive at.")
+    tk_parser.add_argument(dest="k", type=_get_positive_int, help="The number of routes to show.")
+    tk_parser.set_defaults(func=routes_top_k, supports_client=True)
+
+    pr_parser = subparsers.add_parser("pareto-routes",
+                                      help="Shows the routes from start to target port that trade journey time "
+                                           "against the number of stops, each quicker than every route with fewer "
+                                           "stops.")
+    pr_parser.add_argument(dest="start_port", help="The port to start from.")
+    pr_parser.add_argument(dest="target_port", help="The target port to arrive at.")
+    pr_parser.add_argument("--max-stops", dest="max_stops", type=int, default=None,
+                           help="The most ports, including the start and target port, that a route may have.")
+    pr_parser.set_defaults(func=pareto_routes, supports_client=True)
 
     nr_parser = subparsers.add_parser("show-routes",
                                       help="Shows how many possible routes from start to target port.")
     nr_parser.add_argument(dest="start_port", help="The port to start from.")
     nr_parser.add_argument(dest="target_port", help="The target port to arrive at.")
-    nr_parser.set_defaults(func=show_routes)
+    nr_parser.set_defaults(func=show_routes, supports_client=True)
 
     rws_parser = subparsers.add_parser("routes-with-stops",
                                        help="Shows the routes from start to target port that meets the number of stops "
@@ -97,7 +162,7 @@ def process_command_line():
     rws_parser.add_argument(dest="start_port", help="The port to start from.")
     rws_parser.add_argument(dest="target_port", help="The target port to arrive at.")
     rws_parser.add_argument(dest="criteria", help="The filter criteria. i.e. ==5 or <=10")
-    rws_parser.set_defaults(func=route_length_with_criteria)
+    rws_parser.set_defaults(func=route_length_with_criteria, supports_client=True)
 
     rwt_parser = subparsers.add_parser("routes-with-time",
                                        help="Shows the routes from start to target port that meets the total time "
@@ -107,10 +172,45 @@ def process_command_line():
     rwt_parser.add_argument(dest="criteria", help='The filter criteria. i.e. "==5" or "<=10". NOTE: Always enclose '
                                                   'the criteria in quotes to avoid it being misinterpreted by the '
                                                   'command line processor.')
-    rwt_parser.set_defaults(func=route_time_with_criteria)
+    rwt_parser.set_defaults(func=route_time_with_criteria, supports_client=True)
+
+    bt_parser = subparsers.add_parser("batch",
+                                      help="Answer a stream of JSON lines queries, writing one JSON line result for "
+                                           "each query. Errors are reported in the results instead of stopping.")
+    bt_parser.add_argument("-i", "--input", dest="input_filename", default="-",
+                           help="The file to read the queries from. Defaults to stdin.")
+    bt_parser.add_argument("-o", "--output", dest="output_filename", default="-",
+                           help="The file to write the results to. Defaults to stdout.")
+    bt_parser.set_defaults(func=batch)
+
+    an_parser = subparsers.add_parser("analyse",
+                                      help="Analyse the whole network from every origin port in parallel and write the "
+                                           "results as JSON.")
+    an_parser.add_argument("-m", "--metric", dest="metric", choices=["shortest-times", "route-counts"],
+                           default="shortest-times",
+                           help="shortest-times finds the shortest journey time between every pair of ports. "
+                                "route-counts counts the routes, which may revisit ports, between every pair of ports.")
+    an_parser.add_argument("--max-stops", dest="max_stops", type=int, default=5,
+                           help="The maximum number of stops in a route for the route-counts metric.")
+    an_parser.add_argument("-p", "--processes", dest="processes", type=_get_positive_int, default=None,
+                           help="The number of processes to use. Defaults to the number of CPUs.")
+    an_parser.add_argument("--origin", dest="origin_ports", action="append", default=None,
+                           help="Only analyse routes from this port. May be given more than once.")
+    an_parser.add_argument("-o", "--output", dest="output_filename", default="-",
+                           help="The file to write the results to. Defaults to stdout.")
+    an_parser.set_defaults(func=analyse)
+
+    sv_parser = subparsers.add_parser("serve",
+                                      help="Load the routes once and answer queries from clients over a local socket.")
+    sv_parser.add_argument("--host", dest="host", default=DEFAULT_HOST, help="The address to listen on.")
+    sv_parser.add_argument("--port", dest="port", type=int, default=DEFAULT_PORT, help="The port to listen on.")
+    sv_parser.add_argument("--workers", dest="workers", type=_get_positive_int, default=DEFAULT_WORKERS,
+                           help="The number of queries to answer at the same time.")
+    sv_parser.set_defaults(func=serve)
 
     parser.add_argument(dest="routes_filename",
-                        help="Specify the filename of a yml file that contains all of the routes.")
+                        help="Specify the filename of a yml, csv or jsonl file that contains all of the routes, or "
+                             "the HOST:PORT address of a server when the --client option is used.")
 
     return parser.parse_args()
 
@@ -119,12 +219,12 @@ def direct_route_time(args, **kwargs):
     """
     Show the total direct route time given a list of ports
     :param args: arguments from the command line
-    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
     :return: None
     """
     log = get_logger()
     rm = kwargs["route_manager"]
-    assert isinstance(rm, RouteManager)
     route = args.route_list
     full_journey = " => ".join(route)
     log.info("The total time for the route %s is %s days.\n" % (full_journey, rm.get_direct_route_time(route)))
@@ -134,25 +234,41 @@ def shortest_route(args, **kwargs):
     """
     Show the shortest route(s) given the start and target port.
     :param args: arguments from the command line
-    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object and may contain a key called "distance_table" which points to a DistanceTable object to use
+                   instead. The distance table is only given for the dijkstra method, see _uses_distance_table.
     :return: None
     """
     log = get_logger()
-    rm = kwargs["route_manager"]
-    assert isinstance(rm, RouteManager)
-    shortest_time = rm.get_shortest_journey(args.start_port, args.target_port)
+    distance_table = kwargs.get("distance_table")
     message = "Shortest journey time is:\n"
-    routes = rm.get_all_routes(args.start_port, args.target_port)
+    if distance_table is not None:
+        # Only one of the shortest routes is stored in the distance table
+        shortest_time = distance_table.get_shortest_journey(args.start_port, args.target_port)
+        if shortest_time is None:
+            raise UnreachablePortError("There is no route from %s to %s." % (args.start_port, args.target_port),
+                                       {(args.start_port, args.target_port)})
+        routes = [distance_table.get_shortest_route(args.start_port, args.target_port)]
+        message = "Shortest journey time is (one route from the precomputed distance table, run with " \
+                  "--no-distance-table to show every tied route):\n"
+    else:
+        rm = kwargs["route_manager"]
+        rm.check_reachable(args.start_port, args.target_port)
+        if args.method == "dijkstra":
+            shortest_time, routes = rm.get_shortest_routes(args.start_port, args.target_port)
+        else:
+            shortest_time, route = rm.get_shortest_route(args.start_port, args.target_port, args.method)
+            routes = [route]
 
-    for route in [route for route in routes if rm.get_direct_route_time(route) == shortest_time]:
+    for route in routes:
         full_journey = " => ".join(route)
-        message += "\t%s   Total days: %s\n" % (full_journey, rm.get_direct_route_time(route))
+        message += "\t%s   Total days: %s\n" % (full_journey, shortest_time)
     log.info(message)
 
 
-def show_routes(args, **kwargs):
+def precompute(args, **kwargs):
     """
-    Show the routes given the start and target port
+    Precompute the shortest journey times between every pair of ports and save them next to the routes file.
     :param args: arguments from the command line
     :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
     :return: None
@@ -160,78 +276,259 @@ def show_routes(args, **kwargs):
     log = get_logger()
     rm = kwargs["route_manager"]
     assert isinstance(rm, RouteManager)
-    message = "The routes between %s and %s are:\n" % (args.start_port, args.target_port)
-    routes = rm.get_all_routes(args.start_port, args.target_port)
-    for route in routes:
+    distance_table = rm.compute_distance_table(args.method)
+    distance_table.source = get_file_signature(args.routes_filename)
+    filename = get_distance_table_filename(args.routes_filename)
+    distance_table.save(filename)
+    log.info("The journey times between %s ports have been saved to %s.\n" % (distance_table.port_count, filename))
+
+
+def batch(args, **kwargs):
+    """
+    Answer a stream of JSON lines queries and write the results as JSON lines.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :return: None
+    """
+    rm = kwargs["route_manager"]
+    assert isinstance(rm, RouteManager)
+    input_file = sys.stdin if args.input_filename == "-" else open(args.input_filename, encoding="UTF8")
+    output_file = sys.stdout if args.output_filename == "-" else open(args.output_filename, "w", encoding="UTF8")
+    try:
+        for result in iter_batch_results(rm, input_file, timeout=args.timeout, max_results=args.limit):
+            output_file.write(json.dumps(result) + "\n")
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+def analyse(args, **kwargs):
+    """
+    Analyse the network from every origin port in parallel and write the results as JSON.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :return: None
+    """
+    rm = kwargs["route_manager"]
+    assert isinstance(rm, RouteManager)
+    if args.metric == "route-counts":
+        results = analyse_route_counts(rm, args.max_stops, args.origin_ports, args.processes)
+    else:
+        results = analyse_shortest_times(rm, args.origin_ports, args.processes)
+    if args.output_filename == "-":
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output_filename, "w", encoding="UTF8") as han:
+            json.dump(results, han, indent=2)
+
+
+def serve(args, **kwargs):
+    """
+    Answer queries from clients until the process is stopped.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :return: None
+    """
+    log = get_logger()
+    rm = kwargs["route_manager"]
+    assert isinstance(rm, RouteManager)
+    server = RouteServer(rm, args.host, args.port, args.timeout, args.limit, args.workers)
+    server.serve_forever(lambda address: log.info("Serving the routes from %s on %s:%s" % (
+        args.routes_filename, address[0], address[1])))
+
+
+def _get_current_distance_table(routes_filename):
+    """
+    Loads the saved distance table for a routes file if there is one and it is up to date.
+    :param routes_filename: The name of the routes file
+    :return: A DistanceTable object or None
+    """
+    filename = get_distance_table_filename(routes_filename)
+    if not os.path.exists(filename):
+        return None
+    try:
+        distance_table = DistanceTable.load(filename)
+    except STALE_FILE_ERRORS:
+        get_logger().warning("Ignoring the damaged or incompatible distance table %s. Run precompute to rebuild it."
+                             % filename)
+        return None
+    return distance_table if distance_table.is_current(routes_filename) else None
+
+
+def earliest_arrival(args, **kwargs):
+    """
+    Show the earliest arrival at the target port when leaving the start port on a given day.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
+    :return: None
+    """
+    log = get_logger()
+    rm = kwargs["route_manager"]
+    rm.check_reachable(args.start_port, args.target_port)
+    arrival_day, legs = rm.get_earliest_arrival(args.start_port, args.target_port, args.departure_day)
+    if arrival_day is None:
+        log.info("%s cannot be reached from %s after day %s." % (args.target_port, args.start_port,
+                                                                  args.departure_day))
+        return
+    message = "The earliest arrival at %s when leaving %s on day %s is day %s:\n" % (
+        args.target_port, args.start_port, args.departure_day, arrival_day)
+    for start, end, sail_day, arrival in legs:
+        message += "\t%s => %s   Departs day %s   Arrives day %s\n" % (start, end, sail_day, arrival)
+    log.info(message)
+
+
+def _get_day(value):
+    """
+    Converts a day from the command line into a number.
+    :param value: The day string
+    :return: The day as an int if it is a whole number, otherwise as a float
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _get_positive_int(value):
+    """
+    Converts a count from the command line into a number.
+    :param value: The count string
+    :return: The count as an int
+    :exception argparse.ArgumentTypeError: if the count is not a whole number of at least 1
+    """
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise argparse.ArgumentTypeError("%s is not a whole number of at least 1" % value)
+    return count
+
+
+def routes_top_k(args, **kwargs):
+    """
+    Show the k quickest routes given the start and target port.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
+    :return: None
+    """
+    log = get_logger()
+    rm = kwargs["route_manager"]
+    limits = kwargs.get("limits")
+    rm.check_reachable(args.start_port, args.target_port)
+    message = "The %s quickest routes between %s and %s are:\n" % (args.k, args.start_port, args.target_port)
+    for route, journey_time in rm.get_k_shortest_routes(args.start_port, args.target_port, args.k, limits=limits):
         full_journey = " => ".join(route)
-        message += "\t%s   Total days: %s\n" % (full_journey, rm.get_direct_route_time(route))
+        message += "\t%s   Total days: %s\n" % (full_journey, journey_time)
     log.info(message)
+    _log_truncation(limits)
 
 
-def _create_lambda_criteria(criteria):
+def pareto_routes(args, **kwargs):
     """
-    Creates a simple integer check lambda function given an operator-value string.
-    Example "<=5",  "!=3", ">4" or "==7" etc
-    :param criteria: A criteria string in the form of (==|!=|<=|>=|<|>)[\d]+
-    :return: A lambda function.
+    Show the routes given the start and target port that trade journey time against the number of stops.
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
+    :return: None
     """
+    log = get_logger()
+    rm = kwargs["route_manager"]
+    limits = kwargs.get("limits")
+    rm.check_reachable(args.start_port, args.target_port)
+    routes = rm.get_pareto_routes(args.start_port, args.target_port, args.max_stops, limits=limits)
+    if not routes:
+        log.info("No route between %s and %s was found." % (args.start_port, args.target_port))
+        _log_truncation(limits)
+        return
+    message = "The quickest routes between %s and %s for each number of stops are:\n" % (args.start_port,
+                                                                                        args.target_port)
+    for route, journey_time in routes:
+        full_journey = " => ".join(route)
+        message += "\t%s   Stops: %s   Total days: %s\n" % (full_journey, len(route), journey_time)
+    log.info(message)
+    _log_truncation(limits)
 
-    # Limit what the user can specify as the criteria string. If the user is not from a trusted source then this
-    # code can be used to limit what they can execute to ensure it is safe to execute
-    m = re.search("(==|!=|<=|>=|<|>)[\d]+", criteria)
-    if not m:
-        raise ValueError("The search criteria is limited to the form (==|!=|<=|>=|<|>)[\d]+", criteria)
 
-    # WARNING: This following could be dangerous because it executes a string as python code from the user.
-    # Therefore it is assumed that this call is from a trusted source. The regex check above will increase safety
-    # however.
-    return eval("lambda x:x%s" % criteria)
+def show_routes(args, **kwargs):
+    """
+    Show the routes given the start and target port
+    :param args: arguments from the command line
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
+    :return: None
+    """
+    log = get_logger()
+    rm = kwargs["route_manager"]
+    limits = kwargs.get("limits")
+    rm.check_reachable(args.start_port, args.target_port)
+    log.info("The routes between %s and %s are:" % (args.start_port, args.target_port))
+    # Each route is logged as soon as it is found so that the routes never need to be held in memory.
+    for route, journey_time in rm.iter_routes(args.start_port, args.target_port, with_times=True, limits=limits):
+        log.info("\t%s   Total days: %s" % (" => ".join(route), journey_time))
+    _log_truncation(limits)
 
 
-def _get_route_with_criteria(start_port, target_port, criteria_str, fn_criteria, route_manager, metric_str):
+def _log_truncation(limits):
+    """
+    Warns the user if a list of routes was cut short by the --timeout or --limit options.
+    :param limits: The SearchLimits object that the routes were listed with, or None
+    :return: None
+    """
+    if limits is not None and limits.truncated:
+        get_logger().warning("The list of routes is incomplete since the %s was reached." % {
+            "timeout": "timeout", "max_results": "limit"}.get(limits.reason, limits.reason))
+
+
+def _get_route_with_criteria(start_port, target_port, criteria, route_manager, metric_str, limits=None):
     """
     Gets a list of routes based on a criteria
     :param start_port:  The start port
     :param target_port:  The target port
-    :param criteria_str: The string criteria from the user i.e. "<=10"
-    :param fn_criteria: A criteria function to filter the results
+    :param criteria: The RouteCriteria object to filter the routes with
     :param route_manager: The route manager object
     :param metric_str: The metric string to display to the user that explains what is being shown.
+    :param limits: Optional SearchLimits object to list the routes with
     :return: None
     """
     log = get_logger()
-    message = "The routes between %s and %s with the criteria '%s' are:\n" % (
-        start_port, target_port, metric_str)
-    fn_base_criteria = _create_lambda_criteria(criteria_str)
-    for route in route_manager.get_route_data_with_criteria(start_port, target_port,
-                                                            lambda x: fn_base_criteria(fn_criteria(x))):
-        full_journey = " => ".join(route)
-        message += "\t%s   Total days: %s\n" % (full_journey, route_manager.get_direct_route_time(route))
-    log.info(message)
+    route_manager.check_reachable(start_port, target_port)
+    log.info("The routes between %s and %s with the criteria '%s' are:" % (start_port, target_port, metric_str))
+    for route, journey_time in route_manager.iter_routes_with_criteria(start_port, target_port, criteria,
+                                                                       with_times=True, limits=limits):
+        log.info("\t%s   Total days: %s" % (" => ".join(route), journey_time))
+    _log_truncation(limits)
 
 
 def route_length_with_criteria(args, **kwargs):
     """
     Show the routes given the start and target port that meet the specified criteria
     :param args: arguments from the command line
-    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
     :return: None
     """
     rm = kwargs["route_manager"]
-    _get_route_with_criteria(args.start_port, args.target_port, args.criteria, len, rm,
-                             "Routes with %s stops." % args.criteria)
+    _get_route_with_criteria(args.start_port, args.target_port, RouteCriteria.from_string("stops", args.criteria), rm,
+                             "Routes with %s stops." % args.criteria, kwargs.get("limits"))
 
 
 def route_time_with_criteria(args, **kwargs):
     """
     Show the routes given the start and target port that meet the specified criteria
     :param args: arguments from the command line
-    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager object
+    :param kwargs: should always contain a key called "route_manager" which points to a RouteManager or RouteClient
+                   object
     :return: None
     """
     rm = kwargs["route_manager"]
-    _get_route_with_criteria(args.start_port, args.target_port, args.criteria, rm.get_direct_route_time, rm,
-                             "Routes that have a journey time %s days." % args.criteria)
+    _get_route_with_criteria(args.start_port, args.target_port, RouteCriteria.from_string("time", args.criteria), rm,
+                             "Routes that have a journey time %s days." % args.criteria, kwargs.get("limits"))
 
 
 def main():
@@ -242,13 +539,23 @@ def main():
     try:
         args = process_command_line()
         log = setup_logging(args.log_filename)
-        rm = RouteManager()
-        rm.load_routes(args.routes_filename)
-        args.func(args, route_manager=rm)
-        return 0
+        profiler = None
+        if args.profile_filename:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            return _run_command(args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile_filename)
+                log.info("The profile was saved to %s" % args.profile_filename)
     except InvalidPortName as ex:
         log.error("The port name specified was invalid. Please check spelling and case. [%s]" % ex.args[1])
         return 1
+    except UnreachablePortError as ex:
+        log.error(ex.args[0])
+        return 1
     except InvalidRouteError as ex:
         log.error("The route specified was invalid. [%s]" % ex.args[1])
         return 1
@@ -258,6 +565,64 @@ def main():
         return 1
 
 
+def _run_command(args):
+    """
+    Runs the command given on the command line, logging the stats afterwards if they were asked for.
+    :param args: arguments from the command line
+    :return: The exit code
+    """
+    log = get_logger()
+    stats = RouteStats() if args.show_stats else None
+    rm = None
+    try:
+        if args.client:
+            if not getattr(args, "supports_client", False):
+                log.error("This command cannot be sent to a server.")
+                return 1
+            client = RouteClient.from_address(args.routes_filename)
+            try:
+                with get_timer(stats, "command"):
+                    args.func(args, route_manager=client, limits=_get_limits(args))
+            finally:
+                client.close()
+            return 0
+
+        distance_table = None
+        if _uses_distance_table(args):
+            with get_timer(stats, "load_distance_table"):
+                distance_table = _get_current_distance_table(args.routes_filename)
+        rm = RouteManager(stats=stats)
+        # The routes file does not need to be read if a distance table can answer the question
+        if distance_table is None:
+            with get_timer(stats, "load_routes"):
+                rm.load_routes(args.routes_filename, args.use_snapshot)
+        with get_timer(stats, "command"):
+            args.func(args, route_manager=rm, distance_table=distance_table, limits=_get_limits(args))
+        return 0
+    finally:
+        if stats is not None:
+            log.info("Stats:\n%s" % json.dumps(rm.get_stats() if rm is not None else stats.get_stats(), indent=2))
+
+
+def _uses_distance_table(args):
+    """
+    A precomputed distance table only answers the dijkstra method, and holds one of the tied shortest routes.
+    :param args: arguments from the command line
+    :return: True if the command should use the distance table saved next to the routes file, if it is up to date
+    """
+    return getattr(args, "use_distance_table", False) and getattr(args, "method", None) == "dijkstra"
+
+
+def _get_limits(args):
+    """
+    :param args: arguments from the command line
+    :return: A SearchLimits object for the --timeout and --limit options, or None if neither was given
+    """
+    if args.timeout is None and args.limit is None:
+        return None
+    return SearchLimits(args.timeout, args.limit)
+
+
 if __name__ == '__main__':
     # only run the main loop if this script was called from the command line
     exit(main())
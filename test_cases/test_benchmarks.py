@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# This line ensures that we can refer to the codefiles and benchmarks folders as source roots
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../benchmarks")))
+
+from generate_routes import generate_routes, write_routes
+from route_loader import read_routes
+from route_manager import RouteManager
+from run_benchmarks import compare_results, run_benchmarks
+
+
+class TestCaseBenchmarks(unittest.TestCase):
+    def test_generate_routes_seeded(self):
+        routes = generate_routes(50, out_degree=4, cycle_density=0.3, seed=7)
+        self.assertListEqual(routes, generate_routes(50, out_degree=4, cycle_density=0.3, seed=7))
+        self.assertNotEqual(routes, generate_routes(50, out_degree=4, cycle_density=0.3, seed=8))
+        self.assertTrue(all(route["start"] != route["end"] for route in routes))
+        self.assertTrue(all(1 <= route["journey_time"] <= 10 for route in routes))
+        self.assertEqual(len(routes), len({(route["start"], route["end"]) for route in routes}))
+        with self.assertRaises(ValueError):
+            generate_routes(50, cycle_density=2)
+
+    def test_generate_routes_cycle_density(self):
+        rm = RouteManager()
+        rm.set_routes(generate_routes(30, cycle_density=0))
+        self.assertTrue(all(rm.get_shortest_journey(port, port) is None for port in rm.all_port_names))
+        rm.set_routes(generate_routes(30, cycle_density=0.5))
+        self.assertTrue(any(rm.get_shortest_journey(port, port) is not None for port in rm.all_port_names))
+
+    def test_write_routes(self):
+        routes = generate_routes(20, time_distribution="exponential", max_time=40)
+        with tempfile.TemporaryDirectory() as tmp_path:
+            for ext in ("yml", "csv", "jsonl"):
+                filename = os.path.join(tmp_path, "routes." + ext)
+                write_routes(routes, filename)
+                self.assertListEqual(routes, read_routes(filename))
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(sizes=[10], repeat=1)
+        names = {result["benchmark"] for result in results["results"]}
+        self.assertIn("load_routes_yaml", names)
+        self.assertIn("get_all_routes", names)
+        self.assertTrue(all(result["ports"] == 10 and result["min"] >= 0 for result in results["results"]))
+
+        baseline = {"results": [dict(f, median=f["median"] / 2) for f in results["results"]]}
+        comparisons = compare_results(results, baseline, threshold=1.5)
+        self.assertEqual(len(results["results"]), len(comparisons))
+        self.assertTrue(all(f[5] for f in comparisons if f[2] > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+# This line ensures that we can refer to the codefiles folder as a source root
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
+
+from exceptions import InvalidPortName
+from route_analysis import analyse_route_counts, analyse_shortest_times
+from route_manager import RouteManager
+
+
+class TestCaseRouteAnalysis(unittest.TestCase):
+    def setUp(self):
+        # Create a route manager
+        self.rm = RouteManager()
+
+        # Load the pre-defined routes
+        path, _ = os.path.split(__file__)
+        path = os.path.join(path, "../test_files/routes.yml")
+        self.rm.load_routes(path)
+
+    def test_shortest_times(self):
+        results = analyse_shortest_times(self.rm, processes=1)
+        self.assertListEqual(sorted(self.rm.all_port_names), sorted(results))
+        for start_port, times in results.items():
+            for end_port in self.rm.all_port_names:
+                self.assertEqual(self.rm.get_shortest_journey(start_port, end_port), times.get(end_port))
+
+    def test_shortest_times_parallel(self):
+        self.assertDictEqual(analyse_shortest_times(self.rm, processes=1), analyse_shortest_times(self.rm, processes=3))
+
+    def test_route_counts(self):
+        results = analyse_route_counts(self.rm, 4, ["Liverpool", "Buenos Aires"], processes=2)
+        self.assertListEqual(["Buenos Aires", "Liverpool"], sorted(results))
+        self.assertEqual(sum(self.rm.count_routes_by_stops("Liverpool", "Liverpool", 4, True).values()),
+                         results["Liverpool"]["Liverpool"])
+        self.assertNotIn("Buenos Aires", results["Liverpool"])
+
+    def test_invalid_origin(self):
+        with self.assertRaises(InvalidPortName):
+            analyse_shortest_times(self.rm, ["foobar"], processes=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import sys
+import unittest
+
+# This line ensures that we can refer to the codefiles folder as a source root
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
+
+from route_batch import iter_batch_results
+from route_manager import SHORTEST_ROUTE_METHODS, RouteManager
+from route_queries import run_query
+
+
+class TestCaseRouteBatch(unittest.TestCase):
+    def setUp(self):
+        # Create a route manager
+        self.rm = RouteManager()
+
+        # Load the pre-defined routes
+        path, _ = os.path.split(__file__)
+        path = os.path.join(path, "../test_files/routes.yml")
+        self.rm.load_routes(path)
+
+    def _run_batch(self, queries, chunk_size=1000):
+        lines = io.StringIO("".join((f if isinstance(f, str) else json.dumps(f)) + "\n" for f in queries))
+        return list(iter_batch_results(self.rm, lines, chunk_size))
+
+    def test_batch_results_in_order(self):
+        results = self._run_batch([
+            {"id": "a", "type": "shortest-route", "start_port": "New York", "target_port": "New York"},
+            {"type": "direct-route-time", "route": ["Buenos Aires", "New York", "Liverpool"]},
+            {"type": "shortest-route", "start_port": "New York", "target_port": "Casablanca"},
+            {"type": "routes-with-stops", "start_port": "Liverpool", "target_port": "Liverpool", "criteria": "==3"},
+        ])
+        self.assertListEqual([
+            {"line": 1, "id": "a", "shortest_time": 18, "routes": [["New York", "Liverpool", "Cape Town", "New York"]]},
+            {"line": 2, "journey_time": 10},
+            {"line": 3, "shortest_time": 7, "routes": [["New York", "Liverpool", "Casablanca"]]},
+            {"line": 4, "routes": [{"route": ["Liverpool", "Casablanca", "Liverpool"], "journey_time": 6}]},
+        ], results)
+
+    def test_batch_errors_inline(self):
+        results = self._run_batch([
+            "not json",
+            "",
+            {"type": "shortest-route", "start_port": "foobar", "target_port": "Liverpool"},
+            {"type": "shortest-route", "start_port": "New York", "target_port": ["Liverpool"]},
+            {"type": "direct-route-time", "route": ["Buenos Aires", "Cape Town", "Casablanca"]},
+            {"type": "shortest-route", "start_port": "New York", "target_port": "Liverpool"},
+        ])
+        self.assertListEqual([1, 3, 4, 5, 6], [f["line"] for f in results])
+        self.assertEqual("ValueError", results[0]["error"])
+        self.assertEqual("InvalidPortName", results[1]["error"])
+        self.assertIn("error", results[2])
+        self.assertEqual("InvalidRouteError", results[3]["error"])
+        self.assertListEqual([["Cape Town", "Casablanca"]], results[3]["details"])
+        self.assertEqual(4, results[4]["shortest_time"])
+
+    def test_batch_shared_search_matches_single_queries(self):
+        queries = [{"type": "shortest-route", "start_port": start_port, "target_port": target_port}
+                   for start_port in sorted(self.rm.all_port_names) for target_port in sorted(self.rm.all_port_names)]
+        for result, query in zip(self._run_batch(queries, chunk_size=7), queries):
+            shortest_time, routes = self.rm.get_shortest_routes(query["start_port"], query["target_port"])
+            self.assertEqual(shortest_time, result["shortest_time"])
+            self.assertCountEqual(routes, result["routes"])
+
+        # Two tied routes from a to d, which only the dijkstra method returns both of
+        self.rm.set_routes([{"start": "a", "end": "b", "journey_time": 1},
+                            {"start": "b", "end": "d", "journey_time": 1},
+                            {"start": "a", "end": "c", "journey_time": 1},
+                            {"start": "c", "end": "d", "journey_time": 1}])
+        for method in (None,) + SHORTEST_ROUTE_METHODS:
+            queries = [{"type": "shortest-route", "start_port": "a", "target_port": target_port}
+                       for target_port in ("b", "c", "d")]
+            if method is not None:
+                for query in queries:
+                    query["method"] = method
+            for result, query in zip(self._run_batch(queries), queries):
+                expected = run_query(self.rm, query)
+                self.assertEqual(expected["shortest_time"], result["shortest_time"])
+                self.assertCountEqual(expected["routes"], result["routes"])
+            self.assertEqual(1 if method in ("bidirectional", "alt") else 2, len(result["routes"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
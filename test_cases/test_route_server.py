@@ -0,0 +1,171 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+# This line ensures that we can refer to the codefiles folder as a source root
+sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
+
+from exceptions import InvalidRouteError, InvalidPortName, UnreachablePortError
+from route_criteria import RouteCriteria
+from route_manager import RouteManager
+from route_queries import run_query, run_query_safely
+from route_server import RouteClient, RouteServer
+from search_limits import SearchLimits
+
+
+class TestCaseRouteServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Create a route manager
+        cls.rm = RouteManager()
+
+        # Load the pre-defined routes
+        path, _ = os.path.split(__file__)
+        path = os.path.join(path, "../test_files/routes.yml")
+        cls.rm.load_routes(path)
+
+        # Start the server on a free port in a background thread
+        started = threading.Event()
+        cls.address = None
+
+        def fn_started(address):
+            cls.address = address
+            started.set()
+
+        cls.server = RouteServer(cls.rm, port=0)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, args=(fn_started,), daemon=True)
+        cls.thread.start()
+        started.wait(10)
+
+    def setUp(self):
+        self.client = RouteClient(*self.address, timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_run_query(self):
+        self.assertDictEqual({"journey_time": 10},
+                             run_query(self.rm, {"type": "direct-route-time",
+                                                 "route": ["Buenos Aires", "New York", "Liverpool"]}))
+        self.assertDictEqual({"routes": [{"route": ["Liverpool", "Casablanca", "Liverpool"], "journey_time": 6}]},
+                             run_query(self.rm, {"type": "routes-with-stops", "start_port": "Liverpool",
+                                                 "target_port": "Liverpool", "criteria": "==3"}))
+
+    def test_run_query_safely_errors(self):
+        result = run_query_safely(self.rm, {"type": "shortest-route", "start_port": "foobar",
+                                            "target_port": "Liverpool"})
+        self.assertEqual("InvalidPortName", result["error"])
+        self.assertEqual("foobar", result["details"])
+        self.assertEqual("ValueError", run_query_safely(self.rm, {"type": "foobar"})["error"])
+        self.assertEqual("ValueError", run_query_safely(self.rm, {"type": "shortest-route"})["error"])
+
+    def test_client_queries(self):
+        self.assertEqual(8, self.client.get_direct_route_time(["Buenos Aires", "Casablanca", "Liverpool"]))
+        self.assertEqual((18, [["New York", "Liverpool", "Cape Town", "New York"]]),
+                         self.client.get_shortest_routes("New York", "New York"))
+        self.assertListEqual(self.rm.get_all_routes("Liverpool", "Liverpool"),
+                             self.client.get_all_routes("Liverpool", "Liverpool"))
+        self.assertListEqual([(["Buenos Aires", "Casablanca"], 5)],
+                             list(self.client.iter_routes("Buenos Aires", "Casablanca", max_time=12,
+                                                          with_times=True)))
+        self.assertListEqual([["Liverpool", "Casablanca", "Liverpool"]],
+                             list(self.client.iter_routes_with_criteria("Liverpool", "Liverpool",
+                                                                        RouteCriteria.parse("stops==3"))))
+        self.assertEqual(self.rm.get_shortest_route("Buenos Aires", "Liverpool", "alt"),
+                         self.client.get_shortest_route("Buenos Aires", "Liverpool", "alt"))
+        self.assertEqual((None, None), self.client.get_shortest_route("Liverpool", "Buenos Aires"))
+        self.assertEqual(self.rm.get_earliest_arrival("Buenos Aires", "Liverpool", 2),
+                         self.client.get_earliest_arrival("Buenos Aires", "Liverpool", 2))
+        self.assertListEqual(self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 2),
+                             self.client.get_k_shortest_routes("Liverpool", "Liverpool", 2))
+        self.assertListEqual(self.rm.get_pareto_routes("Liverpool", "Liverpool"),
+                             self.client.get_pareto_routes("Liverpool", "Liverpool"))
+
+    def test_query_limits(self):
+        result = run_query(self.rm, {"type": "show-routes", "start_port": "Liverpool", "target_port": "Liverpool",
+                                     "limit": 1})
+        self.assertEqual(1, len(result["routes"]))
+        self.assertTrue(result["truncated"])
+        self.assertEqual("max_results", result["truncated_reason"])
+        # The caller's limit is used when it is lower than the query's
+        result = run_query(self.rm, {"type": "show-routes", "start_port": "Liverpool", "target_port": "Liverpool",
+                                     "limit": 10, "timeout": 60}, max_results=2)
+        self.assertEqual(2, len(result["routes"]))
+        self.assertEqual("ValueError", run_query_safely(self.rm, {"type": "show-routes", "start_port": "Liverpool",
+                                                                  "target_port": "Liverpool", "limit": 0})["error"])
+        # The limit also caps the number of routes that a routes-top-k query can ask for
+        result = run_query(self.rm, {"type": "routes-top-k", "start_port": "Liverpool", "target_port": "Liverpool",
+                                     "k": 3, "limit": 1})
+        self.assertListEqual([{"route": ["Liverpool", "Casablanca", "Liverpool"], "journey_time": 6}],
+                             result["routes"])
+        self.assertTrue(result["truncated"])
+        self.assertEqual("max_results", result["truncated_reason"])
+        for k in (0, True, "3"):
+            self.assertEqual("ValueError", run_query_safely(self.rm, {"type": "routes-top-k", "start_port": "Liverpool",
+                                                                      "target_port": "Liverpool", "k": k})["error"])
+
+        limits = SearchLimits(timeout=60, max_results=2)
+        self.assertListEqual(self.rm.get_all_routes("Liverpool", "Liverpool")[:2],
+                             self.client.get_all_routes("Liverpool", "Liverpool", limits))
+        self.assertTrue(limits.truncated)
+        self.assertEqual("max_results", limits.reason)
+
+    def test_client_errors(self):
+        with self.assertRaises(InvalidPortName):
+            self.client.get_shortest_journey("foobar", "New York")
+        with self.assertRaises(InvalidRouteError) as cm:
+            self.client.get_direct_route_time(["Buenos Aires", "Cape Town", "Casablanca"])
+        self.assertSetEqual({("Cape Town", "Casablanca")}, cm.exception.args[1])
+        # The connection is still usable after an error
+        self.assertEqual(8, self.client.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.assertEqual("ValueError", self.client.query({"type": "foobar"})["error"])
+        self.assertTrue(self.client.is_reachable("Buenos Aires", "Liverpool"))
+        self.assertFalse(self.client.is_reachable("Liverpool", "Buenos Aires"))
+        with self.assertRaises(UnreachablePortError):
+            self.client.check_reachable("Liverpool", "Buenos Aires")
+
+    def test_concurrent_clients(self):
+        # Every route between two ports of a complete route map of 12 ports takes far longer than 1 second to list
+        port_names = ["Port %s" % f for f in range(12)]
+        rm = RouteManager()
+        rm.set_routes([{"start": start, "end": end, "journey_time": 1}
+                       for start in port_names for end in port_names if start != end])
+        started = threading.Event()
+        addresses = []
+
+        def fn_started(address):
+            addresses.append(address)
+            started.set()
+
+        server = RouteServer(rm, port=0)
+        threading.Thread(target=server.serve_forever, args=(fn_started,), daemon=True).start()
+        started.wait(10)
+
+        limits = SearchLimits(timeout=3)
+
+        def run_slow_query():
+            client = RouteClient(*addresses[0], timeout=10)
+            try:
+                client.get_all_routes("Port 0", "Port 1", limits=limits)
+            finally:
+                client.close()
+
+        slow_thread = threading.Thread(target=run_slow_query)
+        slow_thread.start()
+        try:
+            time.sleep(0.5)
+            client = RouteClient(*addresses[0], timeout=10)
+            try:
+                start_time = time.monotonic()
+                self.assertEqual(2, client.get_direct_route_time(["Port 0", "Port 1", "Port 2"]))
+                self.assertLess(time.monotonic() - start_time, 1)
+            finally:
+                client.close()
+        finally:
+            slow_thread.join()
+        self.assertTrue(limits.truncated)
+
+if __name__ == '__main__':
+    unittest.main()
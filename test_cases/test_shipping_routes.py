@@ -1,12 +1,26 @@
 import os
+import random
 import sys
+import tempfile
+import threading
 import unittest
 
 # This line ensures that we can refer to the codefiles folder as a source root
 sys.path.append(os.path.abspath(os.path.join(os.path.abspath(os.path.split(__file__)[0]), "../codefiles")))
 
-from exceptions import InvalidRouteError, InvalidPortName
+from distance_table import DistanceTable, import_numpy
+import route_criteria
+from route_criteria import RouteCriteria
+from route_data import RouteData
+from exceptions import InvalidRouteError, InvalidPortName, UnreachablePortError
+from landmarks import Landmarks
+from query_cache import QueryCache
+from reachability import ReachabilityIndex
+from route_graph import RouteGraph
+from route_loader import STALE_FILE_ERRORS, get_snapshot_filename, load_snapshot, read_routes, save_snapshot
 from route_manager import RouteManager
+from route_stats import RouteStats
+from search_limits import SearchLimits
 
 
 class TestCaseShippintRoutes(unittest.TestCase):
@@ -140,6 +154,20 @@ class TestCaseShippintRoutes(unittest.TestCase):
         with self.assertRaises(InvalidPortName):
             self.rm.get_number_of_routes("foobar", "New York", lambda x: x == 1)
 
+    def test_find_number_of_routes_cache(self):
+        # A filter function is not cached since it may read state that changes between calls
+        max_stops = [3]
+        fn_count_filter = lambda x: x <= max_stops[0]
+        self.assertEqual(1, self.rm.get_number_of_routes("Liverpool", "Liverpool", fn_count_filter))
+        max_stops[0] = 5
+        self.assertEqual(3, self.rm.get_number_of_routes("Liverpool", "Liverpool", fn_count_filter))
+        self.assertEqual(0, self.rm.query_cache.get_stats()["size"])
+        # A RouteCriteria filter is cached
+        criteria = RouteCriteria.parse("stops<=4")
+        self.assertEqual(2, self.rm.get_number_of_routes("Liverpool", "Liverpool", criteria))
+        self.assertEqual(2, self.rm.get_number_of_routes("Liverpool", "Liverpool", RouteCriteria.parse("stops<=4")))
+        self.assertDictEqual({"hits": 1, "misses": 1, "size": 1, "maxsize": 256}, self.rm.query_cache.get_stats())
+
     def test_get_route_data_with_criteria_length_check(self):
         results = [
             ["Buenos Aires", "New York", "Liverpool", "Casablanca"],
@@ -158,5 +186,769 @@ class TestCaseShippintRoutes(unittest.TestCase):
                                                                   lambda x: self.rm.get_direct_route_time(x) <= 15))
 
 
+    def test_shortest_routes(self):
+        self.assertEqual((8, [["Buenos Aires", "Casablanca", "Liverpool"]]),
+                         self.rm.get_shortest_routes("Buenos Aires", "Liverpool"))
+        self.assertEqual((18, [["New York", "Liverpool", "Cape Town", "New York"]]),
+                         self.rm.get_shortest_routes("New York", "New York"))
+
+    def test_shortest_routes_ties(self):
+        data = [
+            {"start": "Buenos Aires", "end": "New York", "journey_time": 5},
+            {"start": "New York", "end": "Liverpool", "journey_time": 3},
+            {"start": "Buenos Aires", "end": "Casablanca", "journey_time": 5},
+            {"start": "Casablanca", "end": "Liverpool", "journey_time": 3},
+        ]
+        rm = RouteManager()
+        rm.set_routes(data)
+        shortest_time, routes = rm.get_shortest_routes("Buenos Aires", "Liverpool")
+        self.assertEqual(8, shortest_time)
+        self.assertCountEqual([
+            ["Buenos Aires", "New York", "Liverpool"],
+            ["Buenos Aires", "Casablanca", "Liverpool"],
+        ], routes)
+
+    def test_shortest_routes_ties_with_zero_journey_times(self):
+        # New York is settled before Casablanca, which then reaches it again in 0 days. The loop between them must not
+        # produce routes that revisit a port.
+        data = [
+            {"start": "Buenos Aires", "end": "New York", "journey_time": 0},
+            {"start": "Buenos Aires", "end": "Casablanca", "journey_time": 0},
+            {"start": "Casablanca", "end": "New York", "journey_time": 0},
+            {"start": "New York", "end": "Casablanca", "journey_time": 0},
+            {"start": "New York", "end": "Liverpool", "journey_time": 3},
+        ]
+        rm = RouteManager()
+        rm.set_routes(data)
+        expected_routes = [
+            ["Buenos Aires", "New York", "Liverpool"],
+            ["Buenos Aires", "Casablanca", "New York", "Liverpool"],
+        ]
+        shortest_time, routes = rm.get_shortest_routes("Buenos Aires", "Liverpool")
+        self.assertEqual(3, shortest_time)
+        self.assertCountEqual(expected_routes, routes)
+        shortest_time, routes = rm.get_shortest_routes_from("Buenos Aires", ["Liverpool"])["Liverpool"]
+        self.assertEqual(3, shortest_time)
+        self.assertCountEqual(expected_routes, routes)
+
+    def test_shortest_routes_unreachable(self):
+        self.assertEqual((None, []), self.rm.get_shortest_routes("Liverpool", "Buenos Aires"))
+        self.assertIsNone(self.rm.get_shortest_journey("Liverpool", "Buenos Aires"))
+
+
+    def test_get_route_times(self):
+        results = self.rm.get_route_times([
+            ["Buenos Aires", "New York", "Liverpool"],
+            ["Buenos Aires", "Cape Town", "Casablanca", "Liverpool"],
+            ["Buenos Aires"],
+            ["Buenos Aires", "Casablanca", "Liverpool"],
+        ])
+        self.assertListEqual([
+            (10, []),
+            (None, [("Cape Town", "Casablanca")]),
+            (None, [("Buenos Aires",)]),
+            (8, []),
+        ], results)
+
+    def test_direct_route_times_invalid_route_parts(self):
+        with self.assertRaises(InvalidRouteError) as cm:
+            self.rm.get_direct_route_time(["Buenos Aires", "Cape Town", "Casablanca", "Foo"])
+        self.assertSetEqual({("Cape Town", "Casablanca"), ("Casablanca", "Foo")}, cm.exception.args[1])
+
+
+    def test_iter_routes_is_lazy(self):
+        routes = self.rm.iter_routes("Buenos Aires", "Casablanca")
+        self.assertListEqual(["Buenos Aires", "New York", "Liverpool", "Casablanca"], next(routes))
+        self.assertListEqual(["Buenos Aires", "Casablanca"], next(routes))
+
+    def test_iter_routes_bounds(self):
+        self.assertListEqual([
+            (["Buenos Aires", "New York", "Liverpool", "Casablanca"], 13),
+            (["Buenos Aires", "Casablanca"], 5),
+        ], list(self.rm.iter_routes("Buenos Aires", "Casablanca", max_stops=4, with_times=True)))
+        self.assertListEqual([["Buenos Aires", "Casablanca"]],
+                             list(self.rm.iter_routes("Buenos Aires", "Casablanca", max_time=12)))
+        self.assertListEqual([['Liverpool', 'Casablanca', 'Liverpool']],
+                             list(self.rm.iter_routes("Liverpool", "Liverpool", max_stops=3, max_time=20)))
+
+    def test_iter_routes_invalid_port_name(self):
+        with self.assertRaises(InvalidPortName):
+            self.rm.iter_routes("Buenos Aires", "Casablancaa")
+
+
+    def test_count_routes_by_stops(self):
+        self.assertDictEqual({3: 1, 4: 1, 5: 1}, self.rm.count_routes_by_stops("Liverpool", "Liverpool", 5))
+        self.assertDictEqual({3: 1, 4: 1, 5: 2}, self.rm.count_routes_by_stops("Liverpool", "Liverpool", 5, True))
+        self.assertDictEqual({3: 2, 4: 1}, self.rm.count_routes_by_stops("Buenos Aires", "Liverpool", 4, True))
+
+    def test_count_routes_by_time(self):
+        self.assertDictEqual({6: 1, 18: 1, 21: 1}, self.rm.count_routes_by_time("Liverpool", "Liverpool", 25))
+        self.assertDictEqual({6: 1, 12: 1, 18: 2, 21: 1, 24: 3},
+                             self.rm.count_routes_by_time("Liverpool", "Liverpool", 25, True))
+        with self.assertRaises(InvalidPortName):
+            self.rm.count_routes_by_time("foobar", "Liverpool", 25, True)
+
+    def test_count_routes_by_time_invalid_journey_time(self):
+        rm = RouteManager()
+        rm.set_routes([{"start": "Liverpool", "end": "Casablanca", "journey_time": 0}])
+        with self.assertRaises(ValueError):
+            rm.count_routes_by_time("Liverpool", "Casablanca", 10, True)
+
+
+    def test_route_graph_layout(self):
+        graph = RouteGraph([
+            {"start": "Buenos Aires", "end": "New York", "journey_time": 6},
+            {"start": "New York", "end": "Liverpool", "journey_time": 4},
+            {"start": "Buenos Aires", "end": "Casablanca", "journey_time": 5},
+        ])
+        self.assertListEqual(["Buenos Aires", "New York", "Liverpool", "Casablanca"], graph.port_names)
+        self.assertListEqual([0, 2, 3, 3, 3], list(graph.offsets))
+        self.assertListEqual([1, 3, 2], list(graph.targets))
+        self.assertListEqual([6, 5, 4], list(graph.times))
+        self.assertEqual(3, graph.get_port_id("Casablanca"))
+        with self.assertRaises(InvalidPortName):
+            graph.get_port_id("Casablancaa")
+
+
+    def test_add_route(self):
+        self.rm.add_route("Liverpool", "Buenos Aires", 7)
+        self.assertEqual(7, self.rm.get_direct_route_time(["Liverpool", "Buenos Aires"]))
+        self.assertEqual(10, self.rm.get_shortest_journey("Casablanca", "Buenos Aires"))
+        self.rm.add_route("Buenos Aires", "Rotterdam", 2.5)
+        self.assertEqual(12.5, self.rm.get_shortest_journey("Casablanca", "Rotterdam"))
+        self.assertIn("Rotterdam", self.rm.all_port_names)
+        self.assertListEqual([["Buenos Aires", "Rotterdam"]], self.rm.get_all_routes("Buenos Aires", "Rotterdam"))
+        with self.assertRaises(InvalidRouteError):
+            self.rm.add_route("Liverpool", "Buenos Aires", 7)
+
+    def test_remove_route(self):
+        self.rm.remove_route("Buenos Aires", "Casablanca")
+        self.assertEqual(10, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.assertListEqual([
+            ["Buenos Aires", "New York", "Liverpool", "Casablanca"],
+            ["Buenos Aires", "Cape Town", "New York", "Liverpool", "Casablanca"],
+        ], self.rm.get_all_routes("Buenos Aires", "Casablanca"))
+        with self.assertRaises(InvalidRouteError):
+            self.rm.get_direct_route_time(["Buenos Aires", "Casablanca"])
+        with self.assertRaises(InvalidRouteError):
+            self.rm.remove_route("Buenos Aires", "Casablanca")
+
+    def test_update_journey_time(self):
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.assertEqual(10, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.assertEqual(12, self.rm.get_direct_route_time(["Buenos Aires", "Casablanca", "Liverpool"]))
+        with self.assertRaises(InvalidRouteError):
+            self.rm.update_journey_time("Buenos Aires", "Rotterdam", 9)
+
+
+    def test_query_cache(self):
+        routes = self.rm.get_all_routes("Liverpool", "Liverpool")
+        routes.append(["foo"])
+        self.assertEqual(3, len(self.rm.get_all_routes("Liverpool", "Liverpool")))
+        self.rm.get_shortest_journey("New York", "New York")
+        self.rm.get_shortest_journey("New York", "New York")
+        self.assertDictEqual({"hits": 2, "misses": 2, "size": 2, "maxsize": 256}, self.rm.query_cache.get_stats())
+
+    def test_query_cache_invalidated(self):
+        self.assertEqual(8, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.assertEqual(10, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.rm.set_routes([{"start": "Buenos Aires", "end": "Liverpool", "journey_time": 1}])
+        self.assertEqual(1, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+
+    def test_route_data_snapshots(self):
+        route_data = self.rm.route_data
+        routes_list = list(route_data.routes)
+        self.rm.add_route("Liverpool", "Buenos Aires", 7)
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.rm.remove_route("Buenos Aires", "New York")
+        self.assertListEqual(routes_list, route_data.routes)
+        self.assertNotIn(("Liverpool", "Buenos Aires"), route_data.route_times)
+        self.assertEqual(5, route_data.route_times[("Buenos Aires", "Casablanca")])
+        self.assertEqual(8, route_data.graph.get_shortest_routes(route_data.graph.get_port_id("Buenos Aires"),
+                                                                 route_data.graph.get_port_id("Liverpool"))[0])
+        self.assertEqual(3, self.rm.route_data.generation - route_data.generation)
+        self.assertEqual(12, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+
+        new_routes = [dict(route) for route in routes_list]
+        self.rm.set_routes(new_routes)
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.assertListEqual(routes_list, new_routes)
+
+    def test_route_data_changes_match_rebuilt_indexes(self):
+        # Changing the journey time keeps the reachability index of the old graph
+        reachability = self.rm.route_data.graph.get_reachability()
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.assertIs(reachability, self.rm.route_data.graph.get_reachability())
+        # So does adding a route between ports that could already reach each other
+        self.rm.add_route("Liverpool", "New York", 1)
+        self.assertIs(reachability, self.rm.route_data.graph.get_reachability())
+        self.rm.add_route("Liverpool", "Rotterdam", 2)
+        self.rm.add_route("Cape Town", "Buenos Aires", 1)
+        self.rm.remove_route("Buenos Aires", "New York")
+        self.rm.update_journey_time("Liverpool", "New York", 4)
+        route_data = self.rm.route_data
+        rebuilt = RouteData(route_data.routes, RouteGraph(route_data.routes))
+        self.assertDictEqual(rebuilt.mapped_routes, route_data.mapped_routes)
+        self.assertDictEqual(rebuilt.route_times, route_data.route_times)
+        self.assertSetEqual(rebuilt.all_port_names, route_data.all_port_names)
+        graph, rebuilt_graph = route_data.graph, rebuilt.graph
+        for start_port in sorted(rebuilt.all_port_names):
+            for end_port in sorted(rebuilt.all_port_names):
+                start, end = graph.get_port_id(start_port), graph.get_port_id(end_port)
+                rebuilt_start, rebuilt_end = rebuilt_graph.get_port_id(start_port), rebuilt_graph.get_port_id(end_port)
+                self.assertEqual(rebuilt_graph.get_reachability().can_reach(rebuilt_start, rebuilt_end),
+                                 graph.get_reachability().can_reach(start, end))
+                self.assertEqual(rebuilt_graph.get_shortest_routes(rebuilt_start, rebuilt_end)[0],
+                                 graph.get_shortest_routes(start, end)[0])
+
+    def test_concurrent_queries_and_reloads(self):
+        routes_a = self.rm.routes
+        routes_b = [dict(route, journey_time=route["journey_time"] + 1) for route in routes_a]
+        expected = []
+        for routes_list in (routes_a, routes_b):
+            self.rm.set_routes(routes_list)
+            expected.append((self.rm.get_shortest_routes("Buenos Aires", "Liverpool"),
+                             self.rm.get_route_times([("Buenos Aires", "Casablanca"), ("Liverpool", "Casablanca")]),
+                             self.rm.get_all_routes("Liverpool", "Liverpool")))
+        self.assertNotEqual(expected[0], expected[1])
+
+        stop = threading.Event()
+        results, errors = [], []
+
+        def read():
+            try:
+                while not stop.is_set():
+                    results.append((self.rm.get_shortest_routes("Buenos Aires", "Liverpool"),
+                                    self.rm.get_route_times([("Buenos Aires", "Casablanca"),
+                                                                 ("Liverpool", "Casablanca")]),
+                                    self.rm.get_all_routes("Liverpool", "Liverpool")))
+            except Exception as ex:
+                errors.append(ex)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for i in range(200):
+                self.rm.set_routes(routes_b if i % 2 == 0 else routes_a)
+                if i % 10 == 0:
+                    self.rm.update_journey_time("Buenos Aires", "Casablanca", 6)
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
+        self.assertListEqual([], errors)
+        self.assertTrue(results)
+        # Each query sees one version of the routes, although the queries made one after another may not
+        for result in results:
+            for i, query_result in enumerate(result):
+                self.assertIn(query_result, [version[i] for version in expected])
+
+    def test_query_cache_bounded(self):
+        cache = QueryCache(2)
+        for key in ["a", "b", "a", "c"]:
+            cache.get_or_compute(key, lambda: key.upper())
+        self.assertEqual(2, len(cache))
+        self.assertEqual("A", cache.get_or_compute("a", lambda: None))
+        self.assertIsNone(cache.get_or_compute("b", lambda: None))
+        self.assertDictEqual({"hits": 2, "misses": 4, "size": 2, "maxsize": 2}, cache.get_stats())
+
+
+    def _check_distance_table(self, distance_table):
+        for start_port in sorted(self.rm.all_port_names):
+            for end_port in sorted(self.rm.all_port_names):
+                shortest_time, routes = self.rm.get_shortest_routes(start_port, end_port)
+                self.assertEqual(shortest_time, distance_table.get_shortest_journey(start_port, end_port))
+                route = distance_table.get_shortest_route(start_port, end_port)
+                self.assertEqual(shortest_time is None, route is None)
+                if route is not None:
+                    self.assertIn(route, routes)
+
+    def test_distance_table_dijkstra(self):
+        self._check_distance_table(DistanceTable.from_graph(self.rm.graph, "dijkstra"))
+
+    @unittest.skipIf(import_numpy() is None, "NumPy is not installed")
+    def test_distance_table_floyd_warshall(self):
+        self._check_distance_table(DistanceTable.from_graph(self.rm.graph, "floyd-warshall"))
+
+    def test_distance_table_save_and_load(self):
+        distance_table = self.rm.compute_distance_table("dijkstra")
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, "routes.yml.distances")
+            distance_table.save(filename)
+            self.rm.distance_table = None
+            self.rm.set_distance_table(DistanceTable.load(filename))
+        self.assertEqual(18, self.rm.get_shortest_journey("New York", "New York"))
+        self._check_distance_table(self.rm.distance_table)
+
+    def test_distance_table_truncated(self):
+        distance_table = self.rm.compute_distance_table("dijkstra")
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, "routes.yml.distances")
+            distance_table.save(filename)
+            size = os.path.getsize(filename)
+            with open(filename, "r+b") as han:
+                han.truncate(size - 16)
+            with self.assertRaises(STALE_FILE_ERRORS):
+                DistanceTable.load(filename)
+            # Saving replaces the damaged file in one step without leaving a temporary file behind
+            distance_table.save(filename)
+            self.assertEqual(size, os.path.getsize(filename))
+            self.assertListEqual(["routes.yml.distances"], os.listdir(path))
+        self._check_distance_table(distance_table)
+
+    def test_distance_table_discarded_on_change(self):
+        self.rm.compute_distance_table("dijkstra")
+        self.rm.update_journey_time("Buenos Aires", "Casablanca", 9)
+        self.assertIsNone(self.rm.distance_table)
+        self.assertEqual(10, self.rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+
+
+    def test_read_routes_formats(self):
+        path, _ = os.path.split(__file__)
+        routes = read_routes(os.path.join(path, "../test_files/routes.yml"))
+        self.assertEqual(9, len(routes))
+        self.assertListEqual(routes, read_routes(os.path.join(path, "../test_files/routes.csv")))
+        self.assertListEqual(routes, read_routes(os.path.join(path, "../test_files/routes.jsonl")))
+
+    def test_load_routes_snapshot(self):
+        path, _ = os.path.split(__file__)
+        with tempfile.TemporaryDirectory() as tmp_path:
+            filename = os.path.join(tmp_path, "routes.yml")
+            with open(os.path.join(path, "../test_files/routes.yml")) as src, open(filename, "w") as dst:
+                dst.write(src.read())
+            rm = RouteManager()
+            rm.load_routes(filename, use_snapshot=True)
+            graph = load_snapshot(get_snapshot_filename(filename))
+            self.assertListEqual(rm.graph.port_names, graph.port_names)
+            self.assertListEqual(list(rm.graph.offsets), list(graph.offsets))
+            self.assertListEqual(list(rm.graph.targets), list(graph.targets))
+            self.assertListEqual(list(rm.graph.times), list(graph.times))
+
+            rm = RouteManager()
+            rm.load_routes(filename, use_snapshot=True)
+            self.assertListEqual(self.rm.get_all_routes("Liverpool", "Liverpool"),
+                                 rm.get_all_routes("Liverpool", "Liverpool"))
+            self.assertEqual(8, rm.get_direct_route_time(["Buenos Aires", "Casablanca", "Liverpool"]))
+
+            # A snapshot of an older version of the file is ignored
+            with open(filename, "a") as dst:
+                dst.write("\n- start: Liverpool\n  end: Buenos Aires\n  journey_time: 7\n")
+            self.assertIsNone(load_snapshot(get_snapshot_filename(filename), {"size": 0, "mtime_ns": 0}))
+            rm = RouteManager()
+            rm.load_routes(filename, use_snapshot=True)
+            self.assertEqual(7, rm.get_shortest_journey("Liverpool", "Buenos Aires"))
+
+    def test_load_routes_truncated_snapshot(self):
+        path, _ = os.path.split(__file__)
+        with tempfile.TemporaryDirectory() as tmp_path:
+            filename = os.path.join(tmp_path, "routes.yml")
+            with open(os.path.join(path, "../test_files/routes.yml")) as src, open(filename, "w") as dst:
+                dst.write(src.read())
+            RouteManager().load_routes(filename, use_snapshot=True)
+            snapshot_filename = get_snapshot_filename(filename)
+            size = os.path.getsize(snapshot_filename)
+            # A snapshot cut short part way through the arrays is rebuilt from the route file
+            with open(snapshot_filename, "r+b") as han:
+                han.truncate(size - 16)
+            rm = RouteManager()
+            rm.load_routes(filename, use_snapshot=True)
+            self.assertEqual(8, rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+            self.assertEqual(size, os.path.getsize(snapshot_filename))
+            self.assertIsNotNone(load_snapshot(snapshot_filename))
+            self.assertListEqual(["routes.yml", "routes.yml.snapshot"], sorted(os.listdir(tmp_path)))
+
+    def test_k_shortest_routes(self):
+        self.assertListEqual([(["Liverpool", "Casablanca", "Liverpool"], 6),
+                              (["Liverpool", "Cape Town", "New York", "Liverpool"], 18)],
+                             self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 2))
+        self.assertListEqual([8, 10, 16],
+                             [f[1] for f in self.rm.get_k_shortest_routes("Buenos Aires", "Liverpool", 3)])
+        # Asking for more routes than there are returns every route, quickest first
+        all_routes = self.rm.get_k_shortest_routes("Buenos Aires", "Liverpool", 100)
+        self.assertListEqual(sorted(self.rm.get_all_routes("Buenos Aires", "Liverpool")),
+                             sorted(f[0] for f in all_routes))
+        self.assertListEqual(sorted(f[1] for f in all_routes), [f[1] for f in all_routes])
+        with self.assertRaises(InvalidPortName):
+            self.rm.get_k_shortest_routes("foobar", "Liverpool", 2)
+
+    def test_k_shortest_routes_max_expansions(self):
+        limits = SearchLimits()
+        all_routes = self.rm.get_k_shortest_routes("Buenos Aires", "Liverpool", 3, limits)
+        self.assertFalse(limits.truncated)
+        # The ports expanded by the spur searches count towards the limit
+        limits = SearchLimits(max_expansions=limits.expansions - 1)
+        routes = self.rm.get_k_shortest_routes("Buenos Aires", "Liverpool", 3, limits)
+        self.assertLess(len(routes), len(all_routes))
+        self.assertListEqual(all_routes[:len(routes)], routes)
+        self.assertTrue(limits.truncated)
+        self.assertEqual("max_expansions", limits.reason)
+
+    def test_pareto_routes(self):
+        self.assertListEqual([(["Liverpool", "Casablanca", "Liverpool"], 6)],
+                             self.rm.get_pareto_routes("Liverpool", "Liverpool"))
+        self.assertListEqual([], self.rm.get_pareto_routes("Liverpool", "Liverpool", max_stops=2))
+        rm = RouteManager()
+        rm.set_routes([
+            {"start": "Buenos Aires", "end": "Liverpool", "journey_time": 20},
+            {"start": "Buenos Aires", "end": "Casablanca", "journey_time": 5},
+            {"start": "Casablanca", "end": "Liverpool", "journey_time": 12},
+            {"start": "Casablanca", "end": "New York", "journey_time": 2},
+            {"start": "New York", "end": "Liverpool", "journey_time": 4},
+            {"start": "Buenos Aires", "end": "New York", "journey_time": 14},
+        ])
+        self.assertListEqual([(["Buenos Aires", "Liverpool"], 20),
+                              (["Buenos Aires", "Casablanca", "Liverpool"], 17),
+                              (["Buenos Aires", "Casablanca", "New York", "Liverpool"], 11)],
+                             rm.get_pareto_routes("Buenos Aires", "Liverpool"))
+        self.assertListEqual([(["Buenos Aires", "Liverpool"], 20), (["Buenos Aires", "Casablanca", "Liverpool"], 17)],
+                             rm.get_pareto_routes("Buenos Aires", "Liverpool", max_stops=3))
+        # Every route found is quicker than every route with no more stops
+        for route, journey_time in rm.get_pareto_routes("Buenos Aires", "Liverpool"):
+            self.assertFalse(any(len(f) <= len(route) and time <= journey_time and f != route
+                                 for f, time in rm.iter_routes("Buenos Aires", "Liverpool", with_times=True)))
+        self.assertListEqual([], self.rm.get_pareto_routes("Cape Town", "Buenos Aires"))
+        limits = SearchLimits(max_expansions=1)
+        self.assertListEqual([(["Buenos Aires", "Liverpool"], 20)],
+                             rm.get_pareto_routes("Buenos Aires", "Liverpool", limits=limits))
+        self.assertTrue(limits.truncated)
+        limits = SearchLimits(max_results=2)
+        self.assertListEqual([(["Buenos Aires", "Liverpool"], 20), (["Buenos Aires", "Casablanca", "Liverpool"], 17)],
+                             rm.get_pareto_routes("Buenos Aires", "Liverpool", limits=limits))
+        self.assertTrue(limits.truncated)
+        self.assertEqual("max_results", limits.reason)
+        with self.assertRaises(InvalidPortName):
+            self.rm.get_pareto_routes("foobar", "Liverpool")
+
+    def test_route_criteria(self):
+        criteria = RouteCriteria.parse("stops>=3 and time<20, stops<5")
+        self.assertListEqual([("stops", ">=", 3), ("time", "<", 20), ("stops", "<", 5)], criteria.comparisons)
+        self.assertEqual(criteria, RouteCriteria.parse(str(criteria)))
+        self.assertEqual((4, 20), criteria.get_bounds())
+        self.assertTrue(criteria.matches(4, 19))
+        self.assertFalse(criteria.matches(2, 19))
+        self.assertFalse(criteria.matches(4, 20))
+        self.assertEqual(RouteCriteria.from_string("stops", "==3") & RouteCriteria.from_string("time", "<=10"),
+                         RouteCriteria.parse("stops==3 and time<=10"))
+        for criteria_str in ("stops<=", "stops<=3 or 1", "__import__('os')", "speed<3"):
+            with self.assertRaises(ValueError):
+                RouteCriteria.parse(criteria_str)
+        self.assertTrue(RouteCriteria.from_string("stops", "<=5").matches(5, None))
+        self.assertFalse(RouteCriteria.from_string("stops", " > 5 ").matches(5, None))
+        with self.assertRaises(ValueError):
+            RouteCriteria.from_string("stops", "==1 or __import__('os')")
+
+    def test_routes_with_criteria(self):
+        criteria = RouteCriteria.parse("stops<=4 and time>10")
+        expected = [(route, journey_time) for route, journey_time in
+                    self.rm.iter_routes("Buenos Aires", "Liverpool", with_times=True)
+                    if len(route) <= 4 and journey_time > 10]
+        self.assertListEqual(expected, list(self.rm.iter_routes_with_criteria("Buenos Aires", "Liverpool", criteria,
+                                                                              with_times=True)))
+        self.assertListEqual(expected, self.rm.get_routes_with_criteria("Buenos Aires", "Liverpool", criteria))
+        self.assertListEqual([["Liverpool", "Casablanca", "Liverpool"]],
+                             list(self.rm.iter_routes_with_criteria("Liverpool", "Liverpool",
+                                                                    RouteCriteria.parse("stops==3"))))
+
+    @unittest.skipIf(import_numpy() is None, "NumPy is not installed")
+    def test_route_criteria_filter_routes_numpy(self):
+        criteria = RouteCriteria.parse("stops!=4 and time<=30")
+        routes = list(self.rm.iter_routes("Liverpool", "Liverpool", with_times=True)) * 100
+        expected = [f for f in routes if criteria.matches(len(f[0]), f[1])]
+        self.assertGreaterEqual(len(routes), route_criteria.NUMPY_MIN_ROUTES)
+        self.assertListEqual(expected, criteria.filter_routes(routes))
+
+    def test_route_stats(self):
+        self.assertIsNone(self.rm.get_stats())
+        path, _ = os.path.split(__file__)
+        stats = RouteStats()
+        rm = RouteManager(stats=stats)
+        rm.load_routes(os.path.join(path, "../test_files/routes.yml"))
+        self.assertEqual(8, rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.assertEqual(8, rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+        self.assertEqual(3, len(list(rm.iter_routes("Liverpool", "Liverpool"))))
+        self.assertEqual(0, len(list(rm.iter_routes("Liverpool", "Liverpool", max_time=5))))
+
+        result = rm.get_stats()
+        for name in ("read_routes", "build_graph", "build_indexes", "query.shortest_route"):
+            self.assertIn(name, result["timers"])
+        self.assertEqual(2, result["timers"]["query.shortest_route"]["calls"])
+        self.assertEqual({"hits": 1, "misses": 1}, {f: result["cache"][f] for f in ("hits", "misses")})
+        self.assertEqual(3, result["counters"]["routes_yielded"])
+        self.assertGreater(result["counters"]["nodes_expanded"], 0)
+        self.assertGreater(result["counters"]["branches_pruned"], 0)
+
+        # Stats can also be turned on after the routes have been loaded
+        self.assertIs(self.rm.graph.stats, None)
+        stats = RouteStats()
+        self.rm.enable_stats(stats)
+        self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 2)
+        self.assertGreater(stats.counters["nodes_expanded"], 0)
+        stats.reset()
+        self.assertDictEqual({}, stats.counters)
+
+    def test_search_limits(self):
+        all_routes = self.rm.get_all_routes("Liverpool", "Liverpool")
+        limits = SearchLimits(max_results=2)
+        self.assertListEqual(all_routes[:2], self.rm.get_all_routes("Liverpool", "Liverpool", limits=limits))
+        self.assertTrue(limits.truncated)
+        self.assertEqual("max_results", limits.reason)
+        # A limit that is not reached does not truncate the results
+        limits = SearchLimits(timeout=60, max_results=len(all_routes))
+        self.assertListEqual(all_routes, self.rm.get_all_routes("Liverpool", "Liverpool", limits=limits))
+        self.assertFalse(limits.truncated)
+        self.assertIsNone(limits.reason)
+
+        limits = SearchLimits(max_expansions=1)
+        self.assertLess(len(list(self.rm.iter_routes("Liverpool", "Liverpool", limits=limits))), len(all_routes))
+        self.assertEqual("max_expansions", limits.reason)
+
+        limits = SearchLimits(timeout=0)
+        self.assertListEqual([], self.rm.get_all_routes("Liverpool", "Liverpool", limits=limits))
+        self.assertEqual("timeout", limits.reason)
+
+        # A search can be cancelled part way through
+        limits = SearchLimits()
+        routes = self.rm.iter_routes("Liverpool", "Liverpool", limits=limits)
+        self.assertListEqual(all_routes[0], next(routes))
+        limits.cancel()
+        self.assertListEqual([], list(routes))
+        self.assertTrue(limits.cancelled)
+        self.assertEqual("cancelled", limits.reason)
+
+    def test_search_limits_filtered_queries(self):
+        criteria = RouteCriteria.parse("time<=30")
+        limits = SearchLimits(max_results=1)
+        self.assertListEqual([(["Buenos Aires", "New York", "Liverpool"], 10)],
+                             self.rm.get_routes_with_criteria("Buenos Aires", "Liverpool", criteria, limits))
+        self.assertTrue(limits.truncated)
+        self.assertEqual(1, self.rm.get_number_of_routes("Liverpool", "Liverpool", lambda x: x <= 4,
+                                                         SearchLimits(max_results=1)))
+        self.assertDictEqual({3: 1}, self.rm.count_routes_by_stops("Liverpool", "Liverpool", 5,
+                                                                   limits=SearchLimits(max_results=1)))
+        limits = SearchLimits(max_results=1)
+        self.assertListEqual([(["Liverpool", "Casablanca", "Liverpool"], 6)],
+                             self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 3, limits))
+        self.assertTrue(limits.truncated)
+        self.assertEqual("max_results", limits.reason)
+        limits = SearchLimits(timeout=0)
+        self.assertListEqual([], self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 3, limits))
+        self.assertEqual("timeout", limits.reason)
+        # Truncated results are not cached
+        self.assertEqual(4, len(self.rm.get_routes_with_criteria("Buenos Aires", "Liverpool", criteria)))
+        self.assertEqual(2, self.rm.get_number_of_routes("Liverpool", "Liverpool", lambda x: x <= 4))
+        self.assertEqual(3, len(self.rm.get_k_shortest_routes("Liverpool", "Liverpool", 3)))
+
+    def test_shortest_route_methods(self):
+        for start_port in self.rm.all_port_names:
+            for end_port in self.rm.all_port_names:
+                shortest_time, routes = self.rm.get_shortest_routes(start_port, end_port)
+                for method in ("dijkstra", "bidirectional", "alt"):
+                    journey_time, route = self.rm.get_shortest_route(start_port, end_port, method)
+                    self.assertEqual(shortest_time, journey_time)
+                    if shortest_time is None:
+                        self.assertIsNone(route)
+                    else:
+                        self.assertIn(route, routes)
+        self.assertEqual((6, ["Liverpool", "Casablanca", "Liverpool"]),
+                         self.rm.get_shortest_route("Liverpool", "Liverpool", "bidirectional"))
+        with self.assertRaises(ValueError):
+            self.rm.get_shortest_route("Buenos Aires", "Liverpool", "foobar")
+        with self.assertRaises(InvalidPortName):
+            self.rm.get_shortest_route("foobar", "Liverpool", "alt")
+
+        # The landmarks and reverse routes are rebuilt when the routes change
+        self.assertIsNotNone(self.rm.landmarks)
+        self.rm.add_route("Liverpool", "Buenos Aires", 1)
+        self.assertIsNone(self.rm.landmarks)
+        for method in ("bidirectional", "alt"):
+            self.assertEqual((7, ["Liverpool", "Buenos Aires", "New York"]),
+                             self.rm.get_shortest_route("Liverpool", "New York", method))
+
+    def test_shortest_route_methods_explore_fewer_ports(self):
+        rng = random.Random(0)
+        port_count = 2000
+        routes = [{"start": "Port %s" % start, "end": "Port %s" % rng.randrange(port_count),
+                   "journey_time": rng.randint(1, 10)} for start in range(port_count) for _ in range(3)]
+        graph = RouteGraph(routes)
+        landmarks = Landmarks.from_graph(graph, 4)
+        self.assertEqual(4, len(set(landmarks.landmark_ids)))
+        pairs = [(rng.randrange(port_count), rng.randrange(port_count)) for _ in range(20)]
+        shortest_times = [graph.get_shortest_routes(start, end)[0] for start, end in pairs]
+        expanded = {}
+        for name, fn_search in (("dijkstra", graph.get_shortest_routes),
+                                ("bidirectional", graph.get_shortest_route_bidirectional),
+                                ("alt", lambda start, end: graph.get_shortest_route_astar(start, end, landmarks))):
+            graph.stats = RouteStats()
+            expanded[name] = graph.stats
+            self.assertListEqual(shortest_times, [fn_search(start, end)[0] for start, end in pairs])
+        self.assertLess(expanded["bidirectional"].counters["nodes_expanded"] * 4,
+                        expanded["dijkstra"].counters["nodes_expanded"])
+        self.assertLess(expanded["alt"].counters["nodes_expanded"] * 2,
+                        expanded["dijkstra"].counters["nodes_expanded"])
+
+    def test_reverse_arrays(self):
+        graph = self.rm.graph
+        offsets, sources, times = graph.get_reverse_arrays()
+        liverpool = graph.get_port_id("Liverpool")
+        self.assertListEqual(sorted([("New York", 4), ("Casablanca", 3)]),
+                             sorted((graph.port_names[sources[i]], times[i])
+                                    for i in range(offsets[liverpool], offsets[liverpool + 1])))
+        self.assertIs(offsets, graph.get_reverse_arrays()[0])
+        self.assertListEqual([0, 4, 8], [graph.get_distances_from(graph.get_port_id("Buenos Aires"))[f] for f in (
+            graph.get_port_id("Buenos Aires"), graph.get_port_id("Cape Town"), graph.get_port_id("Liverpool"))])
+        self.assertEqual(8, graph.get_distances_from(liverpool, reverse=True)[graph.get_port_id("Buenos Aires")])
+        self.assertIsNone(graph.get_distances_from(liverpool)[graph.get_port_id("Buenos Aires")])
+
+    def test_reachability(self):
+        for start_port in self.rm.all_port_names:
+            for end_port in self.rm.all_port_names:
+                self.assertEqual(self.rm.get_shortest_journey(start_port, end_port) is not None,
+                                 self.rm.is_reachable(start_port, end_port))
+        self.assertFalse(self.rm.is_reachable("Buenos Aires", "Buenos Aires"))
+        self.assertTrue(self.rm.is_reachable("Liverpool", "Liverpool"))
+        with self.assertRaises(UnreachablePortError) as cm:
+            self.rm.check_reachable("Liverpool", "Buenos Aires")
+        self.assertSetEqual({("Liverpool", "Buenos Aires")}, cm.exception.args[1])
+        self.assertIsInstance(cm.exception, InvalidRouteError)
+        with self.assertRaises(InvalidPortName):
+            self.rm.is_reachable("foobar", "Liverpool")
+
+        # Searches between ports that cannot reach each other give up without expanding any ports
+        stats = self.rm.enable_stats()
+        self.assertListEqual([], self.rm.get_all_routes("Liverpool", "Buenos Aires"))
+        self.assertEqual((None, []), self.rm.get_shortest_routes("New York", "Buenos Aires"))
+        self.assertListEqual([], self.rm.get_k_shortest_routes("Cape Town", "Buenos Aires", 3))
+        self.assertEqual(3, stats.counters["searches_rejected"])
+        self.assertNotIn("nodes_expanded", stats.counters)
+
+        self.rm.add_route("Liverpool", "Buenos Aires", 1)
+        self.assertTrue(self.rm.is_reachable("New York", "Buenos Aires"))
+        self.assertEqual(5, self.rm.get_shortest_journey("New York", "Buenos Aires"))
+        self.rm.remove_route("Liverpool", "Buenos Aires")
+        self.assertFalse(self.rm.is_reachable("New York", "Buenos Aires"))
+
+    def test_reachability_index(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            port_count = rng.randint(1, 30)
+            graph = RouteGraph([{"start": rng.randrange(port_count), "end": rng.randrange(port_count),
+                                 "journey_time": 1} for _ in range(rng.randrange(port_count * 2) + 1)])
+            # Without the bitsets the condensed graph of components is searched instead
+            for reachability in (graph.get_reachability(), ReachabilityIndex(graph, max_indexed_components=0)):
+                reach_tests = [reachability.get_reach_test(port) for port in range(graph.port_count)]
+                backward_reach_tests = [reachability.get_reach_test(port, True) for port in range(graph.port_count)]
+                for start in range(graph.port_count):
+                    times, _ = graph.get_shortest_times_from(start)
+                    for end in range(graph.port_count):
+                        self.assertEqual(times[end] is not None, reachability.can_reach(start, end))
+                        self.assertEqual(times[end] is not None, reach_tests[end](start))
+                        self.assertEqual(times[end] is not None, backward_reach_tests[start](end))
+
+    def test_reachability_index_built_on_first_use(self):
+        rm = RouteManager(stats=RouteStats())
+        rm.set_routes(self.rm.routes)
+        self.assertNotIn("build_reachability", rm.stats.timers)
+        self.assertTrue(rm.is_reachable("Buenos Aires", "Liverpool"))
+        self.assertEqual(1, rm.stats.timers["build_reachability"][0])
+
+    def test_iter_routes_prunes_ports_that_cannot_reach_the_end(self):
+        routes = [{"start": "a", "end": "b", "journey_time": 1}, {"start": "b", "end": "c", "journey_time": 1},
+                  {"start": "a", "end": "d", "journey_time": 1}, {"start": "d", "end": "e", "journey_time": 1},
+                  {"start": "e", "end": "d", "journey_time": 1}]
+        rm = RouteManager(stats=RouteStats())
+        rm.set_routes(routes)
+        self.assertListEqual([["a", "b", "c"]], rm.get_all_routes("a", "c"))
+        # Only a and b are expanded since d and e cannot reach c
+        self.assertEqual(2, rm.stats.counters["nodes_expanded"])
+        self.assertEqual(1, rm.stats.counters["branches_pruned"])
+
+    def test_shortest_route_searches_skip_ports_that_cannot_reach_the_end(self):
+        # d and e are nearer to a than c is, but cannot reach c
+        routes = [{"start": "a", "end": "b", "journey_time": 1}, {"start": "b", "end": "c", "journey_time": 1},
+                  {"start": "a", "end": "d", "journey_time": 0.5}, {"start": "d", "end": "e", "journey_time": 0.5},
+                  {"start": "e", "end": "d", "journey_time": 0.5}]
+        graph = RouteGraph(routes)
+        a, c = graph.get_port_id("a"), graph.get_port_id("c")
+        for fn_search in (lambda: graph.get_shortest_routes(a, c), lambda: graph.get_earliest_arrival(a, c, 0),
+                          lambda: graph.get_k_shortest_routes(a, c, 1)):
+            graph.stats = RouteStats()
+            fn_search()
+            # Only a and b are expanded
+            self.assertEqual(2, graph.stats.counters["nodes_expanded"])
+        graph.stats = RouteStats()
+        self.assertEqual((2, [a, graph.get_port_id("b"), c]), graph.get_shortest_route_bidirectional(a, c))
+        self.assertLessEqual(graph.stats.counters["nodes_expanded"], 3)
+
+    def test_earliest_arrival_without_departures(self):
+        # Without any departure days the earliest arrival is the shortest journey time after the departure day
+        for start_port in self.rm.all_port_names:
+            for end_port in self.rm.all_port_names:
+                shortest_time = self.rm.get_shortest_journey(start_port, end_port)
+                arrival_day, legs = self.rm.get_earliest_arrival(start_port, end_port, 5)
+                self.assertEqual(None if shortest_time is None else shortest_time + 5, arrival_day)
+        self.assertEqual((13, [("Buenos Aires", "Casablanca", 5, 10), ("Casablanca", "Liverpool", 10, 13)]),
+                         self.rm.get_earliest_arrival("Buenos Aires", "Liverpool", 5))
+        with self.assertRaises(InvalidPortName):
+            self.rm.get_earliest_arrival("foobar", "Liverpool", 0)
+
+    def test_earliest_arrival_with_departures(self):
+        path, _ = os.path.split(__file__)
+        rm = RouteManager()
+        rm.load_routes(os.path.join(path, "../test_files/schedules.yml"))
+        self.assertEqual((12, [("Buenos Aires", "New York", 0, 6), ("New York", "Liverpool", 8, 12)]),
+                         rm.get_earliest_arrival("Buenos Aires", "Liverpool", 0))
+        self.assertEqual((13, [("Buenos Aires", "Casablanca", 3, 8), ("Casablanca", "Liverpool", 10, 13)]),
+                         rm.get_earliest_arrival("Buenos Aires", "Liverpool", 1))
+        self.assertEqual(23, rm.get_earliest_arrival("Buenos Aires", "Liverpool", 4)[0])
+        self.assertEqual((13, [("Liverpool", "Casablanca", 0, 3), ("Casablanca", "Liverpool", 10, 13)]),
+                         rm.get_earliest_arrival("Liverpool", "Liverpool", 0))
+        # There are no sailings to Liverpool after day 30
+        self.assertEqual((None, []), rm.get_earliest_arrival("Buenos Aires", "Liverpool", 31))
+        # The static journey times ignore the departure days
+        self.assertEqual(8, rm.get_shortest_journey("Buenos Aires", "Liverpool"))
+
+        rm.add_route("Liverpool", "Buenos Aires", 7, [40])
+        self.assertEqual((47, [("Liverpool", "Buenos Aires", 40, 47)]),
+                         rm.get_earliest_arrival("Liverpool", "Buenos Aires", 31))
+        rm.remove_route("Liverpool", "Buenos Aires")
+        self.assertEqual((None, []), rm.get_earliest_arrival("Liverpool", "Buenos Aires", 31))
+        with self.assertRaises(ValueError):
+            rm.add_route("Liverpool", "Buenos Aires", 7, {"first": 0, "every": 0, "last": 10})
+        self.assertNotIn(("Liverpool", "Buenos Aires"), rm.route_times)
+
+    def test_departures_formats(self):
+        path, _ = os.path.split(__file__)
+        routes = read_routes(os.path.join(path, "../test_files/schedules.yml"))
+        graph = RouteGraph(routes)
+        self.assertListEqual([3, 10, 17], graph.departures[1][:3].tolist())
+        self.assertEqual(52, len(graph.departures[1]))
+        self.assertIsNone(graph.departures[2])
+        self.assertIsNone(RouteGraph(read_routes(os.path.join(path, "../test_files/routes.yml"))).departures)
+        for route in ({"start": "a", "end": "b", "journey_time": 1, "departures": "daily"},
+                      {"start": "a", "end": "b", "journey_time": 1, "departures": {"first": 0, "every": 7}}):
+            with self.assertRaises(ValueError):
+                RouteGraph([route])
+
+        expanded = list(graph.get_routes())
+        with tempfile.TemporaryDirectory() as tmp_path:
+            filename = os.path.join(tmp_path, "schedules.csv")
+            with open(filename, "w") as han:
+                han.write("start,end,journey_time,departures\n")
+                for route in expanded:
+                    han.write("%s,%s,%s,%s\n" % (route["start"], route["end"], route["journey_time"],
+                                                  " ".join(str(f) for f in route.get("departures", []))))
+            self.assertListEqual(expanded, read_routes(filename))
+
+            rm = RouteManager()
+            rm.set_routes(routes)
+            filename = os.path.join(tmp_path, "graph.snapshot")
+            save_snapshot(rm.graph, filename)
+            snapshot_graph = load_snapshot(filename)
+            self.assertListEqual(expanded, list(snapshot_graph.get_routes()))
+            self.assertEqual(rm.graph.get_earliest_arrival(0, 4, 1), snapshot_graph.get_earliest_arrival(0, 4, 1))
+
+
 if __name__ == '__main__':
     unittest.main()